@@ -52,16 +52,22 @@ def trainAgent(env):
         TIMESTEPS = 10000
         model.learn(total_timesteps=TIMESTEPS, tb_log_name="dqn_rosbot")
 
+        # Estadísticas de duración de los steps, al log de stdout y a TensorBoard
+        for key, value in wrapped_env.step_stats.items():
+            new_logger.record(f"env/step_{key}", value)
+        new_logger.dump(TIMESTEPS)
+
         # Guardar el modelo entrenado
         model.save("./train_result/3-rosbot_model.zip")
 
     except Exception as e:
         print(f"Error al crear el modelo: {e}")
-        env.close()
+        wrapped_env.close()
         sys.exit(0)
     
     finally:
-        env.close()
+        # El wrapper cierra el entorno desde su hilo de trabajo
+        wrapped_env.close()
         sys.exit(0)
     
 def testAgent(env, model_path):
@@ -1,51 +1,150 @@
 import gym
+import time
 import threading
-import traceback # Importar traceback
 
 class TimeoutWrapper(gym.Wrapper):
+    """
+    Ejecuta cada step con un límite de tiempo. reset no tiene límite (recargar un mundo de
+    Webots puede tardar bastante más que un step), igual que antes de usar un hilo de trabajo.
+
+    Todas las llamadas al entorno (step y reset) las hace un único hilo de trabajo que vive lo
+    mismo que el wrapper y se despierta con eventos reutilizables: no se crea un hilo por step,
+    y la API de Webots, que no es thread-safe, nunca se usa desde dos hilos a la vez. Además
+    lleva estadísticas de la duración de los steps (ver step_stats), que el controlador
+    registra en su log y en el estado del job.
+    """
     def __init__(self, env, timeout_seconds=10):
         #, path_register=None
         super().__init__(env)
         self.__timeout_seconds = timeout_seconds
         #self.__path_register = path_register
-        
+        self.__request = threading.Event()
+        self.__done = threading.Event()
+        self.__function = None
+        self.__args = ()
+        self.__kwargs = {}
+        self.__result = None
+        self.__error = None
+        self.__closed = False
+        self.__steps = 0
+        self.__timeouts = 0
+        self.__total_time = 0.0
+        self.__max_time = 0.0
+        self.__last_time = 0.0
+        self.__worker = threading.Thread(target=self._work, name="env-worker", daemon=True)
+        self.__worker.start()
+
     def step(self, action):
         """
-        Ejecuta step con timeout usando threading (compatible con Windows y Unix)
+        Ejecuta step en el hilo de trabajo y espera como máximo timeout_seconds
         """
-        result = [None]  # Lista para poder modificar desde el hilo
-        exception = [None]
-        
-        def real_step():
-            try:
-                result[0] = self.env.step(action)
-            except Exception as e:
-                exception[0] = e
-        
-        # Crear y iniciar hilo
-        thread = threading.Thread(target=real_step)
-        thread.daemon = True
-        thread.start()
-        
-        # Esperar con timeout
-        thread.join(timeout=self.__timeout_seconds)
-        
-        if thread.is_alive():
+        start = time.perf_counter()
+        self._submit(self.env.step, (action,), {})
+
+        if not self.__done.wait(self.__timeout_seconds):
             # Timeout ocurrió
+            self.__timeouts += 1
             print(f"[WARNING] Timeout en step ({self.__timeout_seconds}s) - terminando episodio")
-            
+
+            # El step sigue en curso: se espera (sin límite, como reset) a que termine antes de
+            # reiniciar el entorno, para no usarlo desde dos hilos. Su resultado se descarta.
+            self.__done.wait()
             try:
-                obs = self.env.reset()
+                self._take_result()
+            except Exception as e:
+                print(f"[WARNING] El step que excedió el tiempo falló: {e}")
+            self._record_step(time.perf_counter() - start)
+
+            try:
+                obs = self._call(self.env.reset)
                 return obs, -10.0, False, {"timeout": True, "timeout_seconds": self.__timeout_seconds}
             except Exception as e:
                 print(f"[ERROR] Falló en reset: {e}")
                 raise
-        
-        # Si hay excepción en el hilo, relanzarla
-        if exception[0] is not None:
-            exc_type, exc_value, exc_traceback = exception[0]
-            raise exc_type.with_traceback(exc_traceback)
-            
-        return result[0]
-        
 
+        self._record_step(time.perf_counter() - start)
+        # Si hubo excepción en el hilo de trabajo, se relanza con su traceback original
+        return self._take_result()
+
+    def reset(self, **kwargs):
+        return self._call(self.env.reset, **kwargs)
+
+    def close(self):
+        """
+        Cierra el entorno desde el hilo de trabajo. Si ese hilo sigue trabado en una llamada
+        anterior no se cierra (lo usaría desde dos hilos), y si el cierre no termina en
+        timeout_seconds no se lo espera: el proceso de Webots lo termina el controlador.
+        """
+        if self.__closed:
+            return None
+        result = None
+        try:
+            if self._is_busy():
+                print("[WARNING] El entorno sigue ocupado en otra llamada, no se cierra")
+            else:
+                self._submit(self.env.close, (), {})
+                if self.__done.wait(self.__timeout_seconds):
+                    result = self._take_result()
+                else:
+                    print(f"[WARNING] El entorno no se cerró en {self.__timeout_seconds}s")
+        finally:
+            self.__closed = True
+            self.__request.set()
+        return result
+
+    def _is_busy(self):
+        """True si el hilo de trabajo todavía no terminó la última llamada pedida"""
+        return self.__function is not None and not self.__done.is_set()
+
+    @property
+    def step_stats(self):
+        """Cantidad de steps y timeouts, y duración media, máxima y última de los steps (ms)"""
+        mean = self.__total_time / self.__steps if self.__steps else 0.0
+        return {
+            "steps": self.__steps,
+            "timeouts": self.__timeouts,
+            "mean_ms": round(mean * 1000, 3),
+            "max_ms": round(self.__max_time * 1000, 3),
+            "last_ms": round(self.__last_time * 1000, 3),
+        }
+
+    def _work(self):
+        """Bucle del hilo de trabajo: ejecuta la llamada pedida y avisa al terminar"""
+        while True:
+            self.__request.wait()
+            self.__request.clear()
+            if self.__closed:
+                return
+            try:
+                self.__result = self.__function(*self.__args, **self.__kwargs)
+            except Exception as e:
+                self.__error = e
+            self.__done.set()
+
+    def _submit(self, function, args, kwargs):
+        self.__done.clear()
+        self.__function = function
+        self.__args = args
+        self.__kwargs = kwargs
+        self.__request.set()
+
+    def _call(self, function, *args, **kwargs):
+        """Ejecuta una llamada al entorno en el hilo de trabajo, sin límite de tiempo, y devuelve su resultado"""
+        self._submit(function, args, kwargs)
+        self.__done.wait()
+        return self._take_result()
+
+    def _take_result(self):
+        result, error = self.__result, self.__error
+        self.__result = None
+        self.__error = None
+        if error is not None:
+            raise error
+        return result
+
+    def _record_step(self, elapsed):
+        self.__steps += 1
+        self.__total_time += elapsed
+        self.__last_time = elapsed
+        if elapsed > self.__max_time:
+            self.__max_time = elapsed
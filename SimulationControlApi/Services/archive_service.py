@@ -0,0 +1,187 @@
+import os
+import hashlib
+import zipfile
+import logging
+import threading
+from pathlib import Path
+from typing import Iterator, List, Tuple
+from Services.core.config import Config
+
+logger = logging.getLogger(__name__)
+
+TENSORBOARD_PREFIX = "events.out.tfevents"
+# Bloque copiado por vez al generar un ZIP en streaming
+BUNDLE_CHUNK_SIZE = 1024 * 1024
+# Locks compartidos entre jobs: cada job usa el de hash(job_id) % ARCHIVE_LOCK_STRIPES
+ARCHIVE_LOCK_STRIPES = 64
+
+class _StreamBuffer:
+    """Destino no seekable de ZipFile: acumula lo escrito hasta que el generador lo entrega."""
+
+    def __init__(self):
+        self.__chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self.__chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self.__chunks)
+        self.__chunks = []
+        return data
+
+
+class ArchiveService:
+    """
+    Arma y cachea el ZIP de TensorBoard de cada job, y genera en streaming el paquete
+    completo de artefactos para descarga.
+
+    El ZIP queda en Storage/Jobs/<job_id>/tensorboard_<job_id>.zip junto a un archivo .etag
+    con la clave de los archivos de eventos (nombre, mtime y tamaño). Mientras esa clave no
+    cambie, las descargas reutilizan el mismo ZIP. Los eventos son protobuf ya compactos,
+    así que se guardan sin comprimir (ZIP_STORED).
+    """
+
+    __locks: List[threading.Lock] = [threading.Lock() for _ in range(ARCHIVE_LOCK_STRIPES)]
+
+    def __init__(self):
+        self.__config = Config()
+        self.__jobs_storage_path = Path(self.__config.get_storage_path())
+
+    def get_tensorboard_archive(self, job_id: str) -> Tuple[str, str]:
+        """
+        Devuelve el ZIP de TensorBoard del job, armándolo solo si los eventos cambiaron.
+
+        Returns:
+            Tuple[str, str]: (ruta al ZIP, ETag)
+
+        Raises:
+            FileNotFoundError: Si no hay directorio de logs o archivos de eventos
+        """
+        job_dir = self.__jobs_storage_path / job_id
+        log_path = job_dir / "logs"
+        if not log_path.is_dir():
+            raise FileNotFoundError(f"Directorio de logs no encontrado para el job {job_id}")
+
+        event_files = sorted(
+            (entry for entry in os.scandir(log_path) if entry.name.startswith(TENSORBOARD_PREFIX)),
+            key=lambda entry: entry.name
+        )
+        if not event_files:
+            raise FileNotFoundError(f"Archivos de evento de TensorBoard no encontrados en el directorio de logs para el job {job_id}")
+
+        etag = self._archive_key(event_files)
+        zip_path = job_dir / f"tensorboard_{job_id}.zip"
+        etag_path = job_dir / f"tensorboard_{job_id}.zip.etag"
+
+        with self._lock_for(job_id):
+            if zip_path.exists() and self._read_etag(etag_path) == etag:
+                return str(zip_path), etag
+
+            logger.info(f"Armando ZIP de TensorBoard para el job {job_id}")
+            tmp_path = zip_path.with_name(f"{zip_path.name}.{os.getpid()}.tmp")
+            try:
+                with zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_STORED) as zipf:
+                    for entry in event_files:
+                        # Subcarpeta para que no se mezclen los archivos al descomprimir
+                        zipf.write(entry.path, os.path.join(f"tensorboard_logs_{job_id}", entry.name))
+                os.replace(tmp_path, zip_path)
+            finally:
+                if tmp_path.exists():
+                    tmp_path.unlink()
+            self._write_etag(etag_path, etag)
+
+        logger.info(f"ZIP de TensorBoard listo en {zip_path}")
+        return str(zip_path), etag
+
+    def get_bundle_files(self, job_id: str) -> List[Tuple[str, str]]:
+        """
+        Archivos del paquete de descarga del job: eventos de TensorBoard, train.log, CSVs del
+        Monitor y el modelo (final o, si todavía no existe, el último checkpoint).
+
+        Returns:
+            List[Tuple[str, str]]: (ruta en disco, ruta dentro del ZIP)
+
+        Raises:
+            FileNotFoundError: Si el job no existe
+        """
+        job_dir = self.__jobs_storage_path / job_id
+        if not job_dir.is_dir():
+            raise FileNotFoundError(f"Job {job_id} no encontrado")
+
+        files = []
+        log_path = job_dir / "logs"
+        if log_path.is_dir():
+            for entry in sorted(os.scandir(log_path), key=lambda entry: entry.name):
+                if (entry.name.startswith(TENSORBOARD_PREFIX) or entry.name == "train.log"
+                        or entry.name.endswith("monitor.csv")):
+                    files.append((entry.path, f"{job_id}/logs/{entry.name}"))
+
+        model_dir = job_dir / "trained_model"
+        model_path = model_dir / "model.zip"
+        if not model_path.exists():
+            model_path = model_dir / "checkpoints" / "model_checkpoint_latest.zip"
+        for path in (model_path, model_dir / "training_config.json"):
+            if path.exists():
+                files.append((str(path), f"{job_id}/{path.relative_to(job_dir).as_posix()}"))
+        return files
+
+    def iter_bundle(self, files: List[Tuple[str, str]]) -> Iterator[bytes]:
+        """
+        Genera el ZIP de los archivos bloque a bloque mientras se descarga, sin archivos
+        temporales: ZipFile escribe sobre un buffer no seekable (con descriptores de datos)
+        que se vacía después de cada bloque copiado.
+        """
+        buffer = _StreamBuffer()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED, allowZip64=True) as zipf:
+            for path, arcname in files:
+                try:
+                    info = zipfile.ZipInfo.from_file(path, arcname)
+                    with open(path, 'rb') as source, zipf.open(info, 'w', force_zip64=True) as target:
+                        while True:
+                            chunk = source.read(BUNDLE_CHUNK_SIZE)
+                            if not chunk:
+                                break
+                            target.write(chunk)
+                            yield from self._drain(buffer)
+                except FileNotFoundError:
+                    # El archivo desapareció entre el listado y la copia (p. ej. un checkpoint rotado)
+                    logger.warning(f"{path} ya no existe, se omite del paquete")
+                yield from self._drain(buffer)
+        yield from self._drain(buffer)
+
+    @staticmethod
+    def _drain(buffer: _StreamBuffer) -> Iterator[bytes]:
+        """Entrega lo acumulado en el buffer, si hay algo (un bloque vacío no se envía)"""
+        data = buffer.take()
+        if data:
+            yield data
+
+    @staticmethod
+    def _archive_key(event_files) -> str:
+        digest = hashlib.sha1()
+        for entry in event_files:
+            stat = entry.stat()
+            digest.update(f"{entry.name}:{stat.st_mtime_ns}:{stat.st_size}\n".encode())
+        return digest.hexdigest()
+
+    @staticmethod
+    def _read_etag(etag_path: Path):
+        try:
+            return etag_path.read_text(encoding='utf-8').strip()
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def _write_etag(etag_path: Path, etag: str):
+        tmp_path = etag_path.with_name(f"{etag_path.name}.{os.getpid()}.tmp")
+        tmp_path.write_text(etag, encoding='utf-8')
+        os.replace(tmp_path, etag_path)
+
+    @classmethod
+    def _lock_for(cls, job_id: str) -> threading.Lock:
+        # Cantidad fija de locks: no crece con los jobs creados y no hay que borrarlos al eliminar uno
+        return cls.__locks[hash(job_id) % ARCHIVE_LOCK_STRIPES]
@@ -0,0 +1,117 @@
+import time
+import logging
+import threading
+from typing import Callable, Optional, Set
+from Services.docker_service import DockerService, POOL_PREFIX
+
+logger = logging.getLogger(__name__)
+
+JOB_CONTAINER_PREFIX = "webots_job_"
+# Espera entre reconexiones al stream de eventos si Docker no responde
+RECONNECT_DELAY_SECONDS = 2
+MAX_RECONNECT_DELAY_SECONDS = 30
+
+class ContainerEventsService:
+    """
+    Sigue el stream de eventos de Docker para enterarse en el momento en que un contenedor de
+    simulación termina, en lugar de esperar a la próxima pasada del JobCleaner.
+
+    Solo se piden eventos "die" y "oom". El "oom" llega antes que el "die" del mismo
+    contenedor, así que se recuerda para marcar la salida como OOM. Si el stream se corta
+    (reinicio del daemon), se reconecta desde el último evento visto para no perder salidas.
+    Cada proceso de la API sigue el stream, pero solo el que tiene el lease aplica las salidas.
+    """
+
+    def __init__(self, docker_service: DockerService,
+                 on_job_exit: Callable[[str, str, Optional[int], bool], None],
+                 on_pool_exit: Optional[Callable[[str], None]] = None,
+                 is_leader: Optional[Callable[[], bool]] = None):
+        """
+        Args:
+            docker_service: Servicio de Docker del que se lee el stream
+            on_job_exit: Función (job_id, container_id, exit_code, oom_killed) llamada al morir
+                         un webots_job_*
+            on_pool_exit: Función (nombre) llamada al morir un contenedor del warm pool
+            is_leader: Función que dice si este proceso aplica los eventos; sin ella los aplica siempre
+        """
+        self.__docker_service = docker_service
+        self.__on_job_exit = on_job_exit
+        self.__on_pool_exit = on_pool_exit
+        self.__is_leader = is_leader
+        self.__oom_killed: Set[str] = set()
+        self.__since = None
+        self.__stream = None
+        self.__stop = threading.Event()
+        self.__thread = None
+
+    def start(self):
+        if self.__thread is not None and self.__thread.is_alive():
+            return
+        self.__stop.clear()
+        self.__since = int(time.time())
+        self.__thread = threading.Thread(target=self._run, name="docker-events", daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        self.__stop.set()
+        stream = self.__stream
+        if stream is not None:
+            try:
+                stream.close()
+            except Exception:
+                pass
+
+    def _run(self):
+        delay = RECONNECT_DELAY_SECONDS
+        while not self.__stop.is_set():
+            try:
+                self.__stream = self.__docker_service.stream_container_events(since=self.__since)
+                for event in self.__stream:
+                    delay = RECONNECT_DELAY_SECONDS
+                    self._handle_event(event)
+                    if self.__stop.is_set():
+                        break
+            except Exception as e:
+                if self.__stop.is_set():
+                    break
+                logger.error(f"Se cortó el stream de eventos de Docker: {e}")
+                delay = min(delay * 2, MAX_RECONNECT_DELAY_SECONDS)
+            finally:
+                self.__stream = None
+            self.__stop.wait(delay)
+
+    def _handle_event(self, event):
+        # Reconectar desde este segundo puede repetir algún evento; procesarlo dos veces es inocuo
+        self.__since = event.get("time", self.__since)
+        action = event.get("Action") or event.get("status")
+        container_id = event.get("id") or (event.get("Actor") or {}).get("ID")
+        attributes = (event.get("Actor") or {}).get("Attributes") or {}
+        name = attributes.get("name", "")
+
+        if action == "oom":
+            self.__oom_killed.add(container_id)
+            logger.warning(f"El contenedor '{name}' se quedó sin memoria (OOM)")
+            return
+        if action != "die":
+            return
+
+        oom_killed = container_id in self.__oom_killed
+        self.__oom_killed.discard(container_id)
+        try:
+            exit_code = int(attributes["exitCode"])
+        except (KeyError, TypeError, ValueError):
+            exit_code = None
+
+        try:
+            if not name.startswith((JOB_CONTAINER_PREFIX, POOL_PREFIX)):
+                return
+            if self.__is_leader is not None and not self.__is_leader():
+                return
+            if name.startswith(JOB_CONTAINER_PREFIX):
+                job_id = name[len(JOB_CONTAINER_PREFIX):]
+                logger.info(f"Contenedor '{name}' terminó (código {exit_code}{', OOM' if oom_killed else ''})")
+                self.__on_job_exit(job_id, container_id, exit_code, oom_killed)
+            elif name.startswith(POOL_PREFIX) and self.__on_pool_exit is not None:
+                self.__on_pool_exit(name)
+        except Exception as e:
+            logger.error(f"Error procesando la salida del contenedor '{name}': {e}")
@@ -7,6 +7,39 @@ class Config:
             "completed_jobs_hours": 24 * 7,  # 7 días para jobs completados exitosamente
             "failed_jobs_hours": 24 * 1,     # 1 día para jobs fallidos
         }
+        self.__job_counter_path = os.getenv("JOB_COUNTER_PATH", "./Storage/job_counter")
+        self.__index_path = os.getenv("JOB_INDEX_PATH", "./Storage/jobs.db")
+        self.__schedulerConfig = {
+            "cpus_per_job": int(os.getenv("CPUS_PER_JOB", 2)),            # Núcleos reservados por contenedor Webots
+            "memory_per_job_gb": float(os.getenv("MEMORY_PER_JOB_GB", 4)), # RAM reservada por contenedor Webots
+            "max_concurrent_jobs": int(os.getenv("MAX_CONCURRENT_JOBS", 0)), # 0 = calcular según CPU y RAM
+            "prepare_workers": int(os.getenv("PREPARE_WORKERS", 2)),      # Hilos para extraer/validar/parchear mundos
+            "dispatch_interval_seconds": 10,                              # Frecuencia con la que se revisan slots libres
+        }
+        self.__warmPoolConfig = {
+            "size": int(os.getenv("WARM_POOL_SIZE", 0)),  # Contenedores Webots pre-iniciados (0 = deshabilitado)
+        }
+        self.__worldArchiveConfig = {
+            "max_entries": int(os.getenv("WORLD_MAX_ENTRIES", 20000)),                   # Archivos dentro del ZIP
+            "max_uncompressed_mb": int(os.getenv("WORLD_MAX_UNCOMPRESSED_MB", 2048)),     # Tamaño total extraído
+            "max_compression_ratio": int(os.getenv("WORLD_MAX_COMPRESSION_RATIO", 200)),  # Protección contra zip bombs
+        }
+        self.__worldCacheConfig = {
+            "path": os.getenv("WORLD_CACHE_PATH", "./Storage/WorldCache"),
+            "max_size_mb": int(os.getenv("WORLD_CACHE_MAX_MB", 5120)),  # Cuota en disco del caché de mundos (0 = deshabilitado)
+        }
+        self.__cleanerConfig = {
+            "interval_minutes": int(os.getenv("CLEANER_INTERVAL_MINUTES", 30)),           # Frecuencia de la pasada principal
+            "workers": int(os.getenv("CLEANER_WORKERS", 2)),                             # Jobs procesados en paralelo
+            "max_deletions_per_pass": int(os.getenv("CLEANER_MAX_DELETIONS", 50)),        # Borrados de directorios por pasada (0 = sin límite)
+            "delete_files_per_second": int(os.getenv("CLEANER_DELETE_FILES_PER_SECOND", 2000)), # 0 = sin límite
+        }
+        self.__resourceConfig = {
+            "max_cpus_per_job": int(os.getenv("MAX_CPUS_PER_JOB", 8)),             # Tope de núcleos que puede pedir un job
+            "max_memory_per_job_gb": float(os.getenv("MAX_MEMORY_PER_JOB_GB", 16)), # Tope de RAM que puede pedir un job
+            "pids_per_job": int(os.getenv("PIDS_PER_JOB", 4096)),                  # Procesos/hilos máximos por contenedor
+            "pin_cpus": os.getenv("PIN_CPUS", "1") != "0",                        # Fijar cada job a núcleos propios (cpuset)
+        }
         
 
     def get_storage_path(self):
@@ -23,4 +56,27 @@ class Config:
     
     def get_ttl_config(self):
         return self.__ttlConfig
-    
\ No newline at end of file
+
+    def get_job_counter_path(self):
+        return self.__job_counter_path
+
+    def get_index_path(self):
+        return self.__index_path
+
+    def get_scheduler_config(self):
+        return self.__schedulerConfig
+
+    def get_warm_pool_config(self):
+        return self.__warmPoolConfig
+
+    def get_world_archive_config(self):
+        return self.__worldArchiveConfig
+
+    def get_world_cache_config(self):
+        return self.__worldCacheConfig
+
+    def get_cleaner_config(self):
+        return self.__cleanerConfig
+
+    def get_resource_config(self):
+        return self.__resourceConfig
@@ -0,0 +1,84 @@
+import os
+import re
+import logging
+import threading
+from pathlib import Path
+from Services.core.config import Config
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin locks advisory, solo se serializan los hilos del proceso
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+class JobIdAllocator:
+    """
+    Asigna IDs de job únicos aunque varios procesos de la API compartan el mismo Storage.
+
+    El último ID asignado se guarda en un archivo contador. Cada asignación toma un lock
+    exclusivo (flock) sobre un archivo .lock, lee el contador y escribe el nuevo valor con
+    archivo temporal + rename, de modo que un corte a mitad de escritura no lo corrompe.
+    Sin fcntl (Windows) solo se serializan los hilos del proceso: ahí debe correr un único
+    proceso de la API.
+    """
+
+    __thread_lock = threading.Lock()
+
+    def __init__(self):
+        self.__config = Config()
+        self.__jobs_storage_path = Path(self.__config.get_storage_path())
+        self.__counter_path = Path(self.__config.get_job_counter_path())
+        self.__lock_path = self.__counter_path.with_name(self.__counter_path.name + ".lock")
+
+    def allocate(self) -> int:
+        """
+        Reserva y devuelve el siguiente ID de job.
+
+        Returns:
+            int: ID nuevo, nunca entregado antes a otro proceso
+        """
+        self.__counter_path.parent.mkdir(parents=True, exist_ok=True)
+        with self.__thread_lock, open(self.__lock_path, 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                next_id = self._read_counter() + 1
+                self._write_counter(next_id)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+        logger.info(f"Generando nuevo job ID: {next_id}")
+        return next_id
+
+    def _read_counter(self) -> int:
+        """Lee el último ID asignado. Solo si el contador no existe se analiza Storage/Jobs (migración)."""
+        try:
+            with open(self.__counter_path, 'r', encoding='utf-8') as f:
+                return int(f.read().strip())
+        except FileNotFoundError:
+            max_id = self._scan_max_job_id()
+            logger.info(f"Contador de jobs inicializado desde Storage/Jobs: {max_id}")
+            return max_id
+
+    def _write_counter(self, value: int):
+        tmp_path = self.__counter_path.with_name(self.__counter_path.name + ".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(str(value))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.__counter_path)
+
+    def _scan_max_job_id(self) -> int:
+        """Retorna el ID más grande entre las carpetas job_N existentes, o 0 si no hay."""
+        max_id = 0
+        job_pattern = re.compile(r'^job_(\d+)$')
+        if not self.__jobs_storage_path.exists():
+            return max_id
+
+        for item in self.__jobs_storage_path.iterdir():
+            match = job_pattern.match(item.name)
+            if match and item.is_dir():
+                max_id = max(max_id, int(match.group(1)))
+        return max_id
@@ -1,14 +1,64 @@
 import docker
 import os
+import uuid
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
 from pathlib import Path
+from typing import Dict, Optional
 import logging
+from Services.resource_service import ResourceService
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin locks advisory entre procesos
+    fcntl = None
 
 # Nombre de la imagen Docker
 IMAGE_NAME = "webots_image" 
+# Prefijo de los contenedores pre-iniciados del warm pool
+POOL_PREFIX = "webots_pool_"
+# Cada contenedor del pool monta su propio directorio de Storage/PoolSlots en /jobs; al asignarle
+# un job, el workspace del job se mueve ahí y queda visible en /jobs/<job_id>
+POOL_JOBS_DIR = "/jobs"
+POOL_CONTROLLER_DIR = "/opt/InternalController"
+# Lock (en Storage/PoolSlots) que serializa los movimientos de workspaces entre procesos
+WORKSPACE_LOCK_FILENAME = ".workspaces.lock"
+# Tiempo máximo de espera a que Xvfb acepte conexiones
+DISPLAY_TIMEOUT_SECONDS = 15
+
+# Funciones de arranque comunes a los scripts de los contenedores. mark() agrega "fase=timestamp"
+# al archivo de tiempos que InternalController vuelca en el state.json del job.
+BOOTSTRAP_FUNCTIONS = r"""
+mark() { [ -n "$TIMINGS_FILE" ] && echo "$1=$(date +%s.%N)" >> "$TIMINGS_FILE"; }
+
+prepare_home() {
+    mkdir -p /tmp/webots_home/.local/share/applications
+    mkdir -p /tmp/webots_home/.config/Cyberbotics
+    mkdir -p /tmp/.X11-unix
+    chmod 1777 /tmp/.X11-unix
+}
+
+start_display() {
+    echo "Iniciando Xvfb..."
+    Xvfb :99 -screen 0 1280x1024x24 -ac +extension GLX +render -noreset &
+    local deadline=$(( $(date +%s) + DISPLAY_TIMEOUT ))
+    until [ -S /tmp/.X11-unix/X99 ] && xdpyinfo -display :99 >/dev/null 2>&1; do
+        if [ "$(date +%s)" -ge "$deadline" ]; then
+            echo "Xvfb no respondió en ${DISPLAY_TIMEOUT}s"
+            return 1
+        fi
+        sleep 0.05
+    done
+}
+"""
 
 logger = logging.getLogger(__name__)
 
 class DockerService:
+    # Compartido por todas las instancias del proceso (API, cleaner, eventos)
+    __workspace_thread_lock = threading.Lock()
+
     def __init__(self):
         """
         Inicializa el servicio de Docker.
@@ -27,18 +77,23 @@ class DockerService:
         BASE_DIR = Path(__file__).parent.parent  # Directorio del proyecto
         self.__service =(BASE_DIR / "Services" / "state_service.py").resolve()
         self.__jobs_storage_path = (BASE_DIR / "Storage" / "Jobs").resolve()
+        self.__pool_slots_path = (BASE_DIR / "Storage" / "PoolSlots").resolve()
         self.__internal_controller_path = (BASE_DIR / "Storage" / "InternalController").resolve()
+        self.__resources = ResourceService()
+        # Serializa la elección de núcleos para que dos lanzamientos no tomen el mismo cpuset
+        self.__cpuset_lock = threading.Lock()
 
-    def start_simulation_for_job(self, job_id: str, world_file_abs_path: Path):
+    def start_simulation_for_job(self, job_id: str, world_file_abs_path: Path, profile: Optional[Dict] = None):
         """
         Levanta un contenedor Docker y ejecuta una simulación de Webots para un job específico.
 
         Args:
             job_id: El ID del job a ejecutar.
             world_file_abs_path: La ruta absoluta al archivo .wbt que se debe ejecutar.
+            profile: Núcleos y memoria del job (ver ResourceService); si no se pasa se resuelve acá.
 
         Returns:
-            True si se inició correctamente, o None si hubo un error.
+            str: ID del contenedor lanzado
         """
         container_name = f"webots_job_{job_id}"
         logger.info(f"Iniciando simulación para el job {job_id} en el contenedor {container_name}")
@@ -107,48 +162,27 @@ class DockerService:
         }
 
         # Comandos y variables de entorno
-        # xvfb-run es una utilidad que simplifica el uso de Xvfb para aplicaciones headless.
-        command = f"""bash -c '
-                        echo "Configurando entorno..."
-                        mkdir -p /tmp/webots_home/.local/share/applications
-                        mkdir -p /tmp/webots_home/.config/Cyberbotics
-                        mkdir -p /tmp/.X11-unix
-                        chmod 1777 /tmp/.X11-unix
-                        
-                        find /workspace/world -name "*" -path "*/controllers/*" -type f -exec chmod +x {{}} \;
-
-                        echo "Iniciando Xvfb..."
-                        Xvfb :99 -screen 0 1280x1024x24 -ac +extension GLX +render -noreset &
-                        sleep 3
-                        
-                        echo "Verificando OpenGL..."
-                        DISPLAY=:99 glxinfo | head -10 || echo "Sin aceleración OpenGL"
-
-                        webots --no-rendering --batch --mode=fast --stdout --stderr "{container_wbt_path}"'
-                   """
+        # Se espera a que el display acepte conexiones (con timeout) en lugar de un sleep fijo.
+        command = ["bash", "-c", BOOTSTRAP_FUNCTIONS + f"""
+            : > "$TIMINGS_FILE"
+            mark bootstrap_start
+            echo "Configurando entorno..."
+            prepare_home
+            find /workspace/world -path "*/controllers/*" -type f -exec chmod +x {{}} \\;
+            mark setup
+
+            start_display || exit 1
+            mark display
+
+            webots --no-rendering --batch --mode=fast --stdout --stderr "{container_wbt_path}"
+        """]
 
         # Variables de entorno.
-        environment = {
-            "USER": os.getenv("USER", "default"),
-            "USERNAME": os.getenv("USER", "default"),
-            "HOME": "/tmp/webots_home",
-            "XDG_RUNTIME_DIR": "/tmp/runtime-webotsuser",
-            "DISPLAY": ":99", #En un contenedor Docker sin pantalla física, Xvfb crea una pantalla virtual (normalmente :99 o :1)
-            "QT_X11_NO_MITSHM": "1",
-            "QT_QPA_PLATFORM": "xcb",#Webots usa Qt, y necesita especificar cómo comunicarse con el servidor X (Xvfb)
-            
-            **({#GPU
-                "LIBGL_ALWAYS_INDIRECT": "0",
-                "DRI_PRIME": "1",
-            } if self._has_gpu_support() else { #CPU
-                "LIBGL_ALWAYS_SOFTWARE": "1",
-                "GALLIUM_DRIVER": "llvmpipe",
-            }),
-            "MESA_GL_VERSION_OVERRIDE": "3.3",
-            #"MESA_GLSL_VERSION_OVERRIDE": "130",
-            #"MESA_NO_ERROR": "1",
-            "PYTHONPATH": "/workspace" #El contenedor tendrá /workspace en el Python path
-        }
+        environment = self._build_environment()
+        environment["TIMINGS_FILE"] = "/workspace/logs/bootstrap_timings"
+        environment["WORLD_FILE"] = str(container_wbt_path)
+        profile = profile or self.__resources.get_job_profile(job_id)
+        environment.update(self.__resources.get_thread_environment(profile))
 
         #Ejecución del contenedor
         try:
@@ -179,9 +213,14 @@ class DockerService:
                 container_arg["cap_add"] = ["SYS_ADMIN"]
             """
 
-            container = self.__client.containers.run(**container_arg)    
+            with self.__cpuset_lock:
+                cpuset = self.__resources.allocate_cpuset(profile["cpus"], self._used_cpusets())
+                container_arg.update(self.__resources.get_run_limits(profile, cpuset))
+                container = self.__client.containers.run(**container_arg)
+            logger.info(f"Job {job_id}: {profile['cpus']} núcleos (cpuset {cpuset or 'sin fijar'}), {profile['memory_gb']} GB")
+            logger.info(f"Contenedor '{container_name}' (ID: {container.id}) iniciado exitosamente.")
             
-            return f"Contenedor '{container_name}' (ID: {container.id}) iniciado exitosamente."
+            return container.id
         except docker.errors.ImageNotFound:
             logger.error(f"La imagen de Docker '{self.__image_name}' no fue encontrada.")
             raise
@@ -195,6 +234,199 @@ class DockerService:
             logger.error(f"Error inesperado al iniciar la simulación para el job {job_id}: {e}")
             raise
 
+    def start_pool_container(self):
+        """
+        Inicia un contenedor del warm pool: Xvfb ya levantado y el proceso principal esperando
+        a que se le asigne un job. Como el job todavía no se conoce y Docker no permite agregar
+        montajes a un contenedor en marcha, se monta un directorio vacío propio del contenedor
+        (Storage/PoolSlots/<nombre>) al que assign_pool_container mueve el workspace del job.
+        Así el contenedor nunca ve los archivos de otros jobs.
+        """
+        container_name = f"{POOL_PREFIX}{uuid.uuid4().hex[:8]}"
+        slot_path = self.__pool_slots_path / container_name
+        slot_path.mkdir(parents=True, exist_ok=True)
+        volumes = {
+            str(slot_path): {
+                'bind': POOL_JOBS_DIR,
+                'mode': 'rw'
+            },
+            str(self.__internal_controller_path): {
+                'bind': POOL_CONTROLLER_DIR,
+                'mode': 'ro'
+            },
+            str(self.__service): {
+                'bind': f"{POOL_CONTROLLER_DIR}/Monitor/state_service.py",
+                'mode': 'ro'
+            }
+        }
+
+        # Al recibir TERM (lo envía el job al terminar, o docker stop) el contenedor sale con el
+        # código de salida de Webots, igual que un contenedor lanzado en frío.
+        script = BOOTSTRAP_FUNCTIONS + r"""
+            prepare_home
+            start_display || exit 1
+            touch /tmp/pool_ready
+
+            trap "exit \$(cat /tmp/job_exit 2>/dev/null || echo 0)" TERM
+            sleep infinity &
+            wait $!
+        """
+
+        container = self.__client.containers.run(
+            image=self.__image_name,
+            name=container_name,
+            command=["bash", "-c", script],
+            network_mode="bridge",
+            working_dir="/tmp",
+            volumes=volumes,
+            environment=self._build_environment(),
+            pids_limit=self.__resources.get_pids_limit(),
+            user=f"{os.getuid()}:{os.getgid()}",
+            detach=True,
+            tty=True
+        )
+        logger.info(f"Contenedor de warm pool '{container_name}' iniciado")
+        return container
+
+    def list_pool_containers(self, all: bool = False):
+        """Contenedores del warm pool todavía sin asignar (con all=True, también los detenidos)."""
+        try:
+            return self.__client.containers.list(all=all, filters={"name": POOL_PREFIX})
+        except docker.errors.APIError as e:
+            logger.error(f"Error de la API de Docker al listar el warm pool: {e}")
+            return []
+
+    def assign_pool_container(self, container, job_id: str, world_file_abs_path: Path, profile: Optional[Dict] = None):
+        """
+        Asigna un contenedor del pool a un job: lo renombra a webots_job_<job_id> (así lo ven
+        list_running_simulations y stop_simulation), le aplica los límites de recursos del job,
+        mueve el workspace del job al directorio del contenedor (ver _move_to_pool_slot), copia
+        el InternalController al proyecto y ejecuta Webots con `docker exec`. Al terminar Webots
+        se detiene el contenedor y release_pool_workspace devuelve el workspace a Storage/Jobs.
+
+        Returns:
+            str: ID del contenedor asignado
+        """
+        container_name = f"webots_job_{job_id}"
+        slot_path = self.__pool_slots_path / container.name
+        profile = profile or self.__resources.get_job_profile(job_id)
+        with self.__cpuset_lock:
+            cpuset = self.__resources.allocate_cpuset(profile["cpus"], self._used_cpusets())
+            container.rename(container_name)
+            try:
+                container.update(**self.__resources.get_update_limits(profile, cpuset))
+                self._move_to_pool_slot(job_id, slot_path)
+            except Exception:
+                # Ya tiene el nombre del job: no puede volver al pool
+                self.remove_container(container)
+                self.release_pool_workspace(job_id)
+                raise
+
+        job_dir = f"{POOL_JOBS_DIR}/{job_id}"
+        world_file_relative_path = world_file_abs_path.relative_to(self.__jobs_storage_path / job_id / "world")
+        container_wbt_path = f"{job_dir}/world/{world_file_relative_path.as_posix()}"
+        controllers_dir = f"{job_dir}/world/{world_file_relative_path.parts[0]}/controllers"
+
+        script = BOOTSTRAP_FUNCTIONS + f"""
+            : > "$TIMINGS_FILE"
+            mark bootstrap_start
+            deadline=$(( $(date +%s) + DISPLAY_TIMEOUT ))
+            until [ -e /tmp/pool_ready ]; do
+                if [ "$(date +%s)" -ge "$deadline" ]; then
+                    echo 1 > /tmp/job_exit
+                    kill -TERM 1
+                    exit 1
+                fi
+                sleep 0.05
+            done
+            mark pool_wait
+
+            find "{job_dir}/world" -path "*/controllers/*" -type f -exec chmod +x {{}} \\;
+            rm -rf "{controllers_dir}/InternalController"
+            cp -r {POOL_CONTROLLER_DIR} "{controllers_dir}/InternalController"
+            mark setup
+
+            webots --no-rendering --batch --mode=fast --stdout --stderr "{container_wbt_path}"
+            echo $? > /tmp/job_exit
+            kill -TERM 1
+        """
+        try:
+            container.exec_run(
+                ["bash", "-c", script],
+                detach=True,
+                user=f"{os.getuid()}:{os.getgid()}",
+                workdir=job_dir,
+                environment={
+                    "WORKSPACE_DIR": job_dir,
+                    "PYTHONPATH": job_dir,
+                    "TIMINGS_FILE": f"{job_dir}/logs/bootstrap_timings",
+                    "WORLD_FILE": container_wbt_path,
+                    **self.__resources.get_thread_environment(profile)
+                }
+            )
+        except Exception:
+            # Ya tiene el nombre del job: no puede volver al pool
+            self.remove_container(container)
+            self.release_pool_workspace(job_id)
+            raise
+        logger.info(f"Contenedor del pool '{container.name}' asignado al job {job_id} como '{container_name}' "
+                    f"({profile['cpus']} núcleos, cpuset {cpuset or 'sin fijar'}, {profile['memory_gb']} GB)")
+        return container.id
+
+    def remove_container(self, container):
+        try:
+            container.remove(force=True)
+        except docker.errors.APIError as e:
+            logger.error(f"Error de la API de Docker al eliminar el contenedor '{container.name}': {e}")
+            return
+        if container.name.startswith(POOL_PREFIX):
+            self._remove_pool_slot(self.__pool_slots_path / container.name)
+
+    def release_pool_workspace(self, job_id: str) -> bool:
+        """
+        Devuelve a Storage/Jobs el workspace de un job que corrió en un contenedor del pool. Solo
+        debe llamarse cuando ese contenedor ya terminó. Es seguro llamarlo a la vez desde varios
+        hilos o procesos: al volver, Storage/Jobs/<job_id> es un directorio común (o no existe).
+
+        Returns:
+            bool: True si el job estaba en un directorio del pool
+        """
+        with self._workspace_lock():
+            return self._release_workspace(job_id)
+
+    def release_pool_workspaces(self, running_containers):
+        """
+        Devuelve los workspaces que siguen en directorios del pool aunque su contenedor ya no
+        corre (p. ej. si el evento "die" se perdió con la API caída).
+
+        Args:
+            running_containers: Nombres de los contenedores webots_job_* en ejecución
+        """
+        if not self.__pool_slots_path.exists():
+            return
+        running = set(running_containers)
+        # Solo se recorren los directorios del pool, no Storage/Jobs
+        for slot_job_path in [job for slot in self.__pool_slots_path.iterdir() if slot.is_dir() for job in slot.iterdir()]:
+            job_id = slot_job_path.name
+            if f"webots_job_{job_id}" in running:
+                continue
+            # La lista pudo tomarse antes de que se asignara el contenedor: se confirma con inspect
+            if self.get_container_exit(job_id) is None:
+                continue
+            try:
+                with self._workspace_lock():
+                    job_path = self.__jobs_storage_path / job_id
+                    if not slot_job_path.exists():
+                        continue
+                    if not job_path.is_symlink() and not job_path.exists():
+                        # La API cayó entre el rename y la creación del symlink
+                        os.rename(slot_job_path, job_path)
+                        self._remove_pool_slot(slot_job_path.parent)
+                    else:
+                        self._release_workspace(job_id)
+            except OSError as e:
+                logger.error(f"No se pudo devolver el workspace del job {job_id}: {e}")
+
     def stop_simulation(self, job_id: str) -> bool:
         """Detiene y elimina el contenedor asociado a un job."""
         container_name = f"webots_job_{job_id}"
@@ -204,9 +436,11 @@ class DockerService:
             container.stop()
             container.remove()
             logger.info(f"Contenedor '{container_name}' detenido y eliminado.")
+            self.release_pool_workspace(job_id)
             return True
         except docker.errors.NotFound:
             logger.warning(f"No se encontró el contenedor '{container_name}' para detener.")
+            self.release_pool_workspace(job_id)
             return False
         except docker.errors.APIError as e:
             logger.error(f"Error de la API de Docker al detener el contenedor '{container_name}': {e}")
@@ -223,15 +457,133 @@ class DockerService:
             logger.error(f"Error de la API de Docker al listar contenedores: {e}")
             return []
 
-    
-    def _has_gpu_support(self):
-        """Verifica si el sistema tiene soporte GPU"""
+
+    def stream_container_events(self, since=None):
+        """
+        Stream bloqueante de eventos "die" y "oom" de contenedores (ya decodificados). Se corta
+        llamando a close() sobre el objeto devuelto.
+        """
+        return self.__client.events(
+            decode=True,
+            since=since,
+            filters={"type": "container", "event": ["die", "oom"]}
+        )
+
+    def get_container_exit(self, job_id: str):
+        """
+        Returns:
+            Dict | None: None si el contenedor del job sigue corriendo; si no,
+                         {"exit_code", "oom_killed"} (exit_code None si el contenedor ya no existe)
+        """
         try:
-            import subprocess
-            result = subprocess.run(['glxinfo', '-B'], capture_output=True, text=True)
-            return "direct rendering: Yes" in result.stdout
-        except:
+            container = self.__client.containers.get(f"webots_job_{job_id}")
+        except docker.errors.NotFound:
+            return {"exit_code": None, "oom_killed": False}
+        state = container.attrs.get("State") or {}
+        if state.get("Running", container.status == "running"):
+            return None
+        return {"exit_code": state.get("ExitCode"), "oom_killed": bool(state.get("OOMKilled"))}
+
+    def _move_to_pool_slot(self, job_id: str, slot_path: Path):
+        """
+        Mueve el workspace del job al directorio montado en /jobs del contenedor del pool y deja
+        en Storage/Jobs/<job_id> un symlink hacia él, para que la API, los watchers de logs y el
+        cleaner lo sigan encontrando en la misma ruta. Es un rename dentro del mismo sistema de
+        archivos: no se copia nada y los archivos abiertos (logs, métricas) siguen siendo válidos.
+        """
+        job_path = self.__jobs_storage_path / job_id
+        slot_job_path = slot_path / job_id
+        with self._workspace_lock():
+            slot_path.mkdir(parents=True, exist_ok=True)
+            os.rename(job_path, slot_job_path)
+            try:
+                os.symlink(slot_job_path, job_path, target_is_directory=True)
+            except OSError:
+                os.rename(slot_job_path, job_path)
+                raise
+
+    def _release_workspace(self, job_id: str) -> bool:
+        """Devuelve el workspace desde el directorio del pool. Requiere _workspace_lock."""
+        job_path = self.__jobs_storage_path / job_id
+        if not job_path.is_symlink():
             return False
+        target = Path(os.readlink(job_path))
+        job_path.unlink()
+        if target.exists():
+            os.rename(target, job_path)
+        self._remove_pool_slot(target.parent)
+        logger.info(f"Workspace del job {job_id} devuelto desde el directorio del pool '{target.parent.name}'")
+        return True
+
+    @contextmanager
+    def _workspace_lock(self):
+        """
+        Serializa entre hilos y procesos los movimientos de workspaces entre Storage/Jobs y los
+        directorios del pool: asignación, devolución al terminar y cancelación.
+        """
+        with self.__workspace_thread_lock:
+            self.__pool_slots_path.mkdir(parents=True, exist_ok=True)
+            with open(self.__pool_slots_path / WORKSPACE_LOCK_FILENAME, 'a') as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _remove_pool_slot(self, slot_path: Path):
+        """Borra el directorio de un contenedor del pool si ya no contiene ningún job"""
+        if slot_path.parent != self.__pool_slots_path:
+            return
+        try:
+            slot_path.rmdir()
+        except OSError:
+            pass
+
+    def _used_cpusets(self):
+        """cpusets de los contenedores de jobs en ejecución"""
+        containers = self.__client.containers.list(filters={"name": "webots_job_"})
+        return [(container.attrs.get("HostConfig") or {}).get("CpusetCpus") for container in containers]
+
+    def _build_environment(self):
+        """Variables de entorno comunes a los contenedores de simulación (display virtual, Qt, OpenGL)."""
+        return {
+            "USER": os.getenv("USER", "default"),
+            "USERNAME": os.getenv("USER", "default"),
+            "HOME": "/tmp/webots_home",
+            "XDG_RUNTIME_DIR": "/tmp/runtime-webotsuser",
+            "DISPLAY": ":99", #En un contenedor Docker sin pantalla física, Xvfb crea una pantalla virtual (normalmente :99 o :1)
+            "QT_X11_NO_MITSHM": "1",
+            "QT_QPA_PLATFORM": "xcb",#Webots usa Qt, y necesita especificar cómo comunicarse con el servidor X (Xvfb)
+            
+            **({#GPU
+                "LIBGL_ALWAYS_INDIRECT": "0",
+                "DRI_PRIME": "1",
+            } if self._has_gpu_support() else { #CPU
+                "LIBGL_ALWAYS_SOFTWARE": "1",
+                "GALLIUM_DRIVER": "llvmpipe",
+            }),
+            "MESA_GL_VERSION_OVERRIDE": "3.3",
+            "DISPLAY_TIMEOUT": str(DISPLAY_TIMEOUT_SECONDS),
+            #"MESA_GLSL_VERSION_OVERRIDE": "130",
+            #"MESA_NO_ERROR": "1",
+            "PYTHONPATH": "/workspace" #El contenedor tendrá /workspace en el Python path
+        }
+
+    def _has_gpu_support(self):
+        """Verifica si el sistema tiene soporte GPU (se detecta una sola vez por proceso)"""
+        return _detect_gpu_support()
+
+
+@lru_cache(maxsize=None)
+def _detect_gpu_support():
+    try:
+        import subprocess
+        result = subprocess.run(['glxinfo', '-B'], capture_output=True, text=True, timeout=10)
+        return "direct rendering: Yes" in result.stdout
+    except:
+        return False
 
 """
 if __name__ == "__main__":
@@ -3,20 +3,49 @@
 import time
 import os
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
 from Services.docker_service import DockerService
 from Services.core.config import Config
 from Services.state_service import StateService
-from Services.world_service import WorldService
+from Services.job_index_service import JobIndexService
+from Services.archive_service import ArchiveService
+from Services.metrics_service import MetricsIndex
 
 logger = logging.getLogger("job_cleaner")
 
+class _DeleteRateLimiter:
+    """Reparte un máximo de archivos borrados por segundo entre todos los hilos del cleaner."""
+
+    def __init__(self, files_per_second: int):
+        self.__interval = 1.0 / files_per_second if files_per_second > 0 else 0.0
+        self.__next_slot = time.monotonic()
+        self.__lock = threading.Lock()
+
+    def acquire(self):
+        if not self.__interval:
+            return
+        with self.__lock:
+            now = time.monotonic()
+            wait = self.__next_slot - now
+            self.__next_slot = max(self.__next_slot, now) + self.__interval
+        if wait > 0:
+            time.sleep(wait)
+
+
 class JobCleanerService:
     """
     Servicio de limpieza de jobs que maneja el ciclo de vida completo:
     run -> ready -> finished -> expired -> deleted
+
+    Cada pasada solo revisa los jobs que el índice marca como pendientes (cambiaron de estado
+    o llegó su próxima revisión, ver JobIndexService.list_due_job_ids); al terminar con un job
+    se agenda su próxima revisión para cuando vence su TTL. Los jobs se procesan en un pool
+    acotado y los borrados se limitan por pasada y en archivos por segundo para no competir
+    con la API por el disco.
     """
     
     def __init__(self):
@@ -28,13 +57,26 @@ class JobCleanerService:
         """
         self.__config = Config()
         self.__jobs_path = Path(self.__config.get_storage_path())
-        self.__stateService = StateService()
+        self.__jobIndex = JobIndexService()
         self.__dockerService = DockerService()
-        self.__worldService = WorldService()
+        self.__archiveService = ArchiveService()
         self.__containersUp=self.__dockerService.list_running_simulations()
         
         # Configuración de TTL (Time To Live)
         self.__ttlConfig = self.__config.get_ttl_config()
+
+        cleaner_config = self.__config.get_cleaner_config()
+        self.__pool = ThreadPoolExecutor(max_workers=max(cleaner_config["workers"], 1), thread_name_prefix="job-cleaner")
+        self.__deleteLimiter = _DeleteRateLimiter(cleaner_config["delete_files_per_second"])
+        self.__maxDeletions = cleaner_config["max_deletions_per_pass"]
+        self.__deletionsLeft = self.__maxDeletions
+        self.__passLock = threading.Lock()
+        self.__passStats: Dict = {}
+        self.__lastPass: Optional[Dict] = None
+        self.__totals = {"passes": 0, "jobs_processed": 0, "jobs_deleted": 0, "worlds_deleted": 0, "files_deleted": 0}
+
+        # Importar al índice los jobs creados antes de que existiera
+        self.__jobIndex.reconcile()
         
         logger.info(f"JobCleaner inicializado. Jobs path: {self.__jobs_path}")
     
@@ -44,42 +86,60 @@ class JobCleanerService:
         Este es el método principal que se ejecuta periódicamente.
         """
         start_time = time.time()
-        processed_jobs = 0
+        self.__passStats = {
+            "started_at": datetime.now().isoformat(), "due": 0, "processed": 0, "errors": 0,
+            "worlds_deleted": 0, "jobs_deleted": 0, "files_deleted": 0, "expired": 0, "deferred": 0
+        }
+        self.__deletionsLeft = self.__maxDeletions
         
         try:
             logger.debug("Iniciando proceso de limpieza de jobs...")
             
-            if not self.__jobs_path.exists():
-                logger.warning(f"Directorio de jobs no existe: {self.__jobs_path}")
-                return
-            
-            # Obtener todos los directorios de jobs
-            job_dirs = [d for d in self.__jobs_path.iterdir() if d.is_dir() and d.name.startswith('job_')]
+            # Sincronizar los jobs activos cuyo state.json cambió desde el contenedor
+            self.__jobIndex.refresh_active()
+
+            # Solo los jobs pendientes de revisión, desde el índice y sin recorrer Storage/Jobs
+            job_dirs = [self.__jobs_path / job_id
+                        for job_id in self.__jobIndex.list_due_job_ids(datetime.now().isoformat())]
+            self.__passStats["due"] = len(job_dirs)
             
-            logger.debug(f"Encontrados {len(job_dirs)} directorios de jobs")
+            logger.debug(f"{len(job_dirs)} jobs pendientes de revisión en el índice")
             
             self._get_running_containers()
+            # Workspaces que quedaron en directorios del warm pool tras perderse el evento "die"
+            self.__dockerService.release_pool_workspaces(self.__containersUp)
 
-            for job_dir in job_dirs:
+            for future in [self.__pool.submit(self._process_single_job, job_dir) for job_dir in job_dirs]:
                 try:
-                    self._process_single_job(job_dir)
-                    processed_jobs += 1
+                    future.result()
+                    self._count("processed")
                 except Exception as e:
-                    logger.error(f"❌ Error procesando job {job_dir.name}: {e}")
-            
-            elapsed = time.time() - start_time
-            logger.debug(f"✅ Proceso completado: {processed_jobs} jobs procesados en {elapsed:.2f}s")
+                    self._count("errors")
+                    logger.error(f"❌ Error procesando job: {e}")
             
         except Exception as e:
             logger.error(f"❌ Error en process_all_jobs: {e}")
+
+        finally:
+            self.__passStats["duration_s"] = round(time.time() - start_time, 3)
+            self.__lastPass = self.__passStats
+            self.__totals["passes"] += 1
+            self.__totals["jobs_processed"] += self.__passStats["processed"]
+            for key in ("jobs_deleted", "worlds_deleted", "files_deleted"):
+                self.__totals[key] += self.__passStats[key]
+            logger.debug(f"✅ Proceso completado: {self.__passStats}")
+
+    def get_pass_stats(self) -> Dict:
+        """Métricas de la última pasada y acumuladas desde que arrancó la API"""
+        return {"last_pass": self.__lastPass, "totals": dict(self.__totals)}
             
     def deep_cleanup(self):
         """Limpieza profunda: busca contenedores huérfanos, archivos temporales, etc."""
         logger.info("Ejecutando limpieza profunda...")
         try:
+            self.__jobIndex.reconcile()
             
-            for container in self.__containersUp:
-                container_name = container.name
+            for container_name in self.__containersUp:
                 job_id = container_name.replace("webots_job_", "")
                 job_dir = self.__jobs_path / job_id
                 
@@ -93,30 +153,15 @@ class JobCleanerService:
     def log_stats(self):
         """Registra estadísticas de jobs para monitoreo"""
         try:
-            if not self.__jobs_path.exists():
-                print(f"{self.__jobs_path} no existe.")
-                return
+            self.__jobIndex.refresh_active()
+            counts = self.__jobIndex.count_by_state()
+            stats = {"total": sum(counts.values()), "WAIT":0,"RUNNING":0, "ERROR":0, "READY":0, "TERMINATED":0, "orphaned": 0}
             
-            job_dirs = [d for d in self.__jobs_path.iterdir() if d.is_dir() and d.name.startswith('job_')]
-            stats = {"total": len(job_dirs), "WAIT":0,"RUNNING":0, "ERROR":0, "READY":0, "TERMINATED":0, "orphaned": 0}
-            
-            for job_dir in job_dirs:
-                state_file = job_dir / "logs" / "state.json"
-                
-                if not state_file.exists():
-                    stats["orphaned"] += 1
-                    continue
-                
-                try:
-                    self.__stateService.set_path(state_file)
-                    state = self.__stateService.read_state() 
-                    status = state.get("state", "unknown")
-                    if status in stats:
-                        stats[status] += 1
-                    else:
-                        stats["orphaned"] += 1
-                except:
-                    stats["orphaned"] += 1
+            for status, count in counts.items():
+                if status in stats:
+                    stats[status] += count
+                else:
+                    stats["orphaned"] += count
             
             logger.info(f"📊 Job Stats: {stats}")
             
@@ -134,70 +179,108 @@ class JobCleanerService:
             return
         
         try:
-            # Leer estado actual
-            self.__stateService.set_path(state_file)
-            state = self.__stateService.read_state()
+            # Leer estado actual (desde el índice; solo se relee el archivo si cambió). Cada job
+            # usa su propio StateService porque los jobs se procesan en paralelo.
+            state_service = StateService(state_file, listener=self.__jobIndex.record_state_file)
+            state = self.__jobIndex.get_state(job_id)
+            next_check = None
             
             # Procesar según estado
             if state["state"]== "RUNNING":
-                self._handle_running_job(job_dir, state)
+                self._handle_running_job(job_dir, state, state_service)
             elif state["state"] == "READY":
-                self._handle_ready_job(job_dir, state)
+                next_check = self._handle_ready_job(job_dir, state, state_service)
             elif state["state"] == "ERROR":
-                self._handle_error_job(job_dir, state)
+                next_check = self._handle_error_job(job_dir, state, state_service)
             elif state["state"] == "TERMINATED":
                 self._delete_job_completely(job_dir)
+            elif state["state"] == "WAIT":
+                # En preparación o en la cola del scheduler: lo gestiona SchedulerService
+                pass
             else:
-                logger.warning(f"⚠️ Estado desconocido '{state['status']}' en job {job_id}")
+                logger.warning(f"⚠️ Estado desconocido '{state['state']}' en job {job_id}")
+
+            # Sin cambios de estado, el job no se vuelve a revisar hasta que venza su TTL
+            if next_check is not None:
+                self.__jobIndex.set_next_check(job_id, next_check.isoformat())
                 
         except Exception as e:
             logger.error(f"❌ Error procesando estado del job {job_id}: {e}")
+            raise
     
-    def _handle_running_job(self, job_dir: Path, state:Dict):
+    def _handle_running_job(self, job_dir: Path, state:Dict, state_service: StateService):
         """Maneja jobs en estado 'run'"""
         job_id = job_dir.name
         try:
             container_name = f"webots_job_{job_id}"
     
             if(not(container_name in self.__containersUp)):
-                self.__stateService.set_state(1)
-                
+                # Normalmente lo registra ContainerEventsService; si el evento se perdió (p. ej. la
+                # API estaba caída) se confirma con docker inspect antes de marcar el job
+                exit_info = self.__dockerService.get_container_exit(job_id)
+                if exit_info is not None:
+                    state_service.record_container_exit(exit_info["exit_code"], exit_info["oom_killed"])
+                    logger.warning(f"Job {job_id} en RUNNING sin contenedor activo, marcado como ERROR")
+                    return
+
             
             init_time = datetime.fromisoformat(state["init_timestamp"])
             diff = datetime.now()-init_time
             if(diff>=timedelta(hours=self.__ttlConfig["failed_jobs_hours"])):
                 logger.warning(f"Job {job_id} excede el limite de tiempo de entrenamiento")
+                # Primero el estado, para que el evento "die" del contenedor no registre otro error
+                state_service.set_state(2,"El job ha sido detenido por exceder el tiempo máximo de entrenamiento")
                 self.__dockerService.stop_simulation(job_id)
-                self.__stateService.set_state(2,"El job ha sido detenido por exceder el tiempo máximo de entrenamiento")
             
         except Exception as e:
             logger.error(f"Error verificando contenedor {job_id}: {e}")
     
-    def _handle_ready_job(self, job_dir: Path, state: Dict):
-        """Maneja jobs en estado 'ready' - limpia contenedor y marca como finished"""
+    def _handle_ready_job(self, job_dir: Path, state: Dict, state_service: StateService) -> Optional[datetime]:
+        """
+        Maneja jobs en estado 'ready' - limpia contenedor y marca como finished
+
+        Returns:
+            datetime | None: Próxima revisión (vencimiento del TTL), o None para revisarlo en la próxima pasada
+        """
         job_id = job_dir.name
         
         logger.info(f"Limpiando job {job_id} (ready -> finished)")
         
-        self.__worldService.delete_world(job_dir)
+        if not self._delete_world(job_dir):
+            return None
+
+        # Dejar armado el ZIP de TensorBoard para que la primera descarga no espere
+        try:
+            self.__archiveService.get_tensorboard_archive(job_id)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error(f"Error armando el ZIP de TensorBoard del job {job_id}: {e}")
 
         if(self._should_expire_job(job_dir, state)):
-            self.__stateService.set_state(4)
+            state_service.set_state(4)
+            self._count("expired")
             logger.info(f"✅ Job {job_id} marcado como terminated")
+            return None
+        return self._expiry_deadline(job_dir, state)
            
-    def _handle_error_job(self, job_dir: Path, state: Dict):
+    def _handle_error_job(self, job_dir: Path, state: Dict, state_service: StateService) -> Optional[datetime]:
         """Maneja jobs en estado 'error' - limpia contenedor y marca como finished"""
         job_id = job_dir.name
         container_name = f"webots_job_{job_id}"
         if(container_name in self.__containersUp):
             self.__dockerService.stop_simulation(job_id)
         
-        self.__worldService.delete_world(job_dir)
+        if not self._delete_world(job_dir):
+            return None
 
         if(self._should_expire_job(job_dir, state)):
             logger.info(f"Job {job_id} se eliminará del storage en una hora")
-            self.__stateService.set_state(4)
+            state_service.set_state(4)
+            self._count("expired")
             logger.info(f"✅ Job {job_id} marcado como terminated")
+            return None
+        return self._expiry_deadline(job_dir, state)
 
     def _handle_orphaned_job(self, job_dir: Path, state_file: Path):
         """Maneja jobs sin archivo de estado (huérfanos)"""
@@ -213,13 +296,17 @@ class JobCleanerService:
         except Exception as e:
             logger.error(f"Error limpiando contenedores huérfanos: {e}")
         
-        self.__stateService.set_path(state_file)
-        self.__stateService.create_state()
-        self.__stateService.set_state(2,"Contenedor sin estado asociado, marcado como ERROR")
+        state_service = StateService(state_file, listener=self.__jobIndex.record_state_file)
+        state_service.create_state()
+        state_service.set_state(2,"Contenedor sin estado asociado, marcado como ERROR")
         logger.info(f"Job huérfano {job_id} marcado como ERROR")
     
     def _should_expire_job(self, job_dir: Path, state: Dict) -> bool:
         """Determina si un job debe expirar basado en TTL y success/failure"""
+        return datetime.now() > self._expiry_deadline(job_dir, state)
+
+    def _expiry_deadline(self, job_dir: Path, state: Dict) -> datetime:
+        """Momento en que vence el TTL del job"""
         
         # Buscar archivo del modelo entrenado
         model_file = job_dir / "trained_model" / "model.zip"
@@ -239,20 +326,87 @@ class JobCleanerService:
             
             ttl_hours = self.__ttlConfig["failed_jobs_hours"]
         
-        # Calcular si ha expirado
-        ttl_delta = timedelta(hours=ttl_hours)
-        return datetime.now() - reference_time > ttl_delta
+        return reference_time + timedelta(hours=ttl_hours)
     
     def _delete_job_completely(self, job_dir: Path):
         """Elimina un job completamente del sistema de archivos"""
-        import shutil
-        
+        if not self._take_deletion_slot():
+            return
         try:
-            shutil.rmtree(job_dir)
+            self._count("files_deleted", self._throttled_rmtree(job_dir))
+            MetricsIndex.drop(job_dir / "logs" / "training_metrics.jsonl")
+            self.__jobIndex.delete(job_dir.name)
+            self._count("jobs_deleted")
             logger.info(f"Job {job_dir.name} eliminado completamente")
         except Exception as e:
             logger.error(f"❌ Error eliminando job {job_dir.name}: {e}")
 
+    def _delete_world(self, job_dir: Path) -> bool:
+        """
+        Borra el directorio world del job si todavía existe.
+
+        Returns:
+            bool: False si se alcanzó el tope de borrados de la pasada (queda para la próxima)
+        """
+        world = job_dir / "world"
+        if not world.exists():
+            return True
+        if not self._take_deletion_slot():
+            return False
+        self._count("files_deleted", self._throttled_rmtree(world))
+        self._count("worlds_deleted")
+        logger.info(f"Directorio world eliminado correctamente: {world}")
+        return True
+
+    def _take_deletion_slot(self) -> bool:
+        if self.__maxDeletions <= 0:
+            return True
+        with self.__passLock:
+            if self.__deletionsLeft <= 0:
+                self.__passStats["deferred"] += 1
+                return False
+            self.__deletionsLeft -= 1
+            return True
+
+    def _throttled_rmtree(self, path: Path) -> int:
+        """
+        rmtree con ritmo limitado: borra de abajo hacia arriba respetando el máximo de archivos
+        por segundo compartido por todos los hilos.
+
+        Returns:
+            int: Cantidad de archivos borrados
+        """
+        if os.path.islink(path):
+            # Workspace que quedó en un directorio del warm pool: se borra el destino y el enlace
+            target = os.path.realpath(path)
+            deleted = self._throttled_rmtree(target) if os.path.isdir(target) else 0
+            os.unlink(path)
+            try:
+                # Directorio del contenedor del pool, si quedó vacío
+                os.rmdir(os.path.dirname(target))
+            except OSError:
+                pass
+            return deleted
+
+        deleted = 0
+        for root, dirs, files in os.walk(path, topdown=False):
+            for name in files:
+                self.__deleteLimiter.acquire()
+                os.unlink(os.path.join(root, name))
+                deleted += 1
+            for name in dirs:
+                dir_path = os.path.join(root, name)
+                if os.path.islink(dir_path):
+                    os.unlink(dir_path)
+                else:
+                    os.rmdir(dir_path)
+        os.rmdir(path)
+        return deleted
+
+    def _count(self, key: str, amount: int = 1):
+        with self.__passLock:
+            self.__passStats[key] = self.__passStats.get(key, 0) + amount
+
     def _get_running_containers(self):
         """Obtiene la lista actualizada de contenedores corriendo"""
         self.__containersUp = self.__dockerService.list_running_simulations()
@@ -0,0 +1,525 @@
+import re
+import json
+import sqlite3
+import threading
+import logging
+from pathlib import Path
+from datetime import datetime
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from Services.core.config import Config
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id          TEXT PRIMARY KEY,
+    job_num         INTEGER,
+    state           TEXT,
+    stage           TEXT,
+    container_name  TEXT,
+    container_id    TEXT,
+    created_at      TEXT,
+    init_timestamp  TEXT,
+    end_timestamp   TEXT,
+    updated_at      TEXT,
+    state_mtime_ns  INTEGER,
+    state_ino       INTEGER,
+    state_json      TEXT,
+    next_check_at   TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_state ON jobs(state, job_num);
+CREATE INDEX IF NOT EXISTS idx_jobs_created ON jobs(created_at);
+CREATE INDEX IF NOT EXISTS idx_jobs_updated ON jobs(updated_at);
+CREATE INDEX IF NOT EXISTS idx_jobs_container ON jobs(container_name);
+CREATE TABLE IF NOT EXISTS queue (
+    job_id          TEXT PRIMARY KEY,
+    status          TEXT NOT NULL,
+    priority        INTEGER NOT NULL DEFAULT 0,
+    seq             INTEGER,
+    wbt_path        TEXT,
+    owner           TEXT,
+    enqueued_at     TEXT,
+    updated_at      TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_queue_order ON queue(status, priority DESC, seq);
+CREATE TABLE IF NOT EXISTS leases (
+    name            TEXT PRIMARY KEY,
+    owner           TEXT,
+    updated_at      TEXT
+);
+"""
+
+# Estados de una entrada de la cola de admisión
+QUEUE_PREPARING = "PREPARING"
+QUEUE_QUEUED = "QUEUED"
+QUEUE_LAUNCHING = "LAUNCHING"
+QUEUE_COLUMNS = "job_id, status, priority, seq, wbt_path, owner, enqueued_at, updated_at"
+
+# Columnas devueltas en los listados (sin el documento completo de estado)
+LIST_COLUMNS = "job_id, state, stage, container_name, created_at, init_timestamp, end_timestamp, updated_at"
+
+ACTIVE_STATES = ("WAIT", "RUNNING")
+
+class JobIndexService:
+    """
+    Índice embebido (SQLite en modo WAL) de todos los jobs del Storage.
+
+    Guarda una copia del state.json de cada job junto con el mtime del archivo, de modo que
+    las consultas de estado solo hacen un stat() y únicamente vuelven a parsear el archivo
+    cuando el contenedor lo modificó. Permite listar y filtrar jobs por estado, antigüedad
+    o contenedor sin recorrer Storage/Jobs.
+    """
+
+    def __init__(self):
+        self.__config = Config()
+        self.__jobs_storage_path = Path(self.__config.get_storage_path())
+        self.__index_path = Path(self.__config.get_index_path())
+        self.__local = threading.local()
+        self.__index_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connection() as conn:
+            conn.executescript(SCHEMA)
+            # Índices creados antes de que state.json se escribiera con rename no tienen el inodo
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if "state_ino" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN state_ino INTEGER")
+            if "next_check_at" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN next_check_at TEXT")
+            if "container_id" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN container_id TEXT")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_next_check ON jobs(next_check_at)")
+
+    @contextmanager
+    def _immediate(self):
+        """Transacción que toma el lock de escritura al empezar (serializa a todos los procesos)."""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    def _connection(self) -> sqlite3.Connection:
+        """Conexión propia de cada hilo (el pipeline, el cleaner y los requests corren en hilos distintos)."""
+        conn = getattr(self.__local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.__index_path), timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.__local.conn = conn
+        return conn
+
+    # --- Escritura ---
+
+    def record_state(self, job_id: str, state: Dict, signature: Optional[Tuple[int, int]] = None):
+        """
+        Inserta o actualiza la fila del job a partir de su documento de estado. Cualquier cambio
+        de estado deja el job pendiente de revisión para el JobCleaner (next_check_at = NULL).
+
+        Args:
+            signature: (mtime_ns, inodo) del state.json indexado. StateService escribe con
+                       archivo temporal + rename, así que cada escritura cambia el inodo aunque
+                       dos escrituras caigan en el mismo tick de mtime.
+        """
+        mtime_ns, ino = signature if signature is not None else (None, None)
+        now = datetime.now().isoformat()
+        with self._connection() as conn:
+            conn.execute(
+                """
+                INSERT INTO jobs (job_id, job_num, state, stage, created_at, init_timestamp,
+                                  end_timestamp, updated_at, state_mtime_ns, state_ino, state_json)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(job_id) DO UPDATE SET
+                    state = excluded.state,
+                    stage = excluded.stage,
+                    init_timestamp = excluded.init_timestamp,
+                    end_timestamp = excluded.end_timestamp,
+                    updated_at = excluded.updated_at,
+                    state_mtime_ns = excluded.state_mtime_ns,
+                    state_ino = excluded.state_ino,
+                    state_json = excluded.state_json,
+                    next_check_at = NULL
+                """,
+                (job_id, self._job_number(job_id), state.get("state"), state.get("stage"),
+                 state.get("init_timestamp", now), state.get("init_timestamp"),
+                 state.get("end_timestamp"), now, mtime_ns, ino, json.dumps(state))
+            )
+
+    def record_state_file(self, state_path, state: Dict):
+        """
+        Listener para StateService: se invoca tras cada escritura de state.json en el host.
+        El job se deduce de la ruta Storage/Jobs/<job_id>/logs/state.json.
+        """
+        state_path = Path(state_path)
+        job_id = state_path.parent.parent.name
+        try:
+            signature = self._signature(state_path)
+        except OSError:
+            signature = None
+        self.record_state(job_id, state, signature)
+
+    def register_job(self, job_id: str):
+        """Da de alta un job recién creado, antes de que exista su state.json."""
+        now = datetime.now().isoformat()
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO jobs (job_id, job_num, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                (job_id, self._job_number(job_id), now, now)
+            )
+
+    def set_container(self, job_id: str, container_name: Optional[str], container_id: Optional[str] = None):
+        """Contenedor lanzado para el job; el ID permite descartar eventos de otros contenedores con el mismo nombre."""
+        with self._connection() as conn:
+            conn.execute(
+                "UPDATE jobs SET container_name = ?, container_id = ?, updated_at = ? WHERE job_id = ?",
+                (container_name, container_id, datetime.now().isoformat(), job_id)
+            )
+
+    def set_next_check(self, job_id: str, next_check_at: Optional[str]):
+        """Próxima vez que el JobCleaner tiene que revisar el job (ISO), p. ej. cuando vence su TTL."""
+        with self._connection() as conn:
+            conn.execute("UPDATE jobs SET next_check_at = ? WHERE job_id = ?", (next_check_at, job_id))
+
+    def delete(self, job_id: str):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+            conn.execute("DELETE FROM queue WHERE job_id = ?", (job_id,))
+
+    # --- Lectura ---
+
+    def get_state(self, job_id: str) -> Dict:
+        """
+        Devuelve el estado del job. Solo se relee state.json si su mtime cambió desde la
+        última vez que se indexó (por ejemplo, porque lo actualizó el contenedor).
+
+        Raises:
+            FileNotFoundError: Si el job no tiene state.json
+        """
+        state_path = self._state_path(job_id)
+        try:
+            signature = self._signature(state_path)
+        except FileNotFoundError:
+            raise FileNotFoundError(f"No existe state.json para el job {job_id}")
+
+        row = self._connection().execute(
+            "SELECT state_mtime_ns, state_ino, state_json FROM jobs WHERE job_id = ?", (job_id,)
+        ).fetchone()
+        if row is not None and (row["state_mtime_ns"], row["state_ino"]) == signature and row["state_json"]:
+            return json.loads(row["state_json"])
+
+        return self._refresh_from_file(job_id, state_path, signature)
+
+    def refresh_active(self) -> int:
+        """
+        Sincroniza los jobs activos (WAIT/RUNNING), que son los únicos cuyo state.json puede
+        cambiar desde el contenedor. Cuesta un stat() por job activo.
+
+        Returns:
+            int: Cantidad de jobs cuyo estado cambió
+        """
+        rows = self._connection().execute(
+            f"SELECT job_id, state_mtime_ns, state_ino FROM jobs WHERE state IN ({','.join('?' * len(ACTIVE_STATES))})",
+            ACTIVE_STATES
+        ).fetchall()
+
+        changed = 0
+        for row in rows:
+            state_path = self._state_path(row["job_id"])
+            try:
+                signature = self._signature(state_path)
+                if signature != (row["state_mtime_ns"], row["state_ino"]):
+                    self._refresh_from_file(row["job_id"], state_path, signature)
+                    changed += 1
+            except FileNotFoundError:
+                continue
+            except Exception as e:
+                logger.error(f"Error sincronizando el índice del job {row['job_id']}: {e}")
+        return changed
+
+    def list_jobs(self, state: Optional[str] = None, limit: int = 50, offset: int = 0,
+                  updated_before: Optional[str] = None, container_name: Optional[str] = None) -> Dict:
+        """Listado paginado de jobs, del más nuevo al más viejo."""
+        conditions, params = [], []
+        if state is not None:
+            conditions.append("state = ?")
+            params.append(state)
+        if updated_before is not None:
+            conditions.append("updated_at < ?")
+            params.append(updated_before)
+        if container_name is not None:
+            conditions.append("container_name = ?")
+            params.append(container_name)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        conn = self._connection()
+        total = conn.execute(f"SELECT COUNT(*) FROM jobs {where}", params).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT {LIST_COLUMNS} FROM jobs {where} ORDER BY job_num DESC LIMIT ? OFFSET ?",
+            params + [limit, offset]
+        ).fetchall()
+
+        return {"total": total, "limit": limit, "offset": offset, "items": [dict(row) for row in rows]}
+
+    def list_job_ids(self, states: Optional[List[Optional[str]]] = None) -> List[str]:
+        """IDs de jobs filtrados por estado. None dentro de states selecciona jobs sin state.json."""
+        conn = self._connection()
+        if states is None:
+            rows = conn.execute("SELECT job_id FROM jobs ORDER BY job_num").fetchall()
+        else:
+            named = [s for s in states if s is not None]
+            condition = f"state IN ({','.join('?' * len(named))})" if named else "0"
+            if None in states:
+                condition = f"({condition} OR state IS NULL)"
+            rows = conn.execute(f"SELECT job_id FROM jobs WHERE {condition} ORDER BY job_num", named).fetchall()
+        return [row["job_id"] for row in rows]
+
+    def list_due_job_ids(self, now: str) -> List[str]:
+        """
+        Jobs que el JobCleaner tiene que revisar en esta pasada: los RUNNING, los que no tienen
+        state.json, los que cambiaron de estado desde la última revisión y los que llegaron a su
+        próxima revisión (TTL). El resto no se toca hasta que cambie algo o venza su plazo.
+        """
+        rows = self._connection().execute(
+            """
+            SELECT job_id FROM jobs
+            WHERE state = 'RUNNING' OR state IS NULL OR next_check_at IS NULL OR next_check_at <= ?
+            ORDER BY job_num
+            """,
+            (now,)
+        ).fetchall()
+        return [row["job_id"] for row in rows]
+
+    def get_container_id(self, job_id: str) -> Optional[str]:
+        row = self._connection().execute(
+            "SELECT container_id FROM jobs WHERE job_id = ?", (job_id,)
+        ).fetchone()
+        return row["container_id"] if row else None
+
+    def find_by_container(self, container_name: str) -> Optional[str]:
+        row = self._connection().execute(
+            "SELECT job_id FROM jobs WHERE container_name = ?", (container_name,)
+        ).fetchone()
+        return row["job_id"] if row else None
+
+    def count_by_state(self) -> Dict[str, int]:
+        rows = self._connection().execute("SELECT state, COUNT(*) AS n FROM jobs GROUP BY state").fetchall()
+        return {row["state"]: row["n"] for row in rows}
+
+    # --- Cola de admisión ---
+    # La comparten todos los procesos de la API. Cada entrada pertenece al proceso que la está
+    # preparando o lanzando (owner), que renueva updated_at periódicamente; si deja de hacerlo
+    # (el proceso murió) otro proceso puede tomarla.
+
+    def queue_add(self, job_id: str, owner: str, priority: int = 0,
+                  status: str = QUEUE_PREPARING, wbt_path: Optional[str] = None) -> bool:
+        """
+        Agrega un job a la cola. Returns: False si el job ya tenía una entrada (otro proceso lo tomó).
+        """
+        now = datetime.now().isoformat()
+        with self._connection() as conn:
+            cursor = conn.execute(
+                f"""
+                INSERT OR IGNORE INTO queue ({QUEUE_COLUMNS})
+                VALUES (?, ?, ?, (SELECT COALESCE(MAX(seq), 0) + 1 FROM queue), ?, ?, ?, ?)
+                """,
+                (job_id, status, priority, wbt_path, owner, now, now)
+            )
+            return cursor.rowcount == 1
+
+    def queue_mark_ready(self, job_id: str, owner: str, wbt_path: str) -> bool:
+        """
+        Pasa un job preparado a la espera de un slot, al final de su prioridad.
+        Returns: False si la entrada ya no pertenece a este proceso (p. ej. el job se canceló).
+        """
+        now = datetime.now().isoformat()
+        with self._connection() as conn:
+            cursor = conn.execute(
+                """
+                UPDATE queue SET status = ?, wbt_path = ?, owner = NULL, enqueued_at = ?, updated_at = ?,
+                                 seq = (SELECT COALESCE(MAX(seq), 0) + 1 FROM queue)
+                WHERE job_id = ? AND owner = ? AND status = ?
+                """,
+                (QUEUE_QUEUED, wbt_path, now, now, job_id, owner, QUEUE_PREPARING)
+            )
+            return cursor.rowcount == 1
+
+    def queue_requeue(self, job_id: str):
+        """Devuelve a la espera un job cuyo lanzamiento quedó a medias."""
+        with self._connection() as conn:
+            conn.execute(
+                "UPDATE queue SET status = ?, owner = NULL, updated_at = ? WHERE job_id = ?",
+                (QUEUE_QUEUED, datetime.now().isoformat(), job_id)
+            )
+
+    def queue_remove(self, job_id: str) -> bool:
+        with self._connection() as conn:
+            return conn.execute("DELETE FROM queue WHERE job_id = ?", (job_id,)).rowcount == 1
+
+    def queue_claim_launches(self, owner: str, admission: Callable[[Set[str]], Callable[[str], bool]]) -> List[Dict]:
+        """
+        Toma para lanzar los primeros jobs en espera, mientras entren en los recursos libres.
+
+        Todo ocurre en una transacción con el lock de escritura tomado, así que dos procesos
+        no pueden contar los mismos recursos libres. Se respeta el orden de la cola: si el
+        primer job no entra, no se adelantan los siguientes.
+
+        Args:
+            admission: Función que recibe los jobs que algún proceso está lanzando y devuelve
+                       otra que, para cada job en espera, dice si entra y descuenta sus recursos
+                       (se consulta dentro de la transacción)
+        """
+        now = datetime.now().isoformat()
+        with self._immediate() as conn:
+            launching = {row["job_id"] for row in conn.execute(
+                "SELECT job_id FROM queue WHERE status = ?", (QUEUE_LAUNCHING,))}
+            fits = admission(launching)
+            rows = conn.execute(
+                f"SELECT {QUEUE_COLUMNS} FROM queue WHERE status = ? ORDER BY priority DESC, seq",
+                (QUEUE_QUEUED,)
+            ).fetchall()
+            taken = []
+            for row in rows:
+                if not fits(row["job_id"]):
+                    break
+                conn.execute(
+                    "UPDATE queue SET status = ?, owner = ?, updated_at = ? WHERE job_id = ?",
+                    (QUEUE_LAUNCHING, owner, now, row["job_id"])
+                )
+                taken.append(dict(row))
+            return taken
+
+    def queue_heartbeat(self, owner: str):
+        """Renueva las entradas que este proceso está preparando o lanzando."""
+        with self._connection() as conn:
+            conn.execute("UPDATE queue SET updated_at = ? WHERE owner = ?", (datetime.now().isoformat(), owner))
+
+    def queue_release(self, owner: str):
+        """Marca como abandonadas las entradas del proceso, para que otro las tome enseguida."""
+        with self._connection() as conn:
+            conn.execute("UPDATE queue SET updated_at = '' WHERE owner = ?", (owner,))
+
+    def queue_take_over(self, owner: str, stale_before: str) -> List[Dict]:
+        """
+        Toma las entradas en preparación o lanzamiento cuyo dueño no las renueva desde
+        stale_before. Cada entrada la toma un solo proceso (compare-and-swap sobre owner/updated_at).
+        """
+        conn = self._connection()
+        rows = conn.execute(
+            f"SELECT {QUEUE_COLUMNS} FROM queue WHERE status IN (?, ?) AND updated_at < ?",
+            (QUEUE_PREPARING, QUEUE_LAUNCHING, stale_before)
+        ).fetchall()
+        taken = []
+        now = datetime.now().isoformat()
+        for row in rows:
+            with conn:
+                cursor = conn.execute(
+                    "UPDATE queue SET owner = ?, updated_at = ? WHERE job_id = ? AND owner IS ? AND updated_at IS ?",
+                    (owner, now, row["job_id"], row["owner"], row["updated_at"])
+                )
+            if cursor.rowcount == 1:
+                taken.append(dict(row))
+        return taken
+
+    # --- Leases ---
+    # Tareas que debe hacer un solo proceso de la API a la vez (p. ej. aplicar los eventos de
+    # Docker). Igual que en la cola, el dueño renueva updated_at y otro proceso puede tomar el
+    # lease cuando deja de hacerlo.
+
+    def lease_acquire(self, name: str, owner: str, stale_before: str) -> bool:
+        """
+        Toma o renueva el lease. Returns: True si queda a nombre de owner (ya lo tenía, estaba
+        libre o su dueño no lo renueva desde stale_before).
+        """
+        now = datetime.now().isoformat()
+        with self._immediate() as conn:
+            row = conn.execute("SELECT owner, updated_at FROM leases WHERE name = ?", (name,)).fetchone()
+            if row is not None and row["owner"] != owner and row["updated_at"] >= stale_before:
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO leases (name, owner, updated_at) VALUES (?, ?, ?)",
+                (name, owner, now)
+            )
+            return True
+
+    def lease_release(self, owner: str):
+        """Libera los leases del proceso, para que otro los tome enseguida."""
+        with self._connection() as conn:
+            conn.execute("UPDATE leases SET updated_at = '' WHERE owner = ?", (owner,))
+
+    def list_queue(self) -> List[Dict]:
+        """Entradas de la cola: primero las en espera, en el orden en que se lanzarán."""
+        rows = self._connection().execute(
+            f"""
+            SELECT {QUEUE_COLUMNS} FROM queue
+            ORDER BY status = ? DESC, priority DESC, seq
+            """,
+            (QUEUE_QUEUED,)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def list_stalled_jobs(self, updated_before: str) -> List[str]:
+        """
+        Jobs en WAIT sin entrada en la cola ni contenedor, sin cambios desde updated_before:
+        su preparación se perdió (p. ej. la API se reinició) y hay que retomarla.
+        """
+        rows = self._connection().execute(
+            """
+            SELECT job_id FROM jobs
+            WHERE state = 'WAIT' AND container_name IS NULL AND updated_at < ?
+              AND job_id NOT IN (SELECT job_id FROM queue)
+            ORDER BY job_num
+            """,
+            (updated_before,)
+        ).fetchall()
+        return [row["job_id"] for row in rows]
+
+    # --- Mantenimiento ---
+
+    def reconcile(self) -> None:
+        """
+        Alinea el índice con Storage/Jobs: importa jobs creados antes de existir el índice
+        y borra filas de jobs cuyo directorio ya no existe. Se ejecuta una vez al arrancar.
+        """
+        if not self.__jobs_storage_path.exists():
+            return
+
+        on_disk = {d.name for d in self.__jobs_storage_path.iterdir() if d.is_dir() and d.name.startswith('job_')}
+        indexed = set(self.list_job_ids())
+
+        for job_id in on_disk - indexed:
+            self.register_job(job_id)
+            state_path = self._state_path(job_id)
+            try:
+                self._refresh_from_file(job_id, state_path, self._signature(state_path))
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logger.error(f"Error indexando el job {job_id}: {e}")
+
+        for job_id in indexed - on_disk:
+            self.delete(job_id)
+
+        logger.info(f"Índice de jobs reconciliado: {len(on_disk - indexed)} importados, "
+                    f"{len(indexed - on_disk)} eliminados")
+
+    def _refresh_from_file(self, job_id: str, state_path: Path, signature: Tuple[int, int]) -> Dict:
+        with open(state_path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        self.record_state(job_id, state, signature)
+        return state
+
+    @staticmethod
+    def _signature(path: Path) -> Tuple[int, int]:
+        stat = path.stat()
+        return stat.st_mtime_ns, stat.st_ino
+
+    def _state_path(self, job_id: str) -> Path:
+        return self.__jobs_storage_path / job_id / "logs" / "state.json"
+
+    @staticmethod
+    def _job_number(job_id: str) -> int:
+        match = re.match(r'^job_(\d+)$', job_id)
+        return int(match.group(1)) if match else 0
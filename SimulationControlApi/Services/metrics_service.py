@@ -0,0 +1,328 @@
+import os
+import json
+import asyncio
+import logging
+import threading
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin locks advisory entre procesos
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Sufijo del índice de offsets que acompaña a training_metrics.jsonl
+INDEX_SUFFIX = ".idx"
+# Bytes por entrada del índice (offset de fin de línea, uint64)
+INDEX_ENTRY_SIZE = 8
+# Bloque leído al indexar el archivo de métricas
+SCAN_BLOCK_SIZE = 1024 * 1024
+# Registros leídos por tanda al reenviar historial
+REPLAY_CHUNK_SIZE = 1000
+# Líneas que se avanzan buscando un registro válido durante una búsqueda binaria
+PROBE_LIMIT = 16
+# Índices que se mantienen en memoria (los menos usados se descartan; siguen en disco)
+MAX_CACHED_INDEXES = 128
+
+class MetricsIndex:
+    """
+    Índice en disco de training_metrics.jsonl: un uint64 por línea completa con el offset
+    donde termina esa línea. El número de línea es el número de secuencia (seq) del registro,
+    de modo que cualquier rango de seq se lee con un seek, sin recorrer el historial.
+
+    El índice se extiende en forma incremental: solo se escanean los bytes agregados desde
+    la última actualización. Se comparte una instancia por archivo (ver for_path) y entre
+    procesos se serializa con flock sobre el propio archivo de índice.
+
+    Las lecturas no toman el lock: trabajan sobre una referencia a los offsets tomada al
+    comienzo, que update solo hace crecer o reemplaza por un array nuevo.
+    """
+
+    __instances: "OrderedDict[str, MetricsIndex]" = OrderedDict()
+    __instances_lock = threading.Lock()
+
+    @classmethod
+    def for_path(cls, metrics_path) -> "MetricsIndex":
+        # Sin resolve: el workspace de un job puede estar detrás de un symlink (warm pool)
+        key = os.path.abspath(metrics_path)
+        with cls.__instances_lock:
+            index = cls.__instances.get(key)
+            if index is None:
+                index = cls(metrics_path)
+                cls.__instances[key] = index
+                while len(cls.__instances) > MAX_CACHED_INDEXES:
+                    cls.__instances.popitem(last=False)
+            else:
+                cls.__instances.move_to_end(key)
+            return index
+
+    @classmethod
+    def drop(cls, metrics_path):
+        """Descarta el índice en memoria de un archivo (p. ej. al borrar el job)"""
+        with cls.__instances_lock:
+            cls.__instances.pop(os.path.abspath(metrics_path), None)
+
+    def __init__(self, metrics_path):
+        self.__metrics_path = Path(metrics_path)
+        self.__index_path = self.__metrics_path.with_name(self.__metrics_path.name + INDEX_SUFFIX)
+        self.__ends = array('Q')
+        self.__lock = threading.Lock()
+
+    def update(self) -> int:
+        """
+        Indexa las líneas completas agregadas desde la última vez.
+
+        Returns:
+            int: Cantidad total de registros indexados
+        """
+        with self.__lock:
+            try:
+                size = os.path.getsize(self.__metrics_path)
+            except FileNotFoundError:
+                self.__ends = array('Q')
+                return 0
+
+            with open(self.__index_path, 'a+b') as index_file:
+                if fcntl is not None:
+                    fcntl.flock(index_file.fileno(), fcntl.LOCK_EX)
+                try:
+                    self._load_new_entries(index_file)
+                    if not self._is_consistent(size):
+                        logger.info(f"{self.__metrics_path} fue truncado o reemplazado, se reconstruye el índice")
+                        index_file.truncate(0)
+                        self.__ends = array('Q')
+                    self._scan(index_file, size)
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(index_file.fileno(), fcntl.LOCK_UN)
+            return len(self.__ends)
+
+    def count(self) -> int:
+        return len(self.__ends)
+
+    def byte_range(self, start_seq: int, end_seq: int) -> Tuple[int, int]:
+        """
+        Offsets [inicio, fin) en el archivo de los registros start_seq..end_seq-1. El rango se
+        acota a los registros indexados: fuera de ellos el rango queda vacío.
+        """
+        return self._byte_range(self.__ends, start_seq, end_seq)
+
+    def read_records(self, start_seq: int, end_seq: Optional[int] = None) -> List[Dict]:
+        """Lee los registros con seq en [start_seq, end_seq), cada uno con su campo "seq"."""
+        ends = self.__ends
+        end_seq = len(ends) if end_seq is None else min(end_seq, len(ends))
+        start_seq = max(start_seq, 0)
+        if start_seq >= end_seq:
+            return []
+        start, end = self._byte_range(ends, start_seq, end_seq)
+        with open(self.__metrics_path, 'rb') as f:
+            f.seek(start)
+            data = f.read(end - start)
+        return decode_lines(data.split(b"\n")[:end_seq - start_seq], start_seq, self.__metrics_path)
+
+    def iter_records(self, start_seq: int, end_seq: int, chunk_size: int = REPLAY_CHUNK_SIZE):
+        """Recorre los registros de [start_seq, end_seq) leyendo de a chunk_size líneas."""
+        for start in range(start_seq, end_seq, chunk_size):
+            yield from self.read_records(start, min(start + chunk_size, end_seq))
+
+    def bisect(self, field: str, value, right: bool = False, lo: int = 0, hi: Optional[int] = None) -> int:
+        """
+        Primer seq cuyo campo es >= value (> value con right=True). Asume que el campo crece
+        con el seq, como total_timesteps o episodes. Cada paso lee un solo registro.
+        """
+        hi = self.count() if hi is None else hi
+        while lo < hi:
+            mid = (lo + hi) // 2
+            current = self._probe(mid, hi, field)
+            if current is not None and (current <= value if right else current < value):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _probe(self, seq: int, hi: int, field: str):
+        """Valor del campo en seq, o en la próxima línea válida que lo tenga"""
+        for record in self.read_records(seq, min(seq + PROBE_LIMIT, hi)):
+            if field in record:
+                return record[field]
+        return None
+
+    @staticmethod
+    def _byte_range(ends, start_seq: int, end_seq: int) -> Tuple[int, int]:
+        end_seq = min(max(end_seq, 0), len(ends))
+        start_seq = min(max(start_seq, 0), end_seq)
+        start = ends[start_seq - 1] if start_seq > 0 else 0
+        end = ends[end_seq - 1] if end_seq > 0 else 0
+        return start, end
+
+    def _load_new_entries(self, index_file):
+        """Incorpora entradas que otro proceso haya agregado al índice"""
+        index_file.seek(0, os.SEEK_END)
+        entries = index_file.tell() // INDEX_ENTRY_SIZE
+        if entries < len(self.__ends):
+            # Otro proceso reconstruyó el índice
+            self.__ends = array('Q')
+        if entries > len(self.__ends):
+            index_file.seek(len(self.__ends) * INDEX_ENTRY_SIZE)
+            self.__ends.frombytes(index_file.read((entries - len(self.__ends)) * INDEX_ENTRY_SIZE))
+
+    def _is_consistent(self, size: int) -> bool:
+        """El último offset indexado tiene que seguir siendo un fin de línea dentro del archivo"""
+        if not self.__ends:
+            return True
+        last_end = self.__ends[-1]
+        if last_end > size:
+            return False
+        with open(self.__metrics_path, 'rb') as f:
+            f.seek(last_end - 1)
+            return f.read(1) == b"\n"
+
+    def _scan(self, index_file, size: int):
+        position = self.__ends[-1] if self.__ends else 0
+        if position >= size:
+            return
+        new_ends = array('Q')
+        with open(self.__metrics_path, 'rb') as f:
+            f.seek(position)
+            while position < size:
+                block = f.read(min(SCAN_BLOCK_SIZE, size - position))
+                if not block:
+                    break
+                newline = block.find(b"\n")
+                while newline != -1:
+                    new_ends.append(position + newline + 1)
+                    newline = block.find(b"\n", newline + 1)
+                position += len(block)
+        if new_ends:
+            index_file.seek(0, os.SEEK_END)
+            index_file.write(new_ends.tobytes())
+            index_file.flush()
+            self.__ends.extend(new_ends)
+
+
+class MetricsTailer:
+    """
+    Sigue el archivo training_metrics.jsonl de un job como `tail -f`.
+
+    Es un cursor sobre el MetricsIndex del archivo: recuerda el seq del próximo registro y en
+    cada cambio solo lee lo agregado. Las líneas incompletas (el contenedor todavía está
+    escribiendo) no se indexan hasta que llegue el salto de línea.
+    """
+
+    def __init__(self, file_path):
+        self.__index = MetricsIndex.for_path(file_path)
+        self.__next_seq = 0
+        self.__lock = asyncio.Lock()
+
+    async def read_new_records(self) -> List[Dict]:
+        """
+        Devuelve los registros completos agregados desde la última lectura, en orden.
+        """
+        async with self.__lock:
+            count = await asyncio.to_thread(self.__index.update)
+            if count < self.__next_seq:
+                logger.info("El archivo de métricas fue truncado o reemplazado, se relee desde el inicio")
+                self.__next_seq = 0
+            if count == self.__next_seq:
+                return []
+            records = await asyncio.to_thread(self.__index.read_records, self.__next_seq, count)
+            self.__next_seq = count
+            return records
+
+    async def read_last_record(self) -> Optional[Dict]:
+        """
+        Lee solo el último registro completo y deja el cursor al final, de modo que las
+        lecturas siguientes devuelvan únicamente lo nuevo.
+        """
+        async with self.__lock:
+            count = await asyncio.to_thread(self.__index.update)
+            self.__next_seq = count
+            # Retroceder sobre líneas vacías o inválidas al final del archivo
+            for seq in range(count - 1, max(count - 16, 0) - 1, -1):
+                records = await asyncio.to_thread(self.__index.read_records, seq, seq + 1)
+                if records:
+                    return records[0]
+            return None
+
+    async def read_range(self, start_seq: int, end_seq: int) -> List[Dict]:
+        """Registros ya indexados con seq en [start_seq, end_seq), para reenviar historial."""
+        return await asyncio.to_thread(self.__index.read_records, start_seq, end_seq)
+
+    def get_next_seq(self) -> int:
+        return self.__next_seq
+
+
+def decode_lines(lines, first_seq: int, source) -> List[Dict]:
+    """Decodifica líneas JSONL asignando a cada registro su seq (número de línea)."""
+    records = []
+    for seq, line in enumerate(lines, start=first_seq):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            logger.warning(f"Línea de métricas inválida en {source}: {e}")
+            continue
+        record["seq"] = seq
+        records.append(record)
+    return records
+
+
+def project(record: Dict, fields: Optional[List[str]]) -> Dict:
+    """Deja solo los campos pedidos (más seq)"""
+    if not fields:
+        return record
+    return {key: record[key] for key in ["seq", *fields] if key in record}
+
+
+def downsample_minmax(records: List[Dict], field: str, points: int) -> List[Dict]:
+    """Divide la serie en buckets y conserva el mínimo y el máximo de cada uno, en orden."""
+    records = [r for r in records if isinstance(r.get(field), (int, float))]
+    buckets = max(points // 2, 1)
+    if len(records) <= points:
+        return records
+    size = -(-len(records) // buckets)
+    sampled = []
+    for start in range(0, len(records), size):
+        bucket = records[start:start + size]
+        low = min(bucket, key=lambda r: r[field])
+        high = max(bucket, key=lambda r: r[field])
+        sampled.extend(sorted({id(low): low, id(high): high}.values(), key=lambda r: r["seq"]))
+    return sampled
+
+
+def downsample_lttb(records: List[Dict], x_field: str, y_field: str, points: int) -> List[Dict]:
+    """Largest-Triangle-Three-Buckets: conserva la forma de la curva con `points` puntos."""
+    records = [r for r in records if isinstance(r.get(y_field), (int, float))]
+    if points < 3 or len(records) <= points:
+        return records
+
+    def x(record):
+        return record.get(x_field, record["seq"])
+
+    sampled = [records[0]]
+    bucket_size = (len(records) - 2) / (points - 2)
+    previous = records[0]
+    for i in range(points - 2):
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+        # Promedio del bucket siguiente (o el último punto)
+        next_bucket = records[end:min(int((i + 2) * bucket_size) + 1, len(records) - 1)] or [records[-1]]
+        avg_x = sum(x(r) for r in next_bucket) / len(next_bucket)
+        avg_y = sum(r[y_field] for r in next_bucket) / len(next_bucket)
+
+        best, best_area = None, -1.0
+        for record in records[start:end]:
+            area = abs((x(previous) - avg_x) * (record[y_field] - previous[y_field])
+                       - (x(previous) - x(record)) * (avg_y - previous[y_field]))
+            if area > best_area:
+                best, best_area = record, area
+        sampled.append(best)
+        previous = best
+    sampled.append(records[-1])
+    return sampled
@@ -0,0 +1,146 @@
+import os
+import json
+import logging
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
+from Services.core.config import Config
+
+logger = logging.getLogger(__name__)
+
+# Variables que limitan los hilos de torch/BLAS dentro del contenedor
+THREAD_ENV_VARS = ["OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "TORCH_NUM_THREADS"]
+# Período de CFS usado para expresar la cuota de CPU al actualizar un contenedor
+CPU_PERIOD_US = 100000
+
+class ResourceService:
+    """
+    Perfiles de recursos de los contenedores Webots.
+
+    Cada job puede pedir núcleos y memoria en train_config.json ("resources": {"cpus": 2,
+    "memory_gb": 4}); lo que no pida toma los valores de CPUS_PER_JOB / MEMORY_PER_JOB_GB, y
+    lo pedido se acota a MAX_CPUS_PER_JOB / MAX_MEMORY_PER_JOB_GB. Los núcleos se asignan como
+    cpusets disjuntos entre los jobs en ejecución, y torch/BLAS usan tantos hilos como núcleos
+    tenga el job, para que varios jobs en paralelo no se disputen los mismos núcleos.
+    """
+
+    def __init__(self):
+        config = Config()
+        self.__jobs_storage_path = Path(config.get_storage_path())
+        self.__defaults = config.get_scheduler_config()
+        self.__policy = config.get_resource_config()
+
+    def get_job_profile(self, job_id: str) -> Dict:
+        """
+        Returns:
+            Dict: {"cpus": int, "memory_gb": float} ya acotados por la política del servidor
+        """
+        requested = {}
+        n_envs = 1
+        config_path = self.__jobs_storage_path / job_id / "config" / "train_config.json"
+        try:
+            with open(config_path, "r", encoding="utf-8") as f:
+                train_config = json.load(f)
+            requested = train_config.get("resources") or {}
+            n_envs = int(train_config.get("n_envs", 1))
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            logger.warning(f"No se pudieron leer los recursos pedidos por el job {job_id}: {e}")
+
+        try:
+            # Con entornos vectorizados cada instancia de Webots necesita su propio núcleo
+            default_cpus = max(self.__defaults["cpus_per_job"], n_envs)
+            cpus = int(requested.get("cpus", default_cpus))
+            memory_gb = float(requested.get("memory_gb", self.__defaults["memory_per_job_gb"]))
+        except (TypeError, ValueError):
+            logger.warning(f"Recursos inválidos en la configuración del job {job_id}, se usan los valores por defecto")
+            cpus = self.__defaults["cpus_per_job"]
+            memory_gb = self.__defaults["memory_per_job_gb"]
+
+        return {
+            "cpus": min(max(cpus, 1), self.__policy["max_cpus_per_job"], len(_host_cpus())),
+            "memory_gb": min(max(memory_gb, 0.5), self.__policy["max_memory_per_job_gb"]),
+        }
+
+    def allocate_cpuset(self, cpus: int, used_cpusets: Iterable[str]) -> Optional[str]:
+        """
+        Elige `cpus` núcleos que no use ningún otro job en ejecución.
+
+        Returns:
+            str | None: cpuset en formato Docker ("0-3,6"), o None si el pinning está
+                        deshabilitado o no quedan núcleos libres suficientes (el job corre
+                        igual, limitado solo por cuota de CPU)
+        """
+        if not self.__policy["pin_cpus"]:
+            return None
+
+        used = set()
+        for spec in used_cpusets:
+            used |= parse_cpuset(spec)
+        free = [cpu for cpu in _host_cpus() if cpu not in used]
+        if len(free) < cpus:
+            logger.warning(f"Solo quedan {len(free)} núcleos libres y el job pide {cpus}, se lanza sin fijar núcleos")
+            return None
+        return format_cpuset(free[:cpus])
+
+    def get_run_limits(self, profile: Dict, cpuset: Optional[str]) -> Dict:
+        """Argumentos de límites para containers.run"""
+        memory = f"{int(profile['memory_gb'] * 1024)}m"
+        limits = {
+            "nano_cpus": int(profile["cpus"] * 1e9),
+            "mem_limit": memory,
+            "memswap_limit": memory,
+            "pids_limit": self.__policy["pids_per_job"],
+        }
+        if cpuset:
+            limits["cpuset_cpus"] = cpuset
+        return limits
+
+    def get_update_limits(self, profile: Dict, cpuset: Optional[str]) -> Dict:
+        """Argumentos de límites para container.update (contenedores del warm pool ya iniciados)"""
+        memory = f"{int(profile['memory_gb'] * 1024)}m"
+        limits = {
+            "cpu_period": CPU_PERIOD_US,
+            "cpu_quota": int(profile["cpus"] * CPU_PERIOD_US),
+            "mem_limit": memory,
+            "memswap_limit": memory,
+        }
+        if cpuset:
+            limits["cpuset_cpus"] = cpuset
+        return limits
+
+    def get_pids_limit(self) -> int:
+        return self.__policy["pids_per_job"]
+
+    @staticmethod
+    def get_thread_environment(profile: Dict) -> Dict[str, str]:
+        """Limita los hilos de OpenMP/MKL/OpenBLAS/torch a los núcleos del job"""
+        return {name: str(profile["cpus"]) for name in THREAD_ENV_VARS}
+
+
+def parse_cpuset(spec: Optional[str]) -> Set[int]:
+    """"0-3,6" -> {0, 1, 2, 3, 6}"""
+    cpus = set()
+    for part in (spec or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        cpus.update(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def format_cpuset(cpus: Iterable[int]) -> str:
+    """[0, 1, 2, 3, 6] -> "0-3,6" """
+    ranges: List[List[int]] = []
+    for cpu in sorted(cpus):
+        if ranges and cpu == ranges[-1][1] + 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ",".join(str(a) if a == b else f"{a}-{b}" for a, b in ranges)
+
+
+def _host_cpus() -> List[int]:
+    """Núcleos disponibles para este proceso (respeta el affinity si la API corre acotada)"""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
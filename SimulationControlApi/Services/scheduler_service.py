@@ -0,0 +1,276 @@
+import os
+import uuid
+import threading
+import logging
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from Services.core.config import Config
+from Services.job_index_service import JobIndexService, QUEUE_PREPARING, QUEUE_QUEUED, QUEUE_LAUNCHING
+
+logger = logging.getLogger(__name__)
+
+JOB_CONTAINER_PREFIX = "webots_job_"
+# Tiempo mínimo sin renovar una entrada de la cola para considerar muerto a su proceso dueño
+MIN_LEASE_SECONDS = 120
+# Lease del proceso que aplica las salidas de contenedores informadas por Docker
+EVENTS_LEASE = "container_events"
+
+class SchedulerService:
+    """
+    Planificador de jobs de simulación.
+
+    Responsabilidades:
+    - Preparar los jobs (extracción, validación, parcheo) en un pool de hilos acotado
+    - Mantener una cola persistente de jobs en WAIT ordenada por prioridad y orden de llegada
+    - Lanzar contenedores solo cuando los núcleos y la RAM libres del host alcanzan para el
+      perfil de recursos del job (ver ResourceService): un job con n_envs > 1 o que pide más
+      núcleos ocupa más capacidad que uno por defecto
+
+    La cola vive en el índice SQLite de jobs y la comparten todos los procesos de la API: los
+    slots libres se cuentan y se toman dentro de una misma transacción, y cada proceso renueva
+    las entradas que está preparando o lanzando. Si un proceso muere, otro retoma sus entradas
+    cuando vence el plazo, y los jobs en WAIT que quedaron fuera de la cola se vuelven a preparar.
+    """
+
+    def __init__(self, launcher: Callable[[str, str], None], running_jobs: Callable[[], List[str]],
+                 resume: Optional[Callable[[str], Tuple[Callable[[], str], int]]] = None,
+                 job_index: Optional[JobIndexService] = None,
+                 profile: Optional[Callable[[str], Dict]] = None):
+        """
+        Args:
+            launcher: Función que lanza el contenedor de un job (job_id, ruta absoluta al .wbt)
+            running_jobs: Función que devuelve los contenedores de simulación en ejecución
+            resume: Función que, para un job cuya preparación se perdió, devuelve
+                    (función de preparación, prioridad)
+            job_index: Índice de jobs donde se guarda la cola
+            profile: Función que devuelve {"cpus", "memory_gb"} de un job; sin ella todos los
+                     jobs usan CPUS_PER_JOB / MEMORY_PER_JOB_GB
+        """
+        self.__config = Config()
+        self.__scheduler_config = self.__config.get_scheduler_config()
+        self.__launcher = launcher
+        self.__running_jobs = running_jobs
+        self.__resume = resume
+        self.__job_index = job_index or JobIndexService()
+        self.__profile = profile or self._default_profile
+        self.__owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.__lease = timedelta(seconds=max(MIN_LEASE_SECONDS, 10 * self.__scheduler_config["dispatch_interval_seconds"]))
+        self.__dispatch_lock = threading.Lock()
+        self.__max_concurrent_jobs = self._compute_max_concurrent_jobs()
+        self.__capacity = self._compute_capacity()
+        self.__prepare_pool = ThreadPoolExecutor(
+            max_workers=self.__scheduler_config["prepare_workers"],
+            thread_name_prefix="job_prepare"
+        )
+
+        queued = sum(1 for entry in self.__job_index.list_queue() if entry["status"] == QUEUE_QUEUED)
+        logger.info(f"Scheduler inicializado: {self.__max_concurrent_jobs} jobs concurrentes, "
+                    f"{queued} jobs en cola")
+
+    def submit(self, job_id: str, prepare: Callable[[], str], priority: int = 0):
+        """
+        Encola la preparación del job en el pool de hilos. Cuando termina, el job pasa a la
+        cola de espera hasta que haya un slot libre.
+
+        Args:
+            job_id: ID del job
+            prepare: Función que prepara el job y devuelve la ruta absoluta al .wbt (None si falló)
+            priority: Prioridad del job (mayor valor se lanza antes)
+        """
+        if not self.__job_index.queue_add(job_id, self.__owner, priority):
+            logger.warning(f"El job {job_id} ya está en la cola, no se vuelve a preparar")
+            return
+        self._start_preparation(job_id, prepare)
+
+    def holds_events_lease(self) -> bool:
+        """
+        Indica si este proceso es el que aplica los eventos de Docker (cada proceso de la API
+        sigue el stream, pero cada salida se registra una sola vez). Toma el lease si su dueño
+        dejó de renovarlo; las salidas que se pierdan mientras tanto las detecta el JobCleaner.
+        """
+        stale_before = (datetime.now() - self.__lease).isoformat()
+        try:
+            return self.__job_index.lease_acquire(EVENTS_LEASE, self.__owner, stale_before)
+        except Exception as e:
+            logger.error(f"No se pudo renovar el lease de eventos: {e}")
+            return False
+
+    def remove(self, job_id: str) -> bool:
+        """Quita un job de la cola de espera (por ejemplo, al cancelarlo)."""
+        return self.__job_index.queue_remove(job_id)
+
+    def dispatch(self):
+        """
+        Lanza tantos jobs de la cola como slots libres haya. Se ejecuta al encolar y
+        periódicamente desde el scheduler de la API para detectar slots liberados; de paso
+        renueva las entradas de este proceso y retoma las abandonadas.
+        """
+        with self.__dispatch_lock:
+            try:
+                self.recover()
+                to_launch = self.__job_index.queue_claim_launches(self.__owner, self._admission)
+            except Exception as e:
+                logger.error(f"No se pudo revisar la cola de jobs: {e}")
+                return
+
+            for entry in to_launch:
+                try:
+                    logger.info(f"Slot libre: lanzando job {entry['job_id']}")
+                    self.__launcher(entry["job_id"], entry["wbt_path"])
+                except Exception as e:
+                    logger.error(f"Error lanzando el job {entry['job_id']}: {e}")
+                finally:
+                    self.__job_index.queue_remove(entry["job_id"])
+
+    def recover(self):
+        """
+        Renueva las entradas y el lease propios y retoma el trabajo perdido: entradas cuyo proceso dejó
+        de renovarlas y jobs en WAIT que no están en la cola ni tienen contenedor.
+        """
+        self.__job_index.queue_heartbeat(self.__owner)
+        self.holds_events_lease()
+        stale_before = (datetime.now() - self.__lease).isoformat()
+
+        for entry in self.__job_index.queue_take_over(self.__owner, stale_before):
+            job_id = entry["job_id"]
+            if entry["status"] == QUEUE_LAUNCHING:
+                if f"{JOB_CONTAINER_PREFIX}{job_id}" in self._running_names():
+                    self.__job_index.queue_remove(job_id)
+                else:
+                    logger.warning(f"El lanzamiento del job {job_id} quedó a medias, vuelve a la cola")
+                    self.__job_index.queue_requeue(job_id)
+            elif self.__resume is not None:
+                logger.warning(f"La preparación del job {job_id} quedó a medias, se retoma")
+                prepare, _ = self.__resume(job_id)
+                self._start_preparation(job_id, prepare)
+
+        if self.__resume is None:
+            return
+        for job_id in self.__job_index.list_stalled_jobs(stale_before):
+            prepare, priority = self.__resume(job_id)
+            if self.__job_index.queue_add(job_id, self.__owner, priority):
+                logger.warning(f"El job {job_id} quedó en WAIT fuera de la cola, se retoma su preparación")
+                self._start_preparation(job_id, prepare)
+
+    def get_queue(self) -> Dict:
+        """Devuelve la cola de espera y la ocupación de slots."""
+        try:
+            running = len(self.__running_jobs())
+        except Exception:
+            running = None
+
+        entries = self.__job_index.list_queue()
+        queued = [
+            {key: entry[key] for key in ("job_id", "wbt_path", "priority", "seq", "enqueued_at")}
+            for entry in entries if entry["status"] == QUEUE_QUEUED
+        ]
+        for position, entry in enumerate(queued, start=1):
+            entry["position"] = position
+
+        return {
+            "max_concurrent_jobs": self.__max_concurrent_jobs,
+            "capacity": self.__capacity,
+            "running": running,
+            "preparing": sorted(entry["job_id"] for entry in entries if entry["status"] == QUEUE_PREPARING),
+            "launching": sorted(entry["job_id"] for entry in entries if entry["status"] == QUEUE_LAUNCHING),
+            "queued": queued
+        }
+
+    def shutdown(self):
+        """
+        Termina las preparaciones en curso y descarta las que no empezaron. Las entradas que
+        quedan a nombre de este proceso (y sus leases) se liberan para que otro proceso las
+        retome enseguida.
+        """
+        self.__prepare_pool.shutdown(wait=True, cancel_futures=True)
+        self.__job_index.queue_release(self.__owner)
+        self.__job_index.lease_release(self.__owner)
+
+    def _start_preparation(self, job_id: str, prepare: Callable[[], str]):
+        def prepare_and_enqueue():
+            try:
+                wbt_path = prepare()
+            except Exception as e:
+                logger.error(f"Error preparando el job {job_id}: {e}")
+                wbt_path = None
+
+            if wbt_path is None:
+                self.__job_index.queue_remove(job_id)
+                return
+            if not self.__job_index.queue_mark_ready(job_id, self.__owner, str(wbt_path)):
+                logger.info(f"El job {job_id} salió de la cola durante la preparación (cancelado)")
+                return
+            logger.info(f"Job {job_id} encolado")
+            self.dispatch()
+
+        self.__prepare_pool.submit(prepare_and_enqueue)
+
+    def _running_names(self) -> Set[str]:
+        return set(self.__running_jobs())
+
+    def _admission(self, launching: Set[str]) -> Callable[[str], bool]:
+        """
+        Recursos libres descontando los jobs en ejecución y los que algún proceso está lanzando.
+
+        Returns:
+            Callable: Función que, para cada job en espera (en orden de la cola), dice si entra
+                      en lo que queda libre y, si entra, se lo descuenta
+        """
+        busy = {name[len(JOB_CONTAINER_PREFIX):] for name in self._running_names()
+                if name.startswith(JOB_CONTAINER_PREFIX)} | set(launching)
+        free = dict(self.__capacity)
+        for job_id in busy:
+            profile = self.__profile(job_id)
+            free["cpus"] -= profile["cpus"]
+            free["memory_gb"] -= profile["memory_gb"]
+        jobs = [len(busy)]
+        # MAX_CONCURRENT_JOBS fijo reemplaza el cálculo por recursos, como antes
+        limit = self.__scheduler_config["max_concurrent_jobs"]
+
+        def fits(job_id: str) -> bool:
+            if limit > 0:
+                if jobs[0] >= limit:
+                    return False
+            else:
+                profile = self.__profile(job_id)
+                # Con el host vacío se lanza igual, aunque el job pida más de lo que hay
+                if jobs[0] > 0 and (profile["cpus"] > free["cpus"] or profile["memory_gb"] > free["memory_gb"]):
+                    return False
+                free["cpus"] -= profile["cpus"]
+                free["memory_gb"] -= profile["memory_gb"]
+            jobs[0] += 1
+            return True
+        return fits
+
+    def _default_profile(self, job_id: str) -> Dict:
+        return {"cpus": self.__scheduler_config["cpus_per_job"], "memory_gb": self.__scheduler_config["memory_per_job_gb"]}
+
+    def _compute_capacity(self) -> Dict:
+        """Núcleos (los que puede usar este proceso, como los cpusets) y RAM total del host."""
+        cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+        try:
+            memory_gb = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / (1024 ** 3)
+        except (ValueError, OSError, AttributeError):
+            memory_gb = float("inf")
+        return {"cpus": cpus, "memory_gb": round(memory_gb, 2)}
+
+    def _compute_max_concurrent_jobs(self) -> int:
+        """
+        Cuántos jobs con el perfil por defecto entran a la vez según CPU y RAM del host (o
+        MAX_CONCURRENT_JOBS si está fijado). Es informativo: la admisión usa el perfil de cada job.
+        """
+        configured = self.__scheduler_config["max_concurrent_jobs"]
+        if configured > 0:
+            return configured
+
+        cpus = os.cpu_count() or 1
+        by_cpu = cpus // max(self.__scheduler_config["cpus_per_job"], 1)
+
+        try:
+            total_memory_gb = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / (1024 ** 3)
+            by_memory = int(total_memory_gb // self.__scheduler_config["memory_per_job_gb"])
+        except (ValueError, OSError, AttributeError):
+            by_memory = by_cpu
+
+        return max(1, min(by_cpu, by_memory))
@@ -1,114 +1,326 @@
 import os
-import re
-import zipfile
+import time
 import shutil # Necesario para eliminar el archivo temporal
+import hashlib
 from pathlib import Path
 import logging
 import json
+import aiofiles
+from fastapi import UploadFile
 from Services.world_service import WorldService
+from Services.world_cache_service import WorldCacheService
 from Services.state_service import StateService
 from Services.docker_service import DockerService
+from Services.scheduler_service import SchedulerService
+from Services.job_index_service import JobIndexService
+from Services.archive_service import ArchiveService
+from Services.warm_pool_service import WarmPoolService
+from Services.resource_service import ResourceService
+from Services.container_events_service import ContainerEventsService
 from Services.core.config import Config
+from Services.core.job_ids import JobIdAllocator
+from Services.metrics_service import MetricsIndex, decode_lines, project, downsample_lttb, downsample_minmax
 
 logger = logging.getLogger(__name__)
 
+# Tamaño de bloque para volcar el world.zip a disco sin cargarlo entero en memoria
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Archivo que el contenedor escribe junto a cada modelo con su sha256 y timesteps
+MODEL_METADATA_SUFFIX = ".meta.json"
+# Bloque leído al transmitir el historial de métricas
+STREAM_CHUNK_SIZE = 64 * 1024
+# Reintentos si un ID asignado ya tiene carpeta en Storage/Jobs
+MAX_JOB_ID_ATTEMPTS = 10
+
 class SimulationService:
     def __init__(self):
         self.__storage_path = Path("Storage/Jobs")
-        self.__current_max_id = None
-        self._initialize_max_id()
         self.__config = Config()
         self.__jobs_storage_path = Path(self.__config.get_storage_path())
+        self.__job_ids = JobIdAllocator()
+        self.__job_index = JobIndexService()
         self.__world_service = WorldService()
-        self.__state_service = StateService()
+        self.__world_cache = WorldCacheService()
         self.__docker_service = DockerService()
+        self.__archive_service = ArchiveService()
+        self.__warm_pool = WarmPoolService(self.__docker_service)
+        self.__resources = ResourceService()
+        self.__scheduler = SchedulerService(
+            self.launch_job,
+            self.__docker_service.list_running_simulations,
+            self.resume_job,
+            self.__job_index,
+            self.__resources.get_job_profile
+        )
+        self.__container_events = ContainerEventsService(
+            self.__docker_service,
+            self.handle_container_exit,
+            lambda name: self.__warm_pool.fill_async(),
+            self.__scheduler.holds_events_lease
+        )
         
-        
-    def _initialize_max_id(self) -> None:
-            """
-            Inicializa el ID máximo analizando las carpetas existentes en Storage/Jobs.
-            Se ejecuta al levantar el servicio.
-            """
-            try:
-                self.__current_max_id = self._get_max_job_id()
-                logger.info(f"ID máximo inicializado: {self.__current_max_id}")
-            except Exception as e:
-                logger.error(f"Error al inicializar el ID máximo: {e}")
-                self.__current_max_id = 0
-        
-    def _get_max_job_id(self) -> int:
-            """
-            Analiza las carpetas en Storage/Jobs y retorna el ID más grande encontrado.
-            Si no hay carpetas, retorna 0.
-            
-            Returns:
-                int: El ID más grande encontrado, o 0 si no hay carpetas
-            """
-            # Crear el directorio si no existe
-            self.__storage_path.mkdir(parents=True, exist_ok=True)
-            
-            max_id = 0
-            job_pattern = re.compile(r'^job_(\d+)$')
-            
-            try:
-                # Listar todas las carpetas en Storage/Jobs
-                for item in self.__storage_path.iterdir():
-                    if item.is_dir():
-                        match = job_pattern.match(item.name)
-                        if match:
-                            job_id = int(match.group(1))
-                            max_id = max(max_id, job_id)
-                            logger.debug(f"Carpeta encontrada: {item.name}, ID: {job_id}")
-                
-                logger.info(f"ID máximo encontrado en carpetas existentes: {max_id}")
-                return max_id
-                
-            except Exception as e:
-                logger.error(f"Error al analizar carpetas de jobs: {e}")
-                return 0
-            
-    def _get_next_job_id(self) -> int:
+    def set_job_directory(self):
         """
-        Obtiene el siguiente ID único para un nuevo job.
-        
+        Reserva un ID con el asignador entre procesos y crea el workspace del job.
+        Si el directorio ya existe (p. ej. un contador restaurado de un backup) se pide otro ID.
+        """
+        for _ in range(MAX_JOB_ID_ATTEMPTS):
+            job = "job_"+str(self.__job_ids.allocate())
+            if os.path.exists(os.path.join(self.__jobs_storage_path, job)):
+                logger.warning(f"El directorio del job {job} ya existe, se asigna otro ID")
+                continue
+            job_path = self.__world_service.setup_job_workspace(job)
+            self.__job_index.register_job(job)
+            return job_path,job
+        raise Exception("No se pudo asignar un ID de job libre")
+
+    def discard_job(self, job: str):
+        """Elimina el workspace y la fila del índice de un job cuya creación falló antes de encolarlo."""
+        shutil.rmtree(self.__jobs_storage_path / job, ignore_errors=True)
+        self.__job_index.delete(job)
+        logger.warning(f"Se descartó el job {job}: falló su creación")
+
+    async def save_world_archive(self, upload: UploadFile, zip_path: str):
+        """
+        Vuelca el world.zip recibido a disco en bloques de tamaño fijo, sin bloquear el event loop,
+        calculando el checksum SHA-256 mientras se escribe.
+
         Returns:
-            int: El siguiente ID disponible
+            tuple: (sha256 en hexadecimal, tamaño en bytes)
         """
-        if self.__current_max_id is None:
-            self._initialize_max_id()
-        
-        self.__current_max_id += 1
-        logger.info(f"Generando nuevo job ID: {self.__current_max_id}")
-        return self.__current_max_id
-    
-    def set_job_directory(self):
-         id = self._get_next_job_id()
-         job = "job_"+str(id)
-         return self.__world_service.setup_job_workspace(job),job
+        sha256 = hashlib.sha256()
+        size = 0
+        async with aiofiles.open(zip_path, 'wb') as f:
+            while True:
+                chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                sha256.update(chunk)
+                size += len(chunk)
+                await f.write(chunk)
+        logger.info(f"world.zip guardado en {zip_path} ({size} bytes, sha256={sha256.hexdigest()})")
+        return sha256.hexdigest(), size
 
-    def start_job(self, job:str, zip_path:Path):
-        try:
-            extracted_path = self.__world_service.extract_world_archive(zip_path, job)
+    async def save_config(self, config: dict, config_path: str):
+        """Escribe el train_config.json del job sin bloquear el event loop."""
+        async with aiofiles.open(config_path, 'w', encoding='utf-8') as f:
+            await f.write(json.dumps(config, indent=4))
 
+    def register_job(self, job: str, sha256: str, size: int):
+        """
+        Crea el state.json del job en estado WAIT apenas termina la subida, para que el
+        progreso del pipeline de preparación sea visible desde /state/{job_id}.
+        """
+        state_service = self._get_state_service(job)
+        state_service.create_state()
+        state_service.set_stage("UPLOADED", {"sha256": sha256, "size": size})
+
+    def submit_job(self, job: str, zip_path: str, priority: int = 0, sha256: str = None):
+        """
+        Entrega el job al scheduler: la preparación corre en el pool acotado y el contenedor
+        se lanza cuando haya un slot libre.
+        """
+        self.__scheduler.submit(job, lambda: self.prepare_job(job, zip_path, sha256), priority)
+
+    def prepare_job(self, job:str, zip_path:Path, sha256: str = None):
+        """
+        Extrae, valida y parchea el mundo del job dejando constancia de cada etapa en state.json.
+        Si el mismo world.zip (mismo SHA-256 y robot) ya se preparó antes, el workspace se arma
+        desde el caché de mundos (hardlinks salvo los archivos que se modifican) y no se extrae nada.
+
+        Returns:
+            Path: Ruta absoluta al .wbt listo para lanzar, o None si la preparación falló.
+        """
+        state_service = self._get_state_service(job)
+        staging = None
+        try:
             name,controller,env_class = self.__world_service.get_robot(job)
-            
-            wbt = self.__world_service.validate_world(name,Path(extracted_path))
+            extern_variant = self.__world_service.get_n_envs(job) > 1
+            job_world_path = self.__jobs_storage_path / job / "world"
+            use_cache = self.__world_cache.is_enabled() and sha256 is not None
+            cache_key = self.__world_cache.key(sha256, name, extern_variant) if use_cache else None
 
-            
-            self.__world_service.patch_world_controllers(name,wbt)
+            wbt_path = self.__world_cache.materialize(cache_key, job_world_path) if use_cache else None
+            if wbt_path is not None:
+                state_service.set_stage("MATERIALIZED", {"cache": "hit", "key": cache_key})
+            else:
+                state_service.set_stage("EXTRACTING", {"cache": "miss"} if use_cache else None)
+                if use_cache:
+                    staging = self.__world_cache.staging_dir(cache_key)
+                manifest = self.__world_service.extract_world_archive(
+                    zip_path, job, staging / "world" if staging else None)
+
+                state_service.set_stage("VALIDATING", manifest.summary())
+                wbt = self.__world_service.validate_world(name,manifest)
+                if wbt is None:
+                    raise Exception(f"El mundo del job {job} no superó la validación")
+
+                state_service.set_stage("PATCHING")
+                self.__world_service.patch_world_controllers(name,wbt,extern_variant)
+                wbt_path = wbt.path
+
+                if use_cache:
+                    self.__world_cache.store(cache_key, staging, manifest, wbt)
+                    staging = None
+                    wbt_path = self.__world_cache.materialize(cache_key, job_world_path)
+                    if wbt_path is None:
+                        raise Exception(f"El mundo {cache_key} no quedó disponible en el caché")
 
-            self.__state_service.set_path(os.path.join(self.__jobs_storage_path,job,'logs','state.json'))
-            self.__state_service.create_state()
+            if use_cache:
+                # El mundo ya está en el caché: el ZIP subido no se vuelve a usar
+                Path(zip_path).unlink(missing_ok=True)
 
-            logger.info(f"Iniciando contenedor para el job {job} con el mundo {wbt.name}")
+            state_service.set_stage("QUEUED")
             base_dir = Path(__file__).parent.parent 
-            wbt_path=(base_dir / wbt).resolve()
-            return self.__docker_service.start_simulation_for_job(job, wbt_path)
+            return (base_dir / wbt_path).resolve()
             
         except Exception as e:
-            logger.error(f"Falló el inicio del job {job}: {e}")
-            shutil.rmtree(self.__storage_path / job)
-            raise
+            if staging is not None:
+                self.__world_cache.discard(staging)
+            self._fail_job(job, f"Falló la preparación del job: {e}")
+            return None
+
+    def resume_job(self, job: str):
+        """
+        Arma la preparación de un job en WAIT cuya preparación se perdió (la API se reinició o
+        el proceso que la hacía murió). Si el mundo ya había quedado listo se reutiliza; si no,
+        se limpia lo extraído a medias y se prepara de nuevo desde el world.zip.
+
+        Returns:
+            Tuple[Callable, int]: (función de preparación, prioridad del job)
+        """
+        job_path = self.__jobs_storage_path / job
+        zip_path = job_path / "world" / f"world_{job}.zip"
+        priority = 0
+        sha256 = None
+        try:
+            with open(job_path / "config" / "train_config.json", 'r', encoding='utf-8') as f:
+                priority = int(json.load(f).get("priority", 0))
+        except (OSError, ValueError, TypeError, AttributeError):
+            pass
+        try:
+            state = self._get_state_service(job).read_state()
+            uploaded = [entry for entry in state.get("pipeline", []) if entry.get("stage") == "UPLOADED"]
+            sha256 = uploaded[-1].get("sha256") if uploaded else None
+            last_stage = state.get("stage")
+        except Exception:
+            last_stage = None
+
+        def prepare():
+            # Sin world.zip (se borra al guardar el mundo en el caché) solo sirve el mundo ya armado
+            if last_stage in ("QUEUED", "LAUNCHING") or not zip_path.exists():
+                wbt_path = self._find_prepared_world(job)
+                if wbt_path is not None:
+                    return wbt_path
+            if not zip_path.exists():
+                self._fail_job(job, "No se pudo retomar la preparación: el world.zip ya no está")
+                return None
+            self._reset_job_world(job, zip_path)
+            return self.prepare_job(job, str(zip_path), sha256)
+
+        return prepare, priority
+
+    def launch_job(self, job: str, wbt_path: str):
+        """Lanza el contenedor de un job ya preparado. Lo invoca el scheduler al liberarse un slot."""
+        state_service = self._get_state_service(job)
+        try:
+            state_service.set_stage("LAUNCHING")
+            logger.info(f"Iniciando contenedor para el job {job} con el mundo {Path(wbt_path).name}")
+            started = time.monotonic()
+            profile = self.__resources.get_job_profile(job)
+            container_id = self.__warm_pool.acquire(job, Path(wbt_path), profile)
+            mode = "warm"
+            if container_id is None:
+                container_id = self.__docker_service.start_simulation_for_job(job, Path(wbt_path), profile)
+                mode = "cold"
+            self.__job_index.set_container(job, f"webots_job_{job}", container_id)
+
+            state_service.set_stage("LAUNCHED", {"mode": mode, "resources": profile})
+            state_service.record_timings("launch", {"mode": mode, "seconds": round(time.monotonic() - started, 3)})
+            return container_id
+
+        except Exception as e:
+            self._fail_job(job, f"Falló el lanzamiento del contenedor: {e}")
+
+    def dispatch_pending_jobs(self):
+        """Lanza los jobs en cola si se liberaron slots."""
+        self.__scheduler.dispatch()
+
+    def start_warm_pool(self):
+        """Completa el warm pool en segundo plano (no hace nada si WARM_POOL_SIZE=0)."""
+        self.__warm_pool.fill_async()
+
+    def start_container_events(self):
+        """Empieza a seguir los eventos de Docker de los contenedores de simulación."""
+        self.__container_events.start()
+
+    def handle_container_exit(self, job_id: str, container_id: str, exit_code, oom_killed: bool):
+        """
+        Registra en state.json la salida del contenedor de un job. Si el job no había terminado
+        queda en ERROR; el cambio de state.json llega a los WebSockets por el watcher de logs.
+        Como se liberó un slot, se despachan los jobs en cola. Solo cuenta la salida del
+        contenedor registrado al lanzar el job: los eventos de otro contenedor con el mismo
+        nombre se ignoran (si el evento llega antes de registrarlo, lo resuelve el JobCleaner).
+        """
+        if self.__job_index.get_container_id(job_id) != container_id:
+            logger.info(f"Evento de un contenedor que no es el del job {job_id} ({container_id}), se ignora")
+            return
+        # Si corrió en un contenedor del pool, su workspace vuelve a Storage/Jobs
+        self.__docker_service.release_pool_workspace(job_id)
+        state_path = self.__jobs_storage_path / job_id / "logs" / "state.json"
+        if state_path.exists():
+            if self._get_state_service(job_id).record_container_exit(exit_code, oom_killed):
+                logger.warning(f"El contenedor del job {job_id} terminó antes de completar el entrenamiento "
+                               f"(código {exit_code}{', OOM' if oom_killed else ''})")
+        self.dispatch_pending_jobs()
+
+    def get_queue(self):
+        """Devuelve la cola de jobs en espera y la ocupación de slots."""
+        return self.__scheduler.get_queue()
+
+    def shutdown(self):
+        self.__container_events.stop()
+        self.__scheduler.shutdown()
+
+    def _find_prepared_world(self, job: str):
+        """.wbt ya parcheado del job (el que tiene su .wbt.backup al lado), o None"""
+        world_path = self.__jobs_storage_path / job / "world"
+        for backup in world_path.rglob("*.wbt.backup"):
+            wbt_path = backup.with_suffix("")
+            if wbt_path.exists():
+                return wbt_path.resolve()
+        return None
+
+    def _reset_job_world(self, job: str, zip_path: Path):
+        """Borra lo que haya quedado de una preparación interrumpida, salvo el world.zip"""
+        world_path = self.__jobs_storage_path / job / "world"
+        for entry in world_path.iterdir():
+            if entry == zip_path:
+                continue
+            if entry.is_dir() and not entry.is_symlink():
+                shutil.rmtree(entry, ignore_errors=True)
+            else:
+                entry.unlink(missing_ok=True)
+
+    def _fail_job(self, job: str, message: str):
+        """Marca el job como ERROR sin eliminarlo, para que el cliente pueda consultar el motivo."""
+        logger.error(f"Falló el inicio del job {job}: {message}")
+        try:
+            state_service = self._get_state_service(job)
+            state_service.set_stage("FAILED")
+            state_service.set_state(2, message)
+        except Exception as state_error:
+            logger.error(f"No se pudo registrar el error del job {job}: {state_error}")
+
+    def _get_state_service(self, job_id: str) -> StateService:
+        """
+        Crea un StateService propio para el job. El pipeline corre en hilos de fondo, por lo
+        que no se comparte una instancia con set_path entre requests.
+        """
+        return StateService(
+            os.path.join(self.__jobs_storage_path, job_id, 'logs', 'state.json'),
+            self.__job_index.record_state_file
+        )
         
     def cancel_job(self, job_id: str):
         """
@@ -119,8 +331,14 @@ class SimulationService:
         """
         try:
             logger.info(f"Cancelando el job {job_id}")
-            self.__docker_service.stop_simulation(job_id)        
+            self.__scheduler.remove(job_id)
+            self.__docker_service.stop_simulation(job_id)
+            # Si corrió en el warm pool, el workspace vuelve a Storage/Jobs antes de borrarlo
+            # (espera a que termine una devolución en curso del hilo de eventos)
+            self.__docker_service.release_pool_workspace(job_id)
             shutil.rmtree(self.__storage_path / job_id)
+            MetricsIndex.drop(self.get_metrics_path(job_id))
+            self.__job_index.delete(job_id)
             logger.info(f"Job {job_id} cancelado exitosamente")
         except Exception as e:
             logger.error(f"Error al cancelar el job {job_id}: {e}")
@@ -138,91 +356,167 @@ class SimulationService:
         """
         try:
             logger.info(f"Obteniendo estado del job {job_id}")
-            self.__state_service.set_path(os.path.join(self.__jobs_storage_path,job_id,'logs','state.json'))
-            state = self.__state_service.read_state()
+            state = self.__job_index.get_state(job_id)
             return state
         except Exception as e:
             logger.error(f"Error al obtener el estado del job {job_id}: {e}")
             raise
 
-    def get_logs(self, job_id: str):
+    def list_jobs(self, state=None, limit=50, offset=0, updated_before=None, container_name=None):
         """
-        Obtiene los logs del job.
-        
+        Lista paginada de jobs servida desde el índice, sin recorrer Storage/Jobs.
+        """
+        return self.__job_index.list_jobs(state, limit, offset, updated_before, container_name)
+
+    def get_metrics_path(self, job_id: str) -> str:
+        return os.path.join(self.__jobs_storage_path, job_id, 'logs', 'training_metrics.jsonl')
+
+    def resolve_metrics_range(self, job_id: str, timestep_from=None, timestep_to=None,
+                              episode_from=None, episode_to=None):
+        """
+        Traduce los rangos de timestep (total_timesteps) y episodio (episodes) a un rango de seq
+        [inicio, fin) con búsqueda binaria sobre el índice de offsets.
+
+        Raises:
+            FileNotFoundError: Si el job no tiene métricas
+        """
+        log_path = self.get_metrics_path(job_id)
+        if not os.path.exists(log_path):
+            raise FileNotFoundError(f"No se encontraron métricas para el job {job_id}")
+
+        index = MetricsIndex.for_path(log_path)
+        start, end = 0, index.update()
+        if timestep_from is not None:
+            start = index.bisect("total_timesteps", timestep_from, lo=start, hi=end)
+        if timestep_to is not None:
+            end = index.bisect("total_timesteps", timestep_to, right=True, lo=start, hi=end)
+        if episode_from is not None:
+            start = index.bisect("episodes", episode_from, lo=start, hi=end)
+        if episode_to is not None:
+            end = index.bisect("episodes", episode_to, right=True, lo=start, hi=end)
+        return start, max(start, end)
+
+    async def stream_metrics(self, job_id: str, start_seq: int, end_seq: int, fields=None, json_array=False):
+        """
+        Generador asíncrono de los registros [start_seq, end_seq) leídos por bloques directo
+        del archivo: la memoria no depende del largo del historial y el primer bloque sale enseguida.
+
         Args:
-            job_id (str): El ID del job.
-        
+            json_array: True produce un array JSON (formato original del endpoint); False, NDJSON
+        """
+        log_path = self.get_metrics_path(job_id)
+        index = MetricsIndex.for_path(log_path)
+        # Un cursor o límite más allá del último registro indexado produce un stream vacío
+        start_seq = min(max(start_seq, 0), index.count())
+        start, end = index.byte_range(start_seq, end_seq)
+        if json_array:
+            yield "["
+        first = True
+        seq = start_seq
+        partial = b""
+        async with aiofiles.open(log_path, 'rb') as f:
+            await f.seek(start)
+            remaining = end - start
+            while remaining > 0:
+                block = await f.read(min(STREAM_CHUNK_SIZE, remaining))
+                if not block:
+                    break
+                remaining -= len(block)
+                lines = (partial + block).split(b"\n")
+                partial = lines.pop()
+                encoded = [json.dumps(project(record, fields)) for record in decode_lines(lines, seq, log_path)]
+                seq += len(lines)
+                if not encoded:
+                    continue
+                if json_array:
+                    yield ("" if first else ",") + ",".join(encoded)
+                else:
+                    yield "\n".join(encoded) + "\n"
+                first = False
+        if json_array:
+            yield "]"
+
+    def query_metrics(self, job_id: str, timestep_from=None, timestep_to=None, episode_from=None,
+                      episode_to=None, cursor: int = 0, limit: int = 1000, fields=None,
+                      downsample: str = None, points: int = 500):
+        """
+        Consulta el historial de métricas usando el índice de offsets, sin leer el archivo completo.
+
+        Los rangos de timestep (total_timesteps) y episodio (episodes) se resuelven con búsqueda
+        binaria sobre el índice. Sin downsample devuelve una página de hasta `limit` registros y
+        el cursor (seq) de la siguiente; con downsample ("lttb" o "minmax") reduce todo el rango
+        a como mucho `points` puntos del primer campo de `fields` (por defecto ep_rew_mean).
+
         Returns:
-            str: Los logs del job.
+            dict: {"items", "next_cursor", "total"} donde total es la cantidad de líneas del rango
         """
-        try:
-            logger.info(f"Obteniendo logs del job {job_id}")
-            log_path = os.path.join(self.__jobs_storage_path, job_id, 'logs', 'training_metrics.jsonl')
-            if os.path.exists(log_path):
-                logs_list = []
-                with open(log_path, 'r', encoding='utf-8') as f:
-                    for line in f:
-                        logs_list.append(json.loads(line))
-                return logs_list
+        start, end = self.resolve_metrics_range(job_id, timestep_from, timestep_to, episode_from, episode_to)
+        index = MetricsIndex.for_path(self.get_metrics_path(job_id))
+        total = max(end - start, 0)
+
+        if downsample is not None:
+            y_field = fields[0] if fields else "ep_rew_mean"
+            x_field = "total_timesteps"
+            keep = list(dict.fromkeys([*(fields or [y_field]), x_field]))
+            records = [project(r, keep) for r in index.iter_records(start, end)]
+            if downsample == "lttb":
+                items = downsample_lttb(records, x_field, y_field, points)
             else:
-                logger.warning(f"No se encontraron logs para el job {job_id}")
-                return {"message": "No logs found."}
-        except Exception as e:
-            logger.error(f"Error al obtener los logs del job {job_id}: {e}")
-            raise
+                items = downsample_minmax(records, y_field, points)
+            if fields and x_field not in fields:
+                items = [project(r, fields) for r in items]
+            return {"items": items, "next_cursor": None, "total": total}
+
+        page_start = max(start, cursor)
+        page_end = min(page_start + limit, end)
+        items = [project(r, fields) for r in index.read_records(page_start, page_end)]
+        return {"items": items, "next_cursor": page_end if page_end < end else None, "total": total}
 
     def get_tensorboard_path(self, job_id: str):
         """
-        Comprime el directorio de logs de TensorBoard del job en un archivo ZIP
-        y devuelve la ruta al archivo ZIP creado.
+        Devuelve el ZIP con los logs de TensorBoard del job y su ETag. El ZIP se arma una vez
+        (o cuando cambian los archivos de eventos) y se reutiliza en las descargas siguientes.
+
+        Returns:
+            Tuple[str, str]: (ruta al ZIP, ETag)
         """
         try:
-            logger.info(f"Comprimiendo logs de TensorBoard para el job {job_id}")
-            
-            # 1. Definir rutas
-            job_dir = os.path.join(self.__jobs_storage_path, job_id)
-            log_path = os.path.join(job_dir, 'logs') # El directorio a comprimir
-            zip_filename = f"tensorboard_{job_id}.zip"
-            zip_path = os.path.join(job_dir, zip_filename)
-
-            if(os.path.exists(zip_path)):
-                os.remove(zip_path)
-
-            # 2. Validaciones (Mantenidas)
-            if not os.path.isdir(log_path):
-                raise FileNotFoundError(f"Directorio de logs no encontrado para el job {job_id}")
-
-            self.__state_service.set_path(os.path.join(job_dir, 'logs', 'state.json'))
-            if (self.__state_service.get_state() in ["WAIT", "RUNNING"]):
+            if (self.__job_index.get_state(job_id)["state"] in ["WAIT", "RUNNING"]):
                 raise Exception(f"El job {job_id} aún está en ejecución. TensorBoard estará disponible una vez que el job haya finalizado.")
-            
-            tensorboard_files = []
-            for filename in os.listdir(log_path):
-                if filename.startswith("events.out.tfevents"):
-                    tensorboard_files.append(filename)
 
-            if not tensorboard_files:
-                raise FileNotFoundError(f"Archivos de evento de TensorBoard no encontrados en el directorio de logs para el job {job_id}")
-            
-            # 4. Crear el archivo ZIP
-            with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                for filename in tensorboard_files:
-                    file_path = os.path.join(log_path, filename)
-                    # El arcname (nombre dentro del ZIP) lo ponemos en una subcarpeta
-                    # para que no se mezclen los archivos al descomprimir
-                    arcname = os.path.join(f"tensorboard_logs_{job_id}", filename) 
-                    zipf.write(file_path, arcname)
-                            
-            logger.info(f"Compresión exitosa. Archivo ZIP creado en {zip_path}")
-            return zip_path # Retorna la ruta al archivo ZIP
-                
+            return self.__archive_service.get_tensorboard_archive(job_id)
+
         except Exception as e:
             logger.error(f"Error al comprimir logs de TensorBoard para el job {job_id}: {e}")
-            # Es buena práctica limpiar el ZIP si se creó un parcial antes de fallar
-            if 'zip_path' in locals() and os.path.exists(zip_path):
-                os.remove(zip_path)
             raise
 
+    def get_bundle_files(self, job_id: str):
+        """Archivos que componen el paquete de descarga del job (ver ArchiveService)."""
+        return self.__archive_service.get_bundle_files(job_id)
+
+    def iter_bundle(self, files):
+        """Generador del ZIP del paquete, producido bloque a bloque durante la descarga."""
+        return self.__archive_service.iter_bundle(files)
+
+    def get_model_metadata(self, model_path: str):
+        """
+        Hash, tamaño y timesteps del modelo, leídos del <modelo>.meta.json que el contenedor
+        escribe al guardarlo. Si falta o no corresponde al archivo actual (modelos guardados
+        antes de existir el archivo), el ETag se deriva de mtime y tamaño.
+
+        Returns:
+            dict: {"etag", "size", "timesteps"}
+        """
+        stat = os.stat(model_path)
+        try:
+            with open(f"{model_path}{MODEL_METADATA_SUFFIX}", 'r', encoding='utf-8') as f:
+                metadata = json.load(f)
+            if metadata.get("size") == stat.st_size and metadata.get("sha256"):
+                return {"etag": metadata["sha256"], "size": stat.st_size, "timesteps": metadata.get("timesteps")}
+        except (FileNotFoundError, ValueError):
+            pass
+        return {"etag": f"{stat.st_mtime_ns:x}-{stat.st_size:x}", "size": stat.st_size, "timesteps": None}
+
     def get_model_path(self, job_id:str):
         """
         Obtiene la ruta del modelo entrenado para el job.
@@ -235,8 +529,7 @@ class SimulationService:
         """
         try:
             logger.info(f"Obteniendo ruta del modelo para el job {job_id}")
-            self.__state_service.set_path(os.path.join(self.__jobs_storage_path,job_id,'logs','state.json'))
-            state = self.__state_service.get_state()
+            state = self.__job_index.get_state(job_id)["state"]
             if(state == "WAIT"):
                 raise Exception(f"El job {job_id} aún está en ejecución. El modelo estará disponible una vez que el job haya finalizado.")
             elif(state == "RUNNING"):
@@ -1,25 +1,40 @@
-
 from pathlib import Path
+from contextlib import contextmanager
+import os
 import json
 from datetime import datetime
 
+try:
+    import fcntl
+except ImportError:  # Windows: sin locks advisory, se mantiene la escritura atómica
+    fcntl = None
+
 class StateService():
-    def __init__(self, path_state=""):
-        
+    def __init__(self, path_state="", listener=None):
+        """
+        Args:
+            path_state: Ruta al state.json del job
+            listener: Función opcional (path, state) llamada tras cada escritura. En el host se usa
+                      para mantener el índice de jobs; dentro del contenedor no se configura.
+        """
         self.__path_state = path_state
+        self.__listener = listener
         self.__states=["WAIT","RUNNING", "ERROR", "READY", "TERMINATED"]
 
     def create_state(self):
         try:
-            state ={}
-            state["state"] = self.__states[0]
-            state["init_timestamp"] = datetime.now().isoformat()
-            state["end_timestamp"] = None
-            state["errors"] = []
-            with open(self.__path_state, 'w', encoding='utf-8') as f:
-                json.dump(state, f, indent=2) 
+            with self._locked():
+                state ={}
+                state["state"] = self.__states[0]
+                state["init_timestamp"] = datetime.now().isoformat()
+                state["end_timestamp"] = None
+                state["errors"] = []
+                state["stage"] = None
+                state["pipeline"] = []
+                state["version"] = self._current_version()
+                self._write_state(state)
         except Exception as e:
-            self.__logger.error(f"Error al crear archivo de estado: {e}")
+            print(f"Error al crear archivo de estado: {e}")
             raise
 
     def read_state(self):
@@ -30,28 +45,95 @@ class StateService():
         except Exception as e:
             print(f"Error al leer archivo de estado: {e}")
             raise
-    
+
     def set_state(self, state:int ,error_message=""):
         try:
-            file_state = self.read_state()
-            file_state["state"] = self.__states[state]
-            if(file_state["state"]=="RUNNING"):
-                file_state["init_timestamp"] = datetime.now().isoformat()
-                file_state["end_timestamp"] = None
-                file_state["errors"] = []
+            with self._locked():
+                file_state = self.read_state()
+                file_state["state"] = self.__states[state]
+                if(file_state["state"]=="RUNNING"):
+                    file_state["init_timestamp"] = datetime.now().isoformat()
+                    file_state["end_timestamp"] = None
+                    file_state["errors"] = []
 
-            elif(file_state["state"]=="ERROR" or file_state["state"]=="READY"):
-                file_state["end_timestamp"] = datetime.now().isoformat()
-                if(file_state["state"]=="ERROR" and error_message!=""):
-                    file_state["errors"].append({"timestamp": datetime.now().isoformat(), "message": error_message})
+                elif(file_state["state"]=="ERROR" or file_state["state"]=="READY"):
+                    file_state["end_timestamp"] = datetime.now().isoformat()
+                    if(file_state["state"]=="ERROR" and error_message!=""):
+                        file_state["errors"].append({"timestamp": datetime.now().isoformat(), "message": error_message})
 
-            with open(self.__path_state, 'w', encoding='utf-8') as f:
-                json.dump(file_state, f, indent=2) 
+                self._write_state(file_state)
 
         except Exception as e:
             print(f"Error al actualizar archivo de estado a ERROR: {e}")
             raise
 
+    def set_stage(self, stage: str, details=None):
+        """
+        Registra el avance del pipeline de preparación del job (subida, extracción, lanzamiento...).
+        El estado principal (WAIT, RUNNING, ...) no se modifica.
+        """
+        try:
+            with self._locked():
+                file_state = self.read_state()
+                entry = {"stage": stage, "timestamp": datetime.now().isoformat()}
+                if details:
+                    entry.update(details)
+                file_state["stage"] = stage
+                file_state.setdefault("pipeline", []).append(entry)
+
+                self._write_state(file_state)
+
+        except Exception as e:
+            print(f"Error al actualizar etapa del pipeline: {e}")
+            raise
+
+    def record_timings(self, name: str, timings):
+        """
+        Guarda los tiempos de una fase de arranque (p. ej. "launch" en el host o "bootstrap"
+        dentro del contenedor) en state["timings"][name], para ver qué fases son lentas.
+        """
+        try:
+            with self._locked():
+                file_state = self.read_state()
+                file_state.setdefault("timings", {})[name] = timings
+                self._write_state(file_state)
+
+        except Exception as e:
+            print(f"Error al registrar tiempos de arranque: {e}")
+            raise
+
+    def record_container_exit(self, exit_code, oom_killed: bool = False) -> bool:
+        """
+        Registra el fin del contenedor del job (código de salida y si lo mató el OOM killer) en
+        state["container"]. Si el job seguía en WAIT o RUNNING, el contenedor terminó sin que el
+        controlador cerrara el entrenamiento y el job pasa a ERROR.
+
+        Returns:
+            bool: True si el job se marcó como ERROR
+        """
+        try:
+            with self._locked():
+                file_state = self.read_state()
+                now = datetime.now().isoformat()
+                file_state["container"] = {"exit_code": exit_code, "oom_killed": oom_killed, "finished_at": now}
+
+                failed = file_state["state"] in (self.__states[0], self.__states[1])
+                if failed:
+                    if oom_killed:
+                        message = "El contenedor fue terminado por falta de memoria (OOM)"
+                    else:
+                        message = f"El contenedor terminó con código {exit_code} sin completar el entrenamiento"
+                    file_state["state"] = self.__states[2]
+                    file_state["end_timestamp"] = now
+                    file_state.setdefault("errors", []).append({"timestamp": now, "message": message})
+
+                self._write_state(file_state)
+                return failed
+
+        except Exception as e:
+            print(f"Error al registrar la salida del contenedor: {e}")
+            raise
+
     def get_state(self):
         try:
             file_state = self.read_state()
@@ -60,9 +142,55 @@ class StateService():
             print(f"Error al obtener estado: {e}")
             raise
 
+    @contextmanager
+    def _locked(self):
+        """
+        Lock advisory exclusivo sobre <state.json>.lock. El contenedor y el host comparten el
+        archivo por el bind mount de logs/, así que ambos serializan sus read-modify-write.
+        """
+        if fcntl is None:
+            yield
+            return
+        with open(f"{self.__path_state}.lock", 'a') as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _write_state(self, state):
+        """
+        Escritura atómica: archivo temporal + fsync + rename. Los lectores ven siempre el
+        documento anterior o el nuevo completo, nunca uno truncado. Cada escritura incrementa
+        "version" para que los watchers puedan descartar eventos sin cambios.
+        """
+        state["version"] = state.get("version", 0) + 1
+        tmp_path = f"{self.__path_state}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.__path_state)
+        self._notify(state)
+
+    def _current_version(self):
+        """Versión del documento existente (0 si no existe), para que recrearlo no la haga retroceder."""
+        try:
+            with open(self.__path_state, 'r', encoding='utf-8') as f:
+                return json.load(f).get("version", 0)
+        except Exception:
+            return 0
+
+    def _notify(self, state):
+        if self.__listener is None:
+            return
+        try:
+            self.__listener(self.__path_state, state)
+        except Exception as e:
+            print(f"Error notificando cambio de estado: {e}")
+
     def set_path(self, path_state: Path):
         self.__path_state = path_state
 
     def get_path(self):
         return self.__path_state
-    
\ No newline at end of file
@@ -0,0 +1,76 @@
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+from Services.core.config import Config
+from Services.docker_service import DockerService
+
+logger = logging.getLogger(__name__)
+
+class WarmPoolService:
+    """
+    Mantiene un conjunto de contenedores Webots pre-iniciados (Xvfb ya levantado) listos para
+    recibir un job. Al asignarse uno, el job solo paga la copia del controlador y el arranque
+    de Webots; el pool se repone en segundo plano.
+
+    Con WARM_POOL_SIZE=0 (por defecto) queda deshabilitado y los jobs se lanzan en frío. Los
+    contenedores del pool sobreviven a un reinicio de la API y se reutilizan al arrancar.
+    """
+
+    def __init__(self, docker_service: DockerService):
+        self.__docker_service = docker_service
+        self.__size = Config().get_warm_pool_config()["size"]
+        self.__lock = threading.Lock()
+        self.__filling = threading.Lock()
+
+    def is_enabled(self) -> bool:
+        return self.__size > 0
+
+    def fill(self):
+        """Completa el pool hasta el tamaño configurado y elimina contenedores del pool caídos."""
+        if not self.is_enabled() or not self.__filling.acquire(blocking=False):
+            return
+        try:
+            ready = 0
+            for container in self.__docker_service.list_pool_containers(all=True):
+                if container.status == "running":
+                    ready += 1
+                else:
+                    logger.warning(f"Contenedor del pool '{container.name}' detenido ({container.status}), se elimina")
+                    self.__docker_service.remove_container(container)
+
+            for _ in range(self.__size - ready):
+                self.__docker_service.start_pool_container()
+        except Exception as e:
+            logger.error(f"Error reponiendo el warm pool: {e}")
+        finally:
+            self.__filling.release()
+
+    def fill_async(self):
+        threading.Thread(target=self.fill, name="warm-pool-fill", daemon=True).start()
+
+    def acquire(self, job_id: str, world_file_abs_path: Path, profile: Optional[Dict] = None):
+        """
+        Asigna un contenedor del pool al job y lanza Webots en él.
+
+        Returns:
+            str | None: ID del contenedor asignado, o None si no había contenedores disponibles
+                        (el job se lanza en frío)
+        """
+        if not self.is_enabled():
+            return None
+
+        with self.__lock:
+            for container in self.__docker_service.list_pool_containers():
+                try:
+                    result = self.__docker_service.assign_pool_container(container, job_id, world_file_abs_path, profile)
+                    break
+                except Exception as e:
+                    # Otro proceso pudo haberlo tomado (el rename falla) o el contenedor murió
+                    logger.warning(f"No se pudo asignar el contenedor del pool '{container.name}': {e}")
+            else:
+                logger.info(f"Warm pool vacío, el job {job_id} se lanza en frío")
+                result = None
+
+        self.fill_async()
+        return result
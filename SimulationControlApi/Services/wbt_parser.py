@@ -0,0 +1,302 @@
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+# Tokens del formato .wbt (VRML97 con extensiones de Webots). La coma cuenta como espacio.
+TOKEN_PATTERN = re.compile(r'''
+    (?P<space>[\s,]+)
+  | (?P<comment>\#[^\n]*)
+  | (?P<string>"(?:[^"\\]|\\.)*")
+  | (?P<open>\{)
+  | (?P<close>\})
+  | (?P<list_open>\[)
+  | (?P<list_close>\])
+  | (?P<word>[^\s,{}\[\]"\#]+)
+  | (?P<error>.)
+''', re.VERBOSE | re.DOTALL)
+
+FIELD_NAME_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+KEYWORDS = {"DEF", "USE", "TRUE", "FALSE", "NULL"}
+
+class WbtParseError(Exception):
+    """El contenido no respeta la sintaxis de un archivo .wbt"""
+    pass
+
+@dataclass
+class WbtToken:
+    kind: str
+    text: str
+    start: int
+    end: int
+
+@dataclass
+class WbtField:
+    """Campo de un nodo: posición del nombre y rango [value_start, value_end) de su valor"""
+    name: str
+    start: int
+    value_start: int
+    value_end: int
+
+@dataclass
+class WbtNode:
+    type: str
+    def_name: Optional[str]
+    start: int
+    body_start: int
+    end: int = -1
+    parent: Optional["WbtNode"] = field(default=None, repr=False)
+    fields: Dict[str, WbtField] = field(default_factory=dict, repr=False)
+    # Campo del nodo padre cuyo valor es este nodo (p. ej. "physics Physics { }")
+    value_field: Optional[WbtField] = field(default=None, repr=False)
+
+
+def tokenize(text: str) -> List[WbtToken]:
+    """Tokens significativos del archivo (sin espacios ni comentarios), en una sola pasada."""
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(text):
+        kind = match.lastgroup
+        if kind in ("space", "comment"):
+            continue
+        if kind == "error":
+            raise WbtParseError(f"Carácter inesperado en la posición {match.start()}: {match.group()!r}")
+        tokens.append(WbtToken(kind, match.group(), match.start(), match.end()))
+    return tokens
+
+
+class WbtDocument:
+    """
+    Archivo .wbt parseado en una sola pasada lineal.
+
+    Cada nodo queda indexado por DEF, por su campo name y por tipo (o PROTO), con la posición
+    de cada uno de sus campos, de modo que buscar un robot es O(1) y modificar un campo solo
+    reemplaza el rango de texto de su valor. El resto del archivo se conserva byte a byte.
+    """
+
+    def __init__(self, text: str):
+        self.__text = text
+        self.__edits: List[Tuple[int, int, str]] = []
+        self.nodes: List[WbtNode] = []
+        self.by_def: Dict[str, WbtNode] = {}
+        self.by_name: Dict[str, List[WbtNode]] = {}
+        self.by_type: Dict[str, List[WbtNode]] = {}
+        self._parse(tokenize(text))
+
+    @property
+    def text(self) -> str:
+        return self.__text
+
+    def find(self, robot: str) -> List[WbtNode]:
+        """
+        Nodos que corresponden al robot: el que tiene ese DEF; si no hay, los que tienen ese
+        name; si tampoco, las instancias de ese tipo/PROTO.
+        """
+        if robot in self.by_def:
+            return [self.by_def[robot]]
+        return list(self.by_name.get(robot) or self.by_type.get(robot) or [])
+
+    def field_value(self, node: WbtNode, name: str) -> Optional[str]:
+        """Texto crudo del valor del campo (con comillas si es un string), o None si no está"""
+        node_field = node.fields.get(name)
+        if node_field is None:
+            return None
+        return self.__text[node_field.value_start:node_field.value_end]
+
+    def set_field(self, node: WbtNode, name: str, value: str):
+        """
+        Reemplaza el valor de un campo del nodo (texto VRML crudo, p. ej. '"InternalController"'
+        o 'TRUE'). Si el nodo no lo declara, se agrega al comienzo de su cuerpo.
+        """
+        node_field = node.fields.get(name)
+        if node_field is not None:
+            self.__edits.append((node_field.value_start, node_field.value_end, value))
+        else:
+            indent = self._indentation(node.start) + "  "
+            self.__edits.append((node.body_start, node.body_start, f"\n{indent}{name} {value}"))
+
+    def has_changes(self) -> bool:
+        return bool(self.__edits)
+
+    def discard_changes(self):
+        """Descarta las modificaciones pendientes; el texto parseado no cambia"""
+        self.__edits = []
+
+    def render(self) -> str:
+        """Texto con las modificaciones aplicadas"""
+        parts = []
+        position = 0
+        for start, end, value in sorted(self.__edits, key=lambda edit: edit[0]):
+            parts.append(self.__text[position:start])
+            parts.append(value)
+            position = end
+        parts.append(self.__text[position:])
+        return "".join(parts)
+
+    def write(self, path) -> str:
+        """
+        Escribe las modificaciones sobre el archivo del que salió el texto, tocando solo los
+        bytes que cambian: si cada reemplazo conserva su largo se escribe cada rango en su
+        lugar; si no, se reescribe desde el primer byte modificado. Si el archivo en disco no
+        coincide con el texto parseado se reescribe completo.
+
+        Returns:
+            str: El texto resultante
+        """
+        new_text = self.render()
+        if not self.__edits:
+            return new_text
+
+        edits = sorted(self.__edits, key=lambda edit: edit[0])
+        original_size = len(self.__text.encode("utf-8"))
+        try:
+            on_disk = os.path.getsize(path)
+        except FileNotFoundError:
+            on_disk = -1
+
+        if on_disk != original_size:
+            with open(path, "wb") as f:
+                f.write(new_text.encode("utf-8"))
+            return new_text
+
+        same_length = all(
+            len(value.encode("utf-8")) == len(self.__text[start:end].encode("utf-8"))
+            for start, end, value in edits
+        )
+        with open(path, "r+b") as f:
+            if same_length:
+                for start, _, value in edits:
+                    f.seek(len(self.__text[:start].encode("utf-8")))
+                    f.write(value.encode("utf-8"))
+            else:
+                first = edits[0][0]
+                f.seek(len(self.__text[:first].encode("utf-8")))
+                # new_text conserva intacto todo lo anterior al primer cambio
+                f.write(new_text[first:].encode("utf-8"))
+                f.truncate()
+        return new_text
+
+    def _parse(self, tokens: List[WbtToken]):
+        # Pila de marcos: ("node", WbtNode) o ("list", WbtField | None)
+        stack: List[Tuple[str, object]] = []
+        pending_field: Optional[WbtField] = None
+        count = len(tokens)
+        i = 0
+
+        while i < count:
+            token = tokens[i]
+            frame_kind, frame = stack[-1] if stack else (None, None)
+
+            # Apertura de nodo: "DEF nombre Tipo {" o "Tipo {"
+            node_header = self._node_header(tokens, i)
+            if node_header is not None:
+                def_name, type_token, brace = node_header
+                node = WbtNode(
+                    type=type_token.text,
+                    def_name=def_name,
+                    start=token.start,
+                    body_start=brace.end,
+                    parent=self._current_node(stack),
+                    value_field=pending_field
+                )
+                self.nodes.append(node)
+                if def_name is not None:
+                    self.by_def[def_name] = node
+                self.by_type.setdefault(node.type, []).append(node)
+                if pending_field is not None:
+                    pending_field.value_start = token.start
+                    pending_field = None
+                stack.append(("node", node))
+                i += 4 if def_name is not None else 2
+                continue
+
+            if token.kind == "close":
+                if frame_kind != "node":
+                    raise WbtParseError(f"'}}' inesperado en la posición {token.start}")
+                stack.pop()
+                frame.end = token.end
+                self._index_name(frame)
+                if frame.value_field is not None:
+                    frame.value_field.value_end = token.end
+                i += 1
+                continue
+
+            if token.kind == "list_open":
+                if pending_field is not None:
+                    pending_field.value_start = token.start
+                stack.append(("list", pending_field))
+                pending_field = None
+                i += 1
+                continue
+
+            if token.kind == "list_close":
+                if frame_kind != "list":
+                    raise WbtParseError(f"']' inesperado en la posición {token.start}")
+                stack.pop()
+                if frame is not None:
+                    frame.value_end = token.end
+                i += 1
+                continue
+
+            if token.kind == "open":
+                raise WbtParseError(f"'{{' sin tipo de nodo en la posición {token.start}")
+
+            if frame_kind == "node" and pending_field is None and token.kind == "word" \
+                    and token.text not in KEYWORDS and FIELD_NAME_PATTERN.match(token.text):
+                # Nombre de campo: su valor empieza en el token siguiente
+                pending_field = WbtField(token.text, token.start, -1, -1)
+                frame.fields.setdefault(token.text, pending_field)
+                i += 1
+                continue
+
+            # Valor simple (string, número, TRUE/FALSE/NULL, USE nombre) o texto de primer nivel
+            if pending_field is not None:
+                end = token.end
+                if token.text == "USE" and i + 1 < count:
+                    i += 1
+                    end = tokens[i].end
+                else:
+                    # Valores de varios números (p. ej. "translation 0 0.1 0")
+                    while i + 1 < count and tokens[i + 1].kind == "word" \
+                            and not FIELD_NAME_PATTERN.match(tokens[i + 1].text) \
+                            and self._node_header(tokens, i + 1) is None:
+                        i += 1
+                        end = tokens[i].end
+                pending_field.value_start = token.start
+                pending_field.value_end = end
+                pending_field = None
+            i += 1
+
+        if stack:
+            raise WbtParseError("El archivo termina con nodos o listas sin cerrar")
+
+    @staticmethod
+    def _node_header(tokens: List[WbtToken], i: int):
+        """(def, token de tipo, token '{') si en i empieza un nodo, o None"""
+        token = tokens[i]
+        if token.kind != "word":
+            return None
+        if token.text == "DEF":
+            if i + 3 < len(tokens) and tokens[i + 1].kind == "word" and tokens[i + 2].kind == "word" \
+                    and tokens[i + 3].kind == "open":
+                return tokens[i + 1].text, tokens[i + 2], tokens[i + 3]
+            return None
+        if i + 1 < len(tokens) and tokens[i + 1].kind == "open" and token.text not in KEYWORDS:
+            return None, token, tokens[i + 1]
+        return None
+
+    @staticmethod
+    def _current_node(stack) -> Optional[WbtNode]:
+        for kind, frame in reversed(stack):
+            if kind == "node":
+                return frame
+        return None
+
+    def _index_name(self, node: WbtNode):
+        value = self.field_value(node, "name")
+        if value and value.startswith('"') and value.endswith('"'):
+            self.by_name.setdefault(value[1:-1], []).append(node)
+
+    def _indentation(self, position: int) -> str:
+        line_start = self.__text.rfind("\n", 0, position) + 1
+        line = self.__text[line_start:position]
+        return line[:len(line) - len(line.lstrip())]
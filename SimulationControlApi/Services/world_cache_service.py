@@ -0,0 +1,224 @@
+import os
+import json
+import stat
+import time
+import uuid
+import errno
+import shutil
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from datetime import datetime
+from typing import Optional
+from Services.core.config import Config
+from Services.world_service import WorldFile, WorldManifest
+try:
+    import fcntl
+except ImportError:  # Windows: sin reflinks, copia común
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILENAME = "manifest.json"
+# Archivos que se modifican en el workspace del job (el .wbt parcheado, su copia de respaldo,
+# el .wbproj que reescribe Webots) y directorios cuyo contenido se toca al lanzar (chmod +x y
+# copia del InternalController): se copian. El resto se enlaza con hardlinks.
+COPIED_SUFFIXES = (".wbt", ".wbt.backup", ".wbproj")
+COPIED_DIRS = ("controllers",)
+# ioctl FICLONE de Linux: clona el archivo compartiendo bloques (btrfs, XFS) sin copiar datos
+FICLONE = 0x40049409
+# Directorios temporales de construcción más viejos que esto se consideran abandonados
+STALE_STAGING_SECONDS = 3600
+WRITE_BITS = stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH
+
+class WorldCacheService:
+    """
+    Caché de mundos direccionado por contenido.
+
+    La clave es el SHA-256 del world.zip más el robot a entrenar (el parcheo del .wbt depende
+    de él). La primera vez el mundo se extrae, valida y parchea en un directorio temporal que
+    luego se publica con un rename atómico en WorldCache/<clave>/; las siguientes veces el
+    workspace del job se arma sin extraer ni parchear nada.
+
+    Los archivos que nunca se escriben (mallas, texturas, PROTOs) se enlazan con hardlinks, así
+    que el disco ocupado es el del caché más solo lo que cada job modifica. Los que sí se
+    escriben (ver COPIED_SUFFIXES y COPIED_DIRS) se copian, con reflink si el sistema de
+    archivos lo permite. Los archivos del caché quedan sin permiso de escritura; como los
+    contenedores corren con el uid de la API podrían devolvérselo y reescribir un archivo
+    enlazado, de modo que en cada acierto se verifica que sigan de solo lectura y, si alguno
+    no lo está, la entrada se descarta y el mundo se vuelve a preparar desde el ZIP. Al
+    superar la cuota se eliminan las entradas usadas hace más tiempo.
+    """
+
+    def __init__(self):
+        config = Config().get_world_cache_config()
+        self.__root = Path(config["path"])
+        self.__max_bytes = config["max_size_mb"] * 1024 * 1024
+        self.__evict_lock = threading.Lock()
+        if self.is_enabled():
+            self.__root.mkdir(parents=True, exist_ok=True)
+
+    def is_enabled(self) -> bool:
+        return self.__max_bytes > 0
+
+    @staticmethod
+    def key(sha256: str, def_robot: str, extern_variant: bool = False) -> str:
+        robot_hash = hashlib.sha1(str(def_robot).encode("utf-8")).hexdigest()[:12]
+        # El mundo con la variante _extern (n_envs > 1) es otra entrada del caché
+        return f"{sha256}-{robot_hash}-extern" if extern_variant else f"{sha256}-{robot_hash}"
+
+    def materialize(self, key: str, job_world_path: Path) -> Optional[Path]:
+        """
+        Arma el mundo cacheado en el workspace del job.
+
+        Returns:
+            Path | None: Ruta al .wbt dentro del job, o None si la clave no está en caché
+        """
+        entry = self.__root / key
+        manifest_path = entry / MANIFEST_FILENAME
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            # El mtime del manifiesto marca el último uso para la política LRU
+            os.utime(manifest_path)
+        except FileNotFoundError:
+            return None
+
+        if not self._is_read_only(entry / "world"):
+            logger.warning(f"La entrada {key} del caché de mundos tiene archivos con escritura, se descarta")
+            self._remove_entry(entry)
+            return None
+
+        try:
+            self._link_tree(entry / "world", Path(job_world_path))
+        except FileNotFoundError:
+            # La entrada se desalojó mientras se armaba
+            logger.warning(f"La entrada {key} del caché de mundos desapareció durante el armado")
+            return None
+        return Path(job_world_path) / manifest["wbt"]
+
+    def staging_dir(self, key: str) -> Path:
+        """Directorio temporal donde extraer, validar y parchear un mundo antes de publicarlo"""
+        staging = self.__root / f".{key}.{uuid.uuid4().hex[:8]}.tmp"
+        (staging / "world").mkdir(parents=True)
+        return staging
+
+    def store(self, key: str, staging: Path, manifest: WorldManifest, world_file: WorldFile):
+        """
+        Publica el mundo ya parcheado del directorio temporal. Si otro job publicó la misma
+        clave primero, se descarta el temporal y se usa la entrada existente.
+        """
+        with open(staging / MANIFEST_FILENAME, "w", encoding="utf-8") as f:
+            json.dump({
+                "wbt": world_file.path.relative_to(staging / "world").as_posix(),
+                "bytes": manifest.total_bytes,
+                "summary": manifest.summary(),
+                "created_at": datetime.now().isoformat()
+            }, f)
+        self._make_read_only(staging / "world")
+
+        try:
+            os.rename(staging, self.__root / key)
+            logger.info(f"Mundo {key} agregado al caché ({manifest.total_bytes} bytes)")
+        except OSError as e:
+            if e.errno not in (errno.EEXIST, errno.ENOTEMPTY):
+                raise
+            self.discard(staging)
+        self.evict(protect=key)
+
+    def discard(self, staging: Path):
+        shutil.rmtree(staging, ignore_errors=True)
+
+    def evict(self, protect: Optional[str] = None):
+        """Elimina las entradas menos usadas hasta quedar bajo la cuota, y temporales abandonados."""
+        with self.__evict_lock:
+            entries = []
+            total = 0
+            for entry in self.__root.iterdir():
+                if entry.name.startswith("."):
+                    if time.time() - entry.stat().st_mtime > STALE_STAGING_SECONDS:
+                        self.discard(entry)
+                    continue
+                try:
+                    manifest_path = entry / MANIFEST_FILENAME
+                    with open(manifest_path, "r", encoding="utf-8") as f:
+                        size = json.load(f).get("bytes", 0)
+                    entries.append((manifest_path.stat().st_mtime, size, entry))
+                    total += size
+                except (OSError, ValueError):
+                    continue
+
+            for _, size, entry in sorted(entries, key=lambda item: item[0]):
+                if total <= self.__max_bytes:
+                    break
+                if entry.name == protect:
+                    continue
+                if not self._remove_entry(entry):
+                    continue
+                total -= size
+                logger.info(f"Mundo {entry.name} desalojado del caché ({size} bytes)")
+
+    def _remove_entry(self, entry: Path) -> bool:
+        """Renombra primero para que nadie arme un workspace con una entrada a medio borrar"""
+        trash = self.__root / f".{entry.name}.{uuid.uuid4().hex[:8]}.evicted"
+        try:
+            os.rename(entry, trash)
+        except OSError:
+            return False
+        self.discard(trash)
+        return True
+
+    @staticmethod
+    def _link_tree(source: Path, destination: Path):
+        """
+        Recrea el árbol de directorios: enlaza los archivos que no se modifican y copia (con
+        permiso de escritura) los que sí. Si no se puede enlazar, copia común.
+        """
+        for root, dirs, files in os.walk(source):
+            relative_root = Path(root).relative_to(source)
+            target_root = destination / relative_root
+            target_root.mkdir(parents=True, exist_ok=True)
+            copy_all = any(part in COPIED_DIRS for part in relative_root.parts)
+            for name in files:
+                source_file = os.path.join(root, name)
+                target_file = target_root / name
+                if not copy_all and not name.endswith(COPIED_SUFFIXES):
+                    try:
+                        os.link(source_file, target_file)
+                        continue
+                    except OSError as e:
+                        # Otro sistema de archivos o límite de enlaces: se copia
+                        if e.errno not in (errno.EXDEV, errno.EMLINK, errno.EPERM):
+                            raise
+                WorldCacheService._clone_file(source_file, target_file)
+                shutil.copystat(source_file, target_file)
+                os.chmod(target_file, os.stat(target_file).st_mode | stat.S_IWUSR)
+
+    @staticmethod
+    def _is_read_only(path: Path) -> bool:
+        for root, _, files in os.walk(path):
+            for name in files:
+                if os.stat(os.path.join(root, name)).st_mode & WRITE_BITS:
+                    return False
+        return True
+
+    @staticmethod
+    def _clone_file(source_file: str, target_file: Path):
+        """Copia con reflink (FICLONE) si el sistema de archivos lo soporta (btrfs, XFS); si no, copia común"""
+        if fcntl is not None:
+            with open(source_file, "rb") as src, open(target_file, "wb") as dst:
+                try:
+                    fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+                    return
+                except OSError as e:
+                    if e.errno not in (errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL, errno.ENOSYS):
+                        raise
+        shutil.copyfile(source_file, target_file)
+
+    @staticmethod
+    def _make_read_only(path: Path):
+        for root, _, files in os.walk(path):
+            for name in files:
+                file_path = os.path.join(root, name)
+                os.chmod(file_path, os.stat(file_path).st_mode & ~WRITE_BITS)
@@ -2,21 +2,62 @@ import os
 import json
 import zipfile
 import shutil
-import re
 from pathlib import Path
 from typing import Dict, Any, List, Optional
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 from Services.core.config import Config
 from Services.core.logging import get_logger
+from Services.wbt_parser import WbtDocument, WbtParseError
 
 logger = get_logger(__name__)
 
-@dataclass
+# Bloque leído por vez al extraer cada archivo del ZIP
+EXTRACT_CHUNK_SIZE = 1024 * 1024
+# Por debajo de este tamaño no se controla la tasa de compresión (archivos de texto chicos comprimen mucho)
+RATIO_CHECK_MIN_BYTES = 1024 * 1024
+
 class WorldProcessingError(Exception):
     """Excepción personalizada para errores en el procesamiento del mundo"""
     pass
 
+# Controlador que el parcheo asigna al robot a entrenar
+INTERNAL_CONTROLLER = "InternalController"
+# Variante del mundo con el robot como controlador externo, para las instancias extra de Webots
+# que lanza el InternalController cuando el job usa n_envs > 1
+EXTERN_WORLD_SUFFIX = "_extern"
+
+@dataclass
+class WorldFile:
+    """Archivo .wbt del mundo, leído una sola vez durante la extracción"""
+    path: Path
+    content: str
+    _document: Optional[WbtDocument] = field(default=None, repr=False, compare=False)
+
+    @property
+    def document(self) -> WbtDocument:
+        """Árbol de nodos del .wbt, parseado la primera vez que se pide"""
+        if self._document is None:
+            self._document = WbtDocument(self.content)
+        return self._document
+
+@dataclass
+class WorldManifest:
+    """Resultado de la extracción: carpeta raíz, archivos .wbt y archivos de cada controlador"""
+    root: Path
+    wbt_files: List[WorldFile] = field(default_factory=list)
+    controllers: Dict[str, List[str]] = field(default_factory=dict)
+    file_count: int = 0
+    total_bytes: int = 0
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "files": self.file_count,
+            "bytes": self.total_bytes,
+            "worlds": [world.path.name for world in self.wbt_files],
+            "controllers": sorted(self.controllers),
+        }
+
 class WorldService:
     """
     Servicio encargado de procesar archivos de mundo de Webots.
@@ -32,6 +73,7 @@ class WorldService:
         self.__config = Config()
         self.__jobs_storage_path = Path(self.__config.get_storage_path())
         self.__internal_controller_path = Path(self.__config.get_internal_controller_path())
+        self.__archive_limits = self.__config.get_world_archive_config()
     
     def setup_job_workspace(self, job_id: str) -> Path:
         """
@@ -62,58 +104,117 @@ class WorldService:
             logger.error(f"Error creando workspace para job {job_id}: {str(e)}")
             raise WorldProcessingError(f"No se pudo crear el workspace: {str(e)}")
     
-    def extract_world_archive(self, zip_file_path: str, job_id: str) -> Path:
+    def extract_world_archive(self, zip_file_path: str, job_id: str, world_path: Optional[Path] = None) -> WorldManifest:
         """
-        Extrae el archivo ZIP del mundo en el directorio del job.
+        Extrae el archivo ZIP del mundo en el directorio del job en una sola pasada.
+
+        Cada archivo se valida (ruta, cantidad de archivos, tamaño total y tasa de compresión)
+        y se descomprime en streaming; zipfile verifica el CRC al terminar de leer cada uno, así
+        que no hace falta un testzip() previo. Durante la misma pasada se arma el manifiesto con
+        los .wbt (cuyo contenido queda en memoria) y los archivos de cada controlador.
         
         Args:
             zip_file_path: Ruta al archivo ZIP
             job_id: Identificador del job
+            world_path: Directorio destino (por defecto Storage/Jobs/<job_id>/world)
             
         Returns:
-            Path: Ruta del directorio donde se extrajo el mundo
+            WorldManifest: Manifiesto del mundo extraído
             
         Raises:
             WorldProcessingError: Si hay problemas con la extracción
         """
-        job_path = os.path.join(self.__jobs_storage_path, job_id)
-        world_path = os.path.join(job_path, 'world')
+        world_path = Path(world_path or Path(self.__jobs_storage_path) / job_id / 'world')
+        world_path.mkdir(parents=True, exist_ok=True)
+        max_bytes = self.__archive_limits["max_uncompressed_mb"] * 1024 * 1024
+        extracted_folder_name = None
         
         try:
             with zipfile.ZipFile(zip_file_path, 'r') as zip_ref:
-                # Validar que el ZIP no esté corrupto
-                bad_file = zip_ref.testzip()
-                if bad_file:
-                    raise WorldProcessingError(f"Archivo ZIP corrupto: {bad_file}")
-                
-                # Encontrar el nombre de la carpeta raíz dentro del ZIP
-                if zip_ref.namelist():
-                    first_item = zip_ref.namelist()[0]
-                    # Extraer solo el nombre de la carpeta (ej. "autonomo/")
-                    if '/' in first_item:
-                        extracted_folder_name = first_item.split('/')[0]
-                
+                members = zip_ref.infolist()
+                if len(members) > self.__archive_limits["max_entries"]:
+                    raise WorldProcessingError(f"El ZIP tiene demasiados archivos ({len(members)})")
+                if sum(member.file_size for member in members) > max_bytes:
+                    raise WorldProcessingError("El contenido del ZIP supera el tamaño máximo permitido")
+
+                # Encontrar el nombre de la carpeta raíz dentro del ZIP (ej. "autonomo/")
+                if members and '/' in members[0].filename:
+                    extracted_folder_name = members[0].filename.split('/')[0]
                 if not extracted_folder_name:
                     raise WorldProcessingError("No se pudo determinar la carpeta raíz en el archivo ZIP.")
+
+                manifest = WorldManifest(root=world_path / extracted_folder_name)
+                resolved_world_path = world_path.resolve()
+                for member in members:
+                    self._extract_member(zip_ref, member, world_path, resolved_world_path, manifest, max_bytes)
                 
-                # Validar nombres de archivos (seguridad)
-                for member in zip_ref.infolist():
-                    if self._is_unsafe_path(member.filename):
-                        raise WorldProcessingError(f"Ruta insegura detectada: {member.filename}")
-                
-                # Extraer archivos
-                zip_ref.extractall(world_path)
-                
-            extracted_path=os.path.join(world_path, extracted_folder_name)
-            logger.info(f"Mundo extraído para job {job_id} en {extracted_path}")
-            return extracted_path
+            logger.info(f"Mundo extraído para job {job_id} en {manifest.root}: {manifest.file_count} archivos, "
+                        f"{manifest.total_bytes} bytes")
+            return manifest
             
-        except zipfile.BadZipFile:
-            logger.error(f"Archivo ZIP inválido para job {job_id}")
-            raise WorldProcessingError("El archivo proporcionado no es un ZIP válido")
+        except zipfile.BadZipFile as e:
+            logger.error(f"Archivo ZIP inválido o corrupto para job {job_id}: {e}")
+            self._discard_extraction(world_path)
+            raise WorldProcessingError(f"El archivo proporcionado no es un ZIP válido: {e}")
         except Exception as e:
             logger.error(f"Error extrayendo mundo para job {job_id}: {str(e)}")
+            self._discard_extraction(world_path)
             raise WorldProcessingError(f"Error en la extracción: {str(e)}")
+
+    def _extract_member(self, zip_ref: zipfile.ZipFile, member: zipfile.ZipInfo, world_path: Path,
+                        resolved_world_path: Path, manifest: WorldManifest, max_bytes: int):
+        """Valida y extrae un archivo del ZIP, registrándolo en el manifiesto"""
+        # Validar nombres de archivos (seguridad)
+        if self._is_unsafe_path(member.filename):
+            raise WorldProcessingError(f"Ruta insegura detectada: {member.filename}")
+        target = world_path / member.filename
+        if not target.resolve().is_relative_to(resolved_world_path):
+            raise WorldProcessingError(f"Ruta insegura detectada: {member.filename}")
+
+        if member.is_dir():
+            target.mkdir(parents=True, exist_ok=True)
+            return
+
+        if (member.file_size > RATIO_CHECK_MIN_BYTES and
+                member.file_size > member.compress_size * self.__archive_limits["max_compression_ratio"]):
+            raise WorldProcessingError(f"Tasa de compresión sospechosa en {member.filename}")
+
+        # La variante _extern la genera el parcheo: si el ZIP trae una no cuenta como mundo
+        is_world = (member.filename.endswith(".wbt")
+                    and not Path(member.filename).stem.endswith(EXTERN_WORLD_SUFFIX))
+        world_chunks = []
+        written = 0
+        target.parent.mkdir(parents=True, exist_ok=True)
+        with zip_ref.open(member) as source, open(target, 'wb') as destination:
+            while True:
+                chunk = source.read(EXTRACT_CHUNK_SIZE)
+                if not chunk:
+                    break
+                written += len(chunk)
+                # Los tamaños declarados en el ZIP pueden mentir: se controla lo realmente escrito
+                if written > member.file_size or manifest.total_bytes + written > max_bytes:
+                    raise WorldProcessingError(f"{member.filename} supera el tamaño declarado o el máximo permitido")
+                destination.write(chunk)
+                if is_world:
+                    world_chunks.append(chunk)
+
+        manifest.file_count += 1
+        manifest.total_bytes += written
+        parts = Path(member.filename).parts
+        if is_world:
+            manifest.wbt_files.append(WorldFile(target, b"".join(world_chunks).decode("utf-8")))
+        elif "controllers" in parts[:-1]:
+            index = parts.index("controllers")
+            if index + 2 < len(parts):
+                manifest.controllers.setdefault(parts[index + 1], []).append("/".join(parts[index + 2:]))
+
+    def _discard_extraction(self, world_path: Path):
+        """Elimina lo extraído parcialmente si la ingesta falló"""
+        for entry in world_path.iterdir() if world_path.exists() else []:
+            if entry.is_dir() and not entry.is_symlink():
+                shutil.rmtree(entry, ignore_errors=True)
+            else:
+                entry.unlink(missing_ok=True)
     
     def get_robot(self, job_id:str) -> str:
         """
@@ -137,78 +238,108 @@ class WorldService:
             logger.error(f"Archivo de configuración no encontrado para job {job_id}")
         except json.JSONDecodeError:
             logger.error(f"Error leyendo archivo de configuración para job {job_id}. JSON no valido")
+
+    def get_n_envs(self, job_id: str) -> int:
+        """
+        Obtiene la cantidad de entornos (n_envs) del archivo de configuración .JSON.
+
+        Returns:
+            int: n_envs pedido por el job (1 si no lo declara o no se puede leer)
+        """
+        config_path = os.path.join(self.__jobs_storage_path, job_id, 'config', 'train_config.json')
+        try:
+            with open(config_path, 'r', encoding='utf-8') as f:
+                return max(int(json.load(f).get('n_envs', 1)), 1)
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            logger.warning(f"No se pudo leer n_envs del job {job_id}, se usa 1: {e}")
+            return 1
    
-    def validate_world(self,name_robot:str, world_path: Path):
+    def validate_world(self,name_robot:str, manifest: WorldManifest) -> Optional[WorldFile]:
         """
-        Valida que el mundo extraído sea válido para Webots.
+        Valida que el mundo extraído sea válido para Webots, a partir del manifiesto armado al
+        extraerlo (sin volver a recorrer el directorio ni leer el .wbt).
         
         Args:
-            world_path: Ruta del directorio del mundo
+            name_robot: DEF, name o tipo del robot a entrenar
+            manifest: Manifiesto devuelto por extract_world_archive
             
         Returns:
-            WorldValidationResult: Resultado de la validación
+            WorldFile | None: El .wbt del mundo, o None si la validación falló
         """
         
         try:
-            # Buscar archivos .wbt
-            wbt_files = list(world_path.rglob("*.wbt"))
+            wbt_files = manifest.wbt_files
             
             if not wbt_files:
                 raise WorldProcessingError("No se encontró ningún archivo .wbt en el mundo")
             
             if len(wbt_files) > 1:
-                raise WorldProcessingError(f"Se encontraron múltiples archivos .wbt: {[f.name for f in wbt_files]}")
+                raise WorldProcessingError(f"Se encontraron múltiples archivos .wbt: {[f.path.name for f in wbt_files]}")
             
-            # Usar el primer archivo .wbt encontrado
             world_file = wbt_files[0]
             
             # Validar contenido del archivo .wbt
             robots = self._find_robot_in_wbt(name_robot,world_file)
             
             if not robots:
-                raise WorldProcessingError("No se encontró ningún robot ",name_robot," en el archivo .wbt")
+                raise WorldProcessingError(f"No se encontró ningún robot {name_robot} en el archivo .wbt")
             
             # Validar estructura básica
             if not self._validate_wbt_structure(world_file):
                 raise WorldProcessingError("Estructura del archivo .wbt inválida.")
             
-            logger.info(f"Mundo validado correctamente: {world_file.name}, robots encontrados: {robots}")
+            logger.info(f"Mundo validado correctamente: {world_file.path.name}, robots encontrados: {robots}")
             
             return world_file
         except Exception as e:
             logger.error(f"Error validando mundo: {str(e)}")
            
-    def patch_world_controllers(self,robot_name:str, world_file_path: str) -> None:
+    def patch_world_controllers(self,robot_name:str, world_file: WorldFile, extern_variant: bool = False) -> None:
         """
-        Parchea el archivo .wbt para que todos los robots usen InternalController.
+        Parchea el archivo .wbt para que el robot use InternalController. Usa el árbol de nodos
+        ya parseado: reemplaza el valor del campo controller de cada nodo del robot (o lo agrega
+        si el nodo no lo declara) sin tocar el resto del archivo. Con extern_variant además
+        escribe la variante <mundo>_extern.wbt, con el robot como controlador externo, a partir
+        del mismo árbol.
         
         Args:
-            world_file_path: Ruta al archivo .wbt
+            robot_name: DEF, name o tipo del robot a entrenar
+            world_file: .wbt validado por validate_world
+            extern_variant: Si el job usa n_envs > 1 y necesita la variante _extern
             
         Raises:
             WorldProcessingError: Si hay problemas con el parcheo
         """
         try:
-            world_file = Path(world_file_path)
-            
-            # Leer contenido original
-            with open(world_file, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
+            document = world_file.document
+            robots = document.find(robot_name)
+            if not robots:
+                raise WorldProcessingError(f"No se encontró el robot {robot_name} en el archivo .wbt")
+
             # Crear backup
-            backup_path = world_file.with_suffix('.wbt.backup')
+            backup_path = world_file.path.with_suffix('.wbt.backup')
             with open(backup_path, 'w', encoding='utf-8') as f:
-                f.write(content)
+                f.write(world_file.content)
             
-            # Parchear controladores
-            patched_content = self._patch_controllers_in_content(robot_name,content)
+            if extern_variant:
+                # Variante para entornos vectorizados: mismo mundo, robot conectado desde afuera
+                for robot in robots:
+                    document.set_field(robot, "controller", '"<extern>"')
+                extern_path = world_file.path.with_name(f"{world_file.path.stem}{EXTERN_WORLD_SUFFIX}.wbt")
+                with open(extern_path, 'w', encoding='utf-8') as f:
+                    f.write(document.render())
+                document.discard_changes()
+
+            # Parchear controladores: solo cambia el valor del campo controller de cada nodo
+            for robot in robots:
+                document.set_field(robot, "controller", f'"{INTERNAL_CONTROLLER}"')
             
-            # Escribir archivo parcheado
-            with open(world_file, 'w', encoding='utf-8') as f:
-                f.write(patched_content)
+            # Escribir solo los bytes modificados del archivo
+            world_file.content = document.write(world_file.path)
+            world_file._document = None
             
             #shutil.rmtree(backup_path, ignore_errors=True)  # Eliminar backup
-            logger.info(f"Archivo .wbt parcheado correctamente: {world_file.name}")
+            logger.info(f"Archivo .wbt parcheado correctamente: {world_file.path.name} ({len(robots)} nodos)")
             
         except Exception as e:
             logger.error(f"Error parcheando archivo .wbt: {str(e)}")
@@ -234,119 +365,38 @@ class WorldService:
         """Verifica si una ruta es insegura (path traversal)"""
         return os.path.isabs(path) or ".." in path
     
-    def _find_robot_in_wbt(self,robot:str, wbt_file: Path) -> List[str]:
+    def _find_robot_in_wbt(self,robot:str, wbt_file: WorldFile) -> bool:
         """
         Busca una definición específica de robot en el archivo .wbt.
 
         Args:
             robot (str): El nombre del robot a buscar.
-            wbt_file (Path): La ruta del archivo .wbt.
+            wbt_file (WorldFile): El archivo .wbt ya cargado.
 
         Returns:
             bool: True si el robot es encontrado, False en caso contrario.
         """
         try:
-            with open(wbt_file, 'r', encoding='utf-8') as f:
-                content = f.read()
-
-            # Patrón para capturar robots por DEF, name, o por el tipo de PROTO.
-            # Usa re.escape para manejar correctamente caracteres especiales en el nombre.
-            # El patrón es "DEF nombre_robot { ... }" o "nombre_robot { ... }" o "name "nombre_robot"".
-            pattern = re.compile(
-                # Patrón 1: Busca 'DEF nombre_robot Rosbot'
-                r'DEF\s+' + re.escape(robot) + r'\s+[\w]+\s*{'
-                r'|'
-                # Patrón 2: Busca 'name "nombre_robot"'
-                r'name\s*"' + re.escape(robot) + r'"'
-                r'|'
-                # Patrón 3: Busca el tipo de robot (ej. "Elisa3 {")
-                r'' + re.escape(robot) + r'\s*{',
-                re.MULTILINE | re.DOTALL
-            )
-            
-            # re.search es más eficiente que re.findall para encontrar la primera coincidencia.
-            if re.search(pattern, content):
+            # Búsqueda O(1) en los índices de DEF, name y tipo del documento
+            if wbt_file.document.find(robot):
                 logger.info(f"El robot '{robot}' fue encontrado en el archivo.")
                 return True
                 
-        except FileNotFoundError:
-            logger.error(f"Error: El archivo '{wbt_file}' no fue encontrado.")
-        except Exception as e:
-            logger.warning(f"Error buscando el robot '{robot}' en {wbt_file}: {str(e)}")
+        except WbtParseError as e:
+            logger.warning(f"Error buscando el robot '{robot}' en {wbt_file.path}: {str(e)}")
         
         return False
     
-    def _validate_wbt_structure(self, wbt_file: Path) -> bool:
+    def _validate_wbt_structure(self, wbt_file: WorldFile) -> bool:
         """Valida la estructura básica del archivo .wbt"""
+        # Encabezado VRML y nodos WorldInfo y Viewpoint presentes
+        if not wbt_file.content.lstrip('\ufeff').startswith('#VRML'):
+            return False
         try:
-            with open(wbt_file, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # Verificaciones básicas
-            required_elements = ['#VRML', 'WorldInfo', 'Viewpoint']
-            return all(element in content for element in required_elements)
-            
-        except Exception:
+            nodes_by_type = wbt_file.document.by_type
+        except WbtParseError:
             return False
-    
-    def _patch_controllers_in_content(self, name: str, content: str) -> str:
-        """
-        Parchea el contenido del archivo .wbt para cambiar el controlador de un robot específico.
-        
-        Args:
-            name (str): El nombre del robot (DEF, name, o tipo de PROTO).
-            controller (str): El nombre del controlador actual del robot.
-            content (str): El contenido completo del archivo .wbt.
-
-        Returns:
-            str: El contenido del archivo .wbt con el controlador actualizado.
-        """
-        lines = content.split('\n')
-        result_lines = []
-        i = 0
-        
-        while i < len(lines):
-            line = lines[i]
-            
-            # Buscar líneas que contengan el robot específico
-            robot_found = False
-            
-            # Caso 1: DEF robot_name TipoRobot {
-            def_pattern = rf'DEF\s+{re.escape(name)}\s+\w+\s*\{{'
-            if re.search(def_pattern, line):
-                robot_found = True
-            
-            # Caso 2: TipoRobot { (donde TipoRobot es robot_name)
-            elif re.match(rf'{re.escape(name)}\s*\{{', line.strip()):
-                robot_found = True
-            
-            if robot_found:
-                # Encontramos el robot, ahora buscar su controlador
-                result_lines.append(line)  # Añadir la línea del robot
-                i += 1
-                brace_count = line.count('{') - line.count('}')
-                
-                # Procesar el contenido del robot hasta cerrar todas las llaves
-                while i < len(lines) and brace_count > 0:
-                    current_line = lines[i]
-                    
-                    # Si encontramos una línea de controller, la reemplazamos
-                    if re.search(r'^\s*controller\s*"[^"]*"', current_line):
-                        # Mantener la indentación original
-                        indent_match = re.match(r'^(\s*)', current_line)
-                        indent = indent_match.group(1) if indent_match else '  '
-                        current_line = f'{indent}controller "InternalController"'
-                    
-                    result_lines.append(current_line)
-                    brace_count += current_line.count('{') - current_line.count('}')
-                    i += 1
-            else:
-                result_lines.append(line)
-                i += 1
-        
-        return '\n'.join(result_lines)
-        
-    
+        return 'WorldInfo' in nodes_by_type and 'Viewpoint' in nodes_by_type
 
 
 if __name__ == "__main__":
@@ -355,7 +405,7 @@ if __name__ == "__main__":
     job_id = "job_123"
     path_zip = "/home/roman7978/Documentos/university_portfolio/Tesis/autonomous_robot.zip"
     #service.setup_job_workspace(job_id)
-    #extracted=service.extract_world_archive(path_zip, job_id)
+    #manifest=service.extract_world_archive(path_zip, job_id)
     #name,controller,env_class = service.get_robot(job_id)
-    #wbt=service.validate_world(name,Path("../Storage/Jobs/job_123/world/Autonomous Robot"))
+    #wbt=service.validate_world(name,manifest)
     #service.patch_world_controllers(name,wbt)
@@ -1,42 +1,207 @@
 import asyncio
 import json
+import sys
 from datetime import datetime
 import logging
 from pathlib import Path
-from typing import Dict, Set
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, HTTPException
 from watchdog.observers import Observer
+from watchdog.observers.api import ObservedWatch
 from watchdog.events import FileSystemEventHandler
-import aiofiles
-from Services.state_service import StateService
+from Services.job_index_service import JobIndexService
+from Services.metrics_service import MetricsTailer, REPLAY_CHUNK_SIZE
 
 # Configurar logging
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+STATE_FILENAME = "state.json"
+METRICS_FILENAME = "training_metrics.jsonl"
+
+# Mensajes pendientes por cliente antes de empezar a descartar métricas viejas
+CLIENT_QUEUE_SIZE = 256
+# Tiempo máximo para vaciar la cola de un cliente antes de cerrarlo
+CLIENT_CLOSE_TIMEOUT = 5.0
+
+class ClientConnection:
+    """
+    Cola de envío acotada de un WebSocket, atendida por su propia tarea.
+
+    broadcast_to_job solo encola el payload ya serializado, así un cliente lento no demora
+    al resto. Si la cola se llena se descarta la métrica más vieja pendiente (el dashboard
+    solo pierde puntos intermedios); los mensajes de estado nunca se descartan.
+
+    Sin opciones cada métrica sale en su propio frame (formato original). Con max_rate o
+    batch_size las métricas se agrupan en frames {"type": "metrics", "data": [...]}, como
+    mucho max_rate frames por segundo y batch_size métricas por frame. Con delta cada métrica
+    solo lleva los campos que cambiaron respecto de la anterior enviada al cliente.
+    """
+
+    def __init__(self, websocket: WebSocket, job_id: str, connection_manager: "ConnectionManagerService",
+                 max_rate: Optional[float] = None, batch_size: Optional[int] = None, delta: bool = False):
+        self.websocket = websocket
+        self.job_id = job_id
+        self.dropped = 0
+        self.__manager = connection_manager
+        self.__batched = max_rate is not None or batch_size is not None or delta
+        self.__interval = 1.0 / max_rate if max_rate else 0.0
+        self.__batch_size = batch_size or CLIENT_QUEUE_SIZE
+        self.__delta = delta
+        self.__last_sent: Optional[dict] = None
+        # Métricas en vivo con seq menor ya se enviaron en el replay
+        self.live_from_seq = 0
+        self.__max_queue = max(CLIENT_QUEUE_SIZE, self.__batch_size)
+        # (payload, mensaje original o None, descartable)
+        self.__queue: Deque[Tuple[str, Optional[dict], bool]] = deque()
+        self.__pending = asyncio.Event()
+        self.__drained = asyncio.Event()
+        self.__drained.set()
+        self.__task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self.__task = asyncio.create_task(self._sender())
+
+    def enqueue(self, payload: str, droppable: bool = True, message: Optional[dict] = None):
+        """Encola un mensaje serializado sin bloquear. message solo hace falta para delta y replay."""
+        if droppable and message is not None and message.get("seq", self.live_from_seq) < self.live_from_seq:
+            return
+        if len(self.__queue) >= self.__max_queue and not self._drop_oldest_metric():
+            if droppable:
+                self.dropped += 1
+                return
+        self.__queue.append((payload, message, droppable))
+        self.__drained.clear()
+        self.__pending.set()
+
+    async def replay(self, records: List[dict]):
+        """
+        Envía historial directamente, antes de arrancar la tarea de envío; mientras tanto las
+        métricas en vivo se acumulan en la cola y salen después, sin huecos ni duplicados.
+        """
+        step = self.__batch_size if self.__batched else 1
+        for i in range(0, len(records), step):
+            items = [(json.dumps(record), record) for record in records[i:i + step]]
+            await self.websocket.send_text(self._frame(items) if self.__batched else items[0][0])
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        """Espera a que se envíe lo pendiente (con límite de tiempo) y cierra el socket"""
+        try:
+            await asyncio.wait_for(self.__drained.wait(), timeout=CLIENT_CLOSE_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning(f"Cliente de job {self.job_id} no vació su cola a tiempo, se cierra igual")
+        self.stop()
+        try:
+            await self.websocket.close(code=code, reason=reason)
+        except Exception as e:
+            logger.error(f"Error cerrando conexión WebSocket: {e}")
+
+    def stop(self):
+        if self.__task is not None and self.__task is not asyncio.current_task():
+            self.__task.cancel()
+        if self.dropped:
+            logger.info(f"Cliente de job {self.job_id}: {self.dropped} métricas descartadas por lentitud")
+
+    def _drop_oldest_metric(self) -> bool:
+        for i, (_, _, droppable) in enumerate(self.__queue):
+            if droppable:
+                del self.__queue[i]
+                self.dropped += 1
+                return True
+        return False
+
+    def _next_frame(self) -> str:
+        """Arma el próximo frame: un mensaje de estado suelto o un lote de métricas consecutivas"""
+        payload, message, droppable = self.__queue.popleft()
+        if not self.__batched or not droppable:
+            return payload
+
+        items = [(payload, message)]
+        while self.__queue and len(items) < self.__batch_size and self.__queue[0][2]:
+            next_payload, next_message, _ = self.__queue.popleft()
+            items.append((next_payload, next_message))
+        return self._frame(items)
+
+    def _frame(self, items: List[Tuple[str, Optional[dict]]]) -> str:
+        if self.__delta:
+            data = json.dumps([self._delta(msg if msg is not None else json.loads(raw)) for raw, msg in items])
+            return f'{{"type": "metrics", "delta": true, "data": {data}}}'
+        # Las métricas ya vienen serializadas: el frame se arma concatenando
+        return f'{{"type": "metrics", "data": [{", ".join(raw for raw, _ in items)}]}}'
+
+    def _delta(self, metric: dict) -> dict:
+        """Campos que cambiaron respecto de la métrica anterior; los eliminados van en null"""
+        previous, self.__last_sent = self.__last_sent, metric
+        if previous is None:
+            return metric
+        diff = {key: value for key, value in metric.items() if previous.get(key) != value or key not in previous}
+        diff.update({key: None for key in previous.keys() - metric.keys()})
+        return diff
+
+    async def _sender(self):
+        loop = asyncio.get_running_loop()
+        next_send = 0.0
+        try:
+            while True:
+                if not self.__queue:
+                    self.__drained.set()
+                    self.__pending.clear()
+                    await self.__pending.wait()
+                    continue
+                # Respetar la tasa máxima; mientras tanto se acumulan (o descartan) métricas
+                wait = next_send - loop.time()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                await self.websocket.send_text(self._next_frame())
+                next_send = loop.time() + self.__interval
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error enviando mensaje a WebSocket: {e}")
+            self.__drained.set()
+            await self.__manager.disconnect(self.websocket, self.job_id)
+
+
 class ConnectionManagerService:
     """Maneja las conexiones WebSocket activas por job_id"""
     
     def __init__(self):
-        # job_id -> Set[WebSocket]
-        self.active_connections: Dict[str, Set[WebSocket]] = {}
-        # job_id -> Observer (file watcher)
-        self.file_observers: Dict[str, Observer] = {}  # type: ignore 
-        # job_id -> Observer (state watcher)
-        self.state_observers: Dict[str, Observer] = {} # type: ignore 
+        # job_id -> {WebSocket: ClientConnection}
+        self.active_connections: Dict[str, Dict[WebSocket, ClientConnection]] = {}
+        # Un único Observer (un hilo) para todos los jobs; cada job agrega/quita su watch
+        self.observer = Observer()
+        # job_id -> ObservedWatch sobre Storage/Jobs/<job_id>/logs
+        self.watches: Dict[str, ObservedWatch] = {}
+        # job_id -> JobLogsHandler (procesa los eventos de estado y métricas del job)
+        self.job_handlers: Dict[str, "JobLogsHandler"] = {}
+        self.event_handler = None
         # job_id -> último contenido leído
         self.last_metrics: Dict[str, dict] = {}
-        # job_id -> StateService instance
-        self.state_services: Dict[str, StateService] = {}
+        # job_id -> MetricsTailer (offset de lectura de training_metrics.jsonl)
+        self.metric_tailers: Dict[str, MetricsTailer] = {}
+        # job_id -> última versión de state.json notificada
+        self.state_versions: Dict[str, int] = {}
+        # Índice de jobs: el estado se sirve desde SQLite y solo se relee state.json si cambió
+        self.job_index = JobIndexService()
     
-    async def connect(self, websocket: WebSocket, job_id: str):
-        """Conecta un WebSocket y configura el file watcher si es necesario"""
+    async def connect(self, websocket: WebSocket, job_id: str, max_rate: Optional[float] = None,
+                      batch_size: Optional[int] = None, delta: bool = False, since: Optional[int] = None):
+        """
+        Conecta un WebSocket y configura el file watcher si es necesario
+
+        Args:
+            max_rate: Máximo de frames por segundo para este cliente
+            batch_size: Máximo de métricas por frame
+            delta: Enviar solo los campos que cambiaron entre métricas
+            since: Último seq que el cliente ya tiene; se reenvían solo los registros posteriores
+        """
         
         # Verificar estado del job antes de aceptar conexión
-        state_service = self._get_state_service(job_id)
         try:
-            current_state = state_service.get_state()
+            job_state = self.job_index.get_state(job_id)
+            current_state = job_state["state"]
         except Exception as e:
             logger.error(f"Error obteniendo estado del job {job_id}: {e}")
             await websocket.close(code=4003, reason="Error reading job state")
@@ -53,66 +218,71 @@ class ConnectionManagerService:
         await websocket.accept()
         
         if job_id not in self.active_connections:
-            self.active_connections[job_id] = set()
+            self.active_connections[job_id] = {}
         
-        self.active_connections[job_id].add(websocket)
+        client = ClientConnection(websocket, job_id, self, max_rate=max_rate, batch_size=batch_size, delta=delta)
+        if since is not None:
+            # Hasta conocer el cursor del tailer, lo que llegue en vivo queda cubierto por el replay
+            client.live_from_seq = sys.maxsize
+        self.active_connections[job_id][websocket] = client
         
         # Si es la primera conexión para este job, iniciar watchers
         if len(self.active_connections[job_id]) == 1:
-            await self._start_file_watcher(job_id)
-            await self._start_state_watcher(job_id)
+            self.state_versions[job_id] = job_state.get("version")
+            await self._start_watcher(job_id)
         
-        # Enviar último metric conocido si existe
-        if job_id in self.last_metrics:
+        tailer = self.metric_tailers.get(job_id)
+        if since is not None and tailer is not None:
+            # Todo registro con seq >= live_from_seq todavía va a llegar por broadcast
+            client.live_from_seq = tailer.get_next_seq()
             try:
-                await websocket.send_text(json.dumps(self.last_metrics[job_id]))
+                for start in range(since + 1, client.live_from_seq, REPLAY_CHUNK_SIZE):
+                    await client.replay(await tailer.read_range(
+                        start, min(start + REPLAY_CHUNK_SIZE, client.live_from_seq)))
             except Exception as e:
-                logger.error(f"Error enviando último metric a nueva conexión: {e}")
+                logger.error(f"Error reenviando métricas del job {job_id}: {e}")
+        elif job_id in self.last_metrics:
+            # Enviar último metric conocido si existe
+            last_metric = self.last_metrics[job_id]
+            client.enqueue(json.dumps(last_metric), message=last_metric)
         
         # Enviar estado actual
-        try:
-            await websocket.send_text(json.dumps({
-                "type": "status",
-                "state": current_state,
-                "message": f"Connected to job {job_id}. Current state: {current_state}"
-            }))
-        except Exception as e:
-            logger.error(f"Error enviando estado inicial: {e}")
+        client.enqueue(json.dumps({
+            "type": "status",
+            "state": current_state,
+            "message": f"Connected to job {job_id}. Current state: {current_state}"
+        }), droppable=False)
+        client.start()
     
     async def disconnect(self, websocket: WebSocket, job_id: str):
         """Desconecta un WebSocket y limpia resources si es necesario"""
         if job_id in self.active_connections:
-            self.active_connections[job_id].discard(websocket)
+            client = self.active_connections[job_id].pop(websocket, None)
+            if client is not None:
+                client.stop()
             
             # Si no quedan conexiones, detener watchers
             if len(self.active_connections[job_id]) == 0:
-                await self._stop_file_watcher(job_id)
-                await self._stop_state_watcher(job_id)
+                await self._stop_watcher(job_id)
                 del self.active_connections[job_id]
-                # Limpiar state service del cache
-                if job_id in self.state_services:
-                    del self.state_services[job_id]
+                self.state_versions.pop(job_id, None)
     
     async def broadcast_to_job(self, job_id: str, message: dict):
-        """Envía un mensaje a todas las conexiones de un job específico"""
+        """
+        Envía un mensaje a todas las conexiones de un job específico. El mensaje se serializa
+        una sola vez y se encola en cada cliente; cada cliente lo envía desde su propia tarea.
+        """
         if job_id not in self.active_connections:
             return
         
         # Actualizar último metric si es una métrica
-        if message.get("type") != "status":
+        is_status = message.get("type") == "status"
+        if not is_status:
             self.last_metrics[job_id] = message
         
-        disconnected = []
-        for websocket in self.active_connections[job_id].copy():
-            try:
-                await websocket.send_text(json.dumps(message))
-            except Exception as e:
-                logger.error(f"Error enviando mensaje a WebSocket: {e}")
-                disconnected.append(websocket)
-        
-        # Limpiar conexiones desconectadas
-        for ws in disconnected:
-            await self.disconnect(ws, job_id)
+        payload = json.dumps(message)
+        for client in list(self.active_connections[job_id].values()):
+            client.enqueue(payload, droppable=not is_status, message=message)
     
     async def close_job_connections(self, job_id: str, reason: str = "Training finished"):
         """Cierra todas las conexiones de un job específico"""
@@ -127,138 +297,124 @@ class ConnectionManagerService:
             "final": True
         }
         
-        for websocket in self.active_connections[job_id].copy():
-            try:
-                await websocket.send_text(json.dumps(final_message))
-                await websocket.close(code=1000, reason=reason)
-            except Exception as e:
-                logger.error(f"Error cerrando conexión WebSocket: {e}")
+        clients = list(self.active_connections.pop(job_id).values())
+        self.state_versions.pop(job_id, None)
+        await self._stop_watcher(job_id)
         
-        # Limpiar recursos
-        await self._stop_file_watcher(job_id)
-        await self._stop_state_watcher(job_id)
-        if job_id in self.active_connections:
-            del self.active_connections[job_id]
-        if job_id in self.state_services:
-            del self.state_services[job_id]
+        # Cada cliente envía lo pendiente más el mensaje final y se cierra, en paralelo
+        payload = json.dumps(final_message)
+        for client in clients:
+            client.enqueue(payload, droppable=False)
+        await asyncio.gather(*(client.close(code=1000, reason=reason) for client in clients))
     
-    def _get_state_service(self, job_id: str) -> StateService:
-        """Obtiene o crea una instancia de StateService para el job"""
-        if job_id not in self.state_services:
-            state_path = Path(f"Storage/Jobs/{job_id}/logs/state.json")
-            state_service = StateService()
-            state_service.set_path(state_path)
-            self.state_services[job_id] = state_service
-        
-        return self.state_services[job_id]
+    def get_job_state(self, job_id: str) -> str:
+        """Obtiene el estado del job desde el índice de jobs"""
+        return self.job_index.get_state(job_id)["state"]
     
-    async def _start_state_watcher(self, job_id: str):
-        """Inicia el state watcher para un job específico"""
-        state_file = Path(f"Storage/Jobs/{job_id}/logs/state.json")
+    async def _start_watcher(self, job_id: str):
+        """Agrega el directorio logs/ del job al observer compartido"""
+        logs_dir = Path(f"Storage/Jobs/{job_id}/logs")
         
-        if not state_file.parent.exists():
+        if not logs_dir.exists():
             logger.warning(f"Directorio de logs no existe para job {job_id}")
             return
         
-        # Configurar state watcher
-        loop = asyncio.get_running_loop()
-        event_handler = StateFileHandler(job_id, self, loop)
-        observer = Observer()
-        observer.schedule(
-            event_handler, 
-            str(state_file.parent), 
-            recursive=False
-        )
-        observer.start()
+        # Leer solo el último metric si el archivo ya existe; el tailer sigue desde ahí
+        tailer = MetricsTailer(logs_dir / METRICS_FILENAME)
+        self.metric_tailers[job_id] = tailer
+        last_metric = await tailer.read_last_record()
+        if last_metric is not None:
+            self.last_metrics[job_id] = last_metric
         
-        self.state_observers[job_id] = observer
-        logger.info(f"State watcher iniciado para job {job_id}")
-    
-    async def _stop_state_watcher(self, job_id: str):
-        """Detiene el state watcher para un job específico"""
-        if job_id in self.state_observers:
-            observer = self.state_observers[job_id]
-            observer.stop()
-            observer.join()
-            del self.state_observers[job_id]
-            logger.info(f"State watcher detenido para job {job_id}")
-    
-    async def _start_file_watcher(self, job_id: str):
-        """Inicia el file watcher para un job específico"""
-        metrics_file = Path(f"Storage/Jobs/{job_id}/logs/training_metrics.jsonl")
-        
-        if not metrics_file.parent.exists():
-            logger.warning(f"Directorio de logs no existe para job {job_id}")
-            return
-        
-        # Leer último metric si el archivo ya existe
-        if metrics_file.exists():
-            await self._read_last_metric(job_id, str(metrics_file))
+        if self.event_handler is None:
+            self.event_handler = JobsLogsEventHandler(self, asyncio.get_running_loop())
+        if not self.observer.is_alive():
+            self.observer.start()
         
-        # Configurar file watcher
-        loop = asyncio.get_running_loop()
-        event_handler = MetricsFileHandler(job_id, self, loop)
-        observer = Observer()
-        observer.schedule(
-            event_handler, 
-            str(metrics_file.parent), 
+        self.job_handlers[job_id] = JobLogsHandler(job_id, self)
+        self.watches[job_id] = self.observer.schedule(
+            self.event_handler, 
+            str(logs_dir), 
             recursive=False
         )
-        observer.start()
-        
-        self.file_observers[job_id] = observer
-        logger.info(f"File watcher iniciado para job {job_id}")
+        logger.info(f"Watcher iniciado para job {job_id}")
     
-    async def _stop_file_watcher(self, job_id: str):
-        """Detiene el file watcher para un job específico"""
-        if job_id in self.file_observers:
-            observer = self.file_observers[job_id]
-            observer.stop()
-            observer.join()
-            del self.file_observers[job_id]
-            logger.info(f"File watcher detenido para job {job_id}")
+    async def _stop_watcher(self, job_id: str):
+        """Quita el watch del job del observer compartido"""
+        watch = self.watches.pop(job_id, None)
+        if watch is not None:
+            try:
+                self.observer.unschedule(watch)
+            except KeyError:
+                pass
+            logger.info(f"Watcher detenido para job {job_id}")
+        self.job_handlers.pop(job_id, None)
+        self.metric_tailers.pop(job_id, None)
+
+    def shutdown(self):
+        """Detiene el observer compartido al apagar la API"""
+        if self.observer.is_alive():
+            self.observer.stop()
+            self.observer.join()
     
-    async def _read_last_metric(self, job_id: str, file_path: str):
-        """Lee la última línea del archivo de metrics"""
-        try:
-            async with aiofiles.open(file_path, 'r') as f:
-                lines = await f.readlines()
-                if lines:
-                    last_line = lines[-1].strip()
-                    if last_line:
-                        metric = json.loads(last_line)
-                        self.last_metrics[job_id] = metric
-        except Exception as e:
-            logger.error(f"Error leyendo último metric para job {job_id}: {e}")
 
-class StateFileHandler(FileSystemEventHandler):
-    """Handler para eventos de cambio en el archivo de estado"""
+class JobsLogsEventHandler(FileSystemEventHandler):
+    """
+    Handler único registrado en todos los watches. Deduce el job por la ruta
+    (Storage/Jobs/<job_id>/logs/<archivo>) y delega en el JobLogsHandler de ese job.
+    """
     
-    def __init__(self, job_id: str, connection_manager: ConnectionManagerService, loop):
-        self.job_id = job_id
+    def __init__(self, connection_manager: ConnectionManagerService, loop):
         self.connection_manager = connection_manager
-        self.state_filename = "state.json"
         self.loop = loop
     
     def on_modified(self, event):
-        """Se ejecuta cuando el archivo de estado es modificado"""
-        if event.is_directory:
-            return
-        
-        if event.src_path.endswith(self.state_filename):
-            asyncio.run_coroutine_threadsafe(
-                    self._process_state_change(event.src_path),
-                    self.loop
-                    )
+        """Se ejecuta cuando un archivo de logs/ es modificado"""
+        if not event.is_directory:
+            self._dispatch(event.src_path)
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self._dispatch(event.src_path)
+
+    def on_moved(self, event):
+        """StateService escribe con archivo temporal + rename: el evento llega como movimiento"""
+        if not event.is_directory:
+            self._dispatch(event.dest_path)
+
+    def _dispatch(self, path: str):
+        file_path = Path(path)
+        job_id = file_path.parent.parent.name
+        if file_path.name == STATE_FILENAME:
+            asyncio.run_coroutine_threadsafe(self._run(job_id, "process_state_change"), self.loop)
+        elif file_path.name == METRICS_FILENAME:
+            asyncio.run_coroutine_threadsafe(self._run(job_id, "process_metrics_change"), self.loop)
+
+    async def _run(self, job_id: str, method: str):
+        # El handler se busca en el loop: si el job ya no tiene suscriptores se descarta el evento
+        handler = self.connection_manager.job_handlers.get(job_id)
+        if handler is not None:
+            await getattr(handler, method)()
+
+
+class JobLogsHandler:
+    """Procesa los cambios de state.json y training_metrics.jsonl de un job"""
     
-    async def _process_state_change(self, file_path: str):
+    def __init__(self, job_id: str, connection_manager: ConnectionManagerService):
+        self.job_id = job_id
+        self.connection_manager = connection_manager
+    
+    async def process_state_change(self):
         """Procesa el cambio en el archivo de estado"""
         try:
-            # Pequeña espera para asegurar que el archivo se escribió completamente
-            await asyncio.sleep(0.1)
-            
-            state_service = self.connection_manager._get_state_service(self.job_id)
-            current_state = state_service.get_state()
+            # La escritura es atómica: no hace falta esperar. Si la versión no cambió
+            # (evento duplicado), no se reenvía nada.
+            state = self.connection_manager.job_index.get_state(self.job_id)
+            version = state.get("version")
+            if version is not None and version == self.connection_manager.state_versions.get(self.job_id):
+                return
+            self.connection_manager.state_versions[self.job_id] = version
+            current_state = state["state"]
             
             # Crear mensaje de estado
             status_message = {
@@ -285,52 +441,27 @@ class StateFileHandler(FileSystemEventHandler):
         except Exception as e:
             logger.error(f"Error procesando cambio de estado: {e}")
 
-
-class MetricsFileHandler(FileSystemEventHandler):
-    """Handler para eventos de cambio en el archivo de metrics"""
-    
-    def __init__(self, job_id: str, connection_manager: ConnectionManagerService, loop):
-        self.job_id = job_id
-        self.connection_manager = connection_manager
-        self.metrics_filename = "training_metrics.jsonl"
-        self.loop = loop
-    
-    def on_modified(self, event):
-        """Se ejecuta cuando el archivo es modificado"""
-        if event.is_directory:
-            return
-        
-        if event.src_path.endswith(self.metrics_filename):
-            asyncio.run_coroutine_threadsafe(
-                    self._process_file_change(event.src_path),
-                    self.loop
-                    )
-    
-    async def _process_file_change(self, file_path: str):
-        """Procesa el cambio en el archivo y envía el último metric"""
+    async def process_metrics_change(self):
+        """Procesa el cambio en el archivo de métricas y envía cada metric nuevo, en orden"""
         try:
             # Verificar que el job aún esté en estado válido para métricas
-            state_service = self.connection_manager._get_state_service(self.job_id)
-            current_state = state_service.get_state()
+            current_state = self.connection_manager.get_job_state(self.job_id)
             
             if current_state not in ["WAIT", "RUNNING"]:
                 logger.info(f"Job {self.job_id} no longer in active state ({current_state}), skipping metrics update")
                 return
             
-            # Pequeña espera para asegurar que el archivo se escribió completamente
-            await asyncio.sleep(0.1)
-            
-            async with aiofiles.open(file_path, 'r') as f:
-                lines = await f.readlines()
-                if lines:
-                    last_line = lines[-1].strip()
-                    if last_line:
-                        metric = json.loads(last_line)
-                        # Agregar información de tipo para distinguir de mensajes de estado
-                        metric["type"] = "metric"
-                        await self.connection_manager.broadcast_to_job(
-                            self.job_id, 
-                            metric
-                        )
+            tailer = self.connection_manager.metric_tailers.get(self.job_id)
+            if tailer is None:
+                return
+
+            # Solo se leen los bytes agregados desde el último evento
+            for metric in await tailer.read_new_records():
+                # Agregar información de tipo para distinguir de mensajes de estado
+                metric["type"] = "metric"
+                await self.connection_manager.broadcast_to_job(
+                    self.job_id, 
+                    metric
+                )
         except Exception as e:
             logger.error(f"Error procesando cambio de archivo: {e}")
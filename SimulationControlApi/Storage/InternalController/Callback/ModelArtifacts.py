@@ -0,0 +1,40 @@
+import os
+import json
+import hashlib
+from datetime import datetime
+from pathlib import Path
+
+# Sufijo del archivo con el hash y los timesteps de cada modelo guardado
+METADATA_SUFFIX = ".meta.json"
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def save_model_with_metadata(model, model_path, timesteps: int):
+    """
+    Guarda el modelo de forma atómica junto a un archivo <modelo>.meta.json con su sha256,
+    tamaño y timesteps. El hash se calcula una sola vez, al guardar, para que la API pueda
+    servir el modelo con un ETag fuerte sin volver a leerlo.
+    """
+    model_path = Path(model_path)
+    tmp_path = model_path.with_name(f"{model_path.stem}.{os.getpid()}.tmp.zip")
+    model.save(str(tmp_path))
+
+    digest = hashlib.sha256()
+    with open(tmp_path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+
+    metadata = {
+        "sha256": digest.hexdigest(),
+        "size": os.path.getsize(tmp_path),
+        "timesteps": int(timesteps),
+        "saved_at": datetime.now().isoformat()
+    }
+    metadata_path = model_path.with_name(model_path.name + METADATA_SUFFIX)
+    metadata_tmp_path = metadata_path.with_name(f"{metadata_path.name}.{os.getpid()}.tmp")
+    with open(metadata_tmp_path, "w", encoding="utf-8") as f:
+        json.dump(metadata, f)
+
+    os.replace(tmp_path, model_path)
+    os.replace(metadata_tmp_path, metadata_path)
+    return metadata
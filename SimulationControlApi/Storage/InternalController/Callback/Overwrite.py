@@ -1,12 +1,14 @@
 from stable_baselines3.common.callbacks import CheckpointCallback, EvalCallback, BaseCallback
 import os
 from pathlib import Path
+from ModelArtifacts import save_model_with_metadata
 
 
 class OverwriteCheckpointCallback(CheckpointCallback):
     """
     CheckpointCallback personalizado que siempre guarda con el mismo nombre,
-    sobrescribiendo el archivo anterior.
+    sobrescribiendo el archivo anterior. La escritura es atómica (un cliente descargando
+    nunca ve un ZIP a medio escribir) y deja el hash y los timesteps en <checkpoint>.meta.json.
     """
     
     def __init__(self, save_freq, save_path, name_prefix="model_checkpoint"):
@@ -23,9 +25,9 @@ class OverwriteCheckpointCallback(CheckpointCallback):
         Sobrescribe el método para usar nombre fijo
         """
         if self.n_calls % self.save_freq == 0:
-            model_path = os.path.join(self.save_path, self.fixed_filename)
+            model_path = os.path.join(self.save_path, f"{self.fixed_filename}.zip")
             
-            self.model.save(model_path)
+            save_model_with_metadata(self.model, model_path, self.num_timesteps)
         
         
         return True
\ No newline at end of file
@@ -2,17 +2,20 @@ import os
 import sys
 import subprocess
 import json
+import time
 import traceback
 import importlib
 from pathlib import Path
 from typing import Dict, Any, Optional
 
 
+import torch
 from stable_baselines3.common.env_checker import check_env
 from stable_baselines3 import PPO, DQN, A2C, SAC, TD3, DDPG
 from stable_baselines3.common.monitor import Monitor
 from stable_baselines3.common.logger import configure
 from stable_baselines3.common.callbacks import CheckpointCallback, EvalCallback
+from stable_baselines3.common.vec_env import VecEnv
 
 current_dir = Path(__file__).parent
 monitor_path = str(current_dir / "Monitor")
@@ -33,15 +36,25 @@ from MetricsCapture import MetricsCapture
 from StreamInterceptor import StreamInterceptor
 from state_service import StateService
 from TimeoutWrapper import TimeoutWrapper
+from LocalFirstVecEnv import LocalFirstVecEnv
 from Overwrite import OverwriteCheckpointCallback
+from ModelArtifacts import save_model_with_metadata
 
 
 #PATHS
-WORKSPACE = Path("/workspace")
+# En los contenedores del pool el job no está en /workspace sino en /jobs/<job_id>
+WORKSPACE = Path(os.environ.get("WORKSPACE_DIR", "/workspace"))
 CONFIG_PATH = os.environ.get("CONFIG_PATH", WORKSPACE / "config" / "train_config.json")
 LOG_DIR = WORKSPACE / "logs"
 STATE_DIR = LOG_DIR / "state.json"
+# Marcas "fase=timestamp" que deja el script de arranque del contenedor
+TIMINGS_FILE = Path(os.environ.get("TIMINGS_FILE", LOG_DIR / "bootstrap_timings"))
 MODEL_DIR = WORKSPACE / "trained_model"
+# .wbt que ejecuta el Webots principal; las instancias extra usan su variante <mundo>_extern.wbt
+WORLD_FILE = os.environ.get("WORLD_FILE")
+EXTERN_WORLD_SUFFIX = "_extern"
+# Puerto del primer Webots extra (el principal usa el 1234 por defecto)
+EXTRA_WEBOTS_BASE_PORT = int(os.environ.get("EXTRA_WEBOTS_BASE_PORT", 1235))
 current_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.dirname(current_dir)
 
@@ -52,6 +65,23 @@ if str(WORKSPACE) not in sys.path:
 if parent_dir not in sys.path:
     sys.path.append(parent_dir)
 
+def make_env(env_class, rank: int, limit_step, controller_url: Optional[str] = None):
+    """
+    Fábrica de un entorno envuelto con TimeoutWrapper y Monitor. Con controller_url el entorno
+    se conecta como controlador externo a esa instancia de Webots (WEBOTS_CONTROLLER_URL); sin
+    ella usa la conexión del controlador que lanzó el Webots principal.
+    """
+    def _init():
+        if controller_url:
+            os.environ["WEBOTS_CONTROLLER_URL"] = controller_url
+        env = env_class()
+        # Envolver con TimeoutWrapper para manejar tiempo del step.
+        env = TimeoutWrapper(env, timeout_seconds=limit_step)
+        # Envolver con Monitor para logging adicional
+        monitor_file = LOG_DIR / ("monitor" if rank == 0 else f"monitor_{rank}")
+        return Monitor(env, str(monitor_file))
+    return _init
+
 class TrainingController:
     def __init__(self, limit_step):
         self.__logger = TrainingLogger(LOG_DIR)
@@ -62,6 +92,8 @@ class TrainingController:
         self.__sb3_logger = None
         self.__original_stdout = None
         self.__limit_step = limit_step
+        self.__n_envs = 1
+        self.__webots_processes = []
         
 
     def setup_metrics_capture(self):
@@ -121,6 +153,23 @@ class TrainingController:
             self.__state.set_state(2, str(msg))
             raise
     
+    def configure_threads(self):
+        """
+        Limita los hilos de torch a los núcleos asignados al contenedor (TORCH_NUM_THREADS, que
+        la API fija según el perfil de recursos del job). Sin esto torch abre un hilo por núcleo
+        del host y los jobs en paralelo se pisan entre sí.
+        """
+        threads = os.environ.get("TORCH_NUM_THREADS")
+        if not threads:
+            return
+        try:
+            torch.set_num_threads(int(threads))
+            torch.set_num_interop_threads(1)
+        except (ValueError, RuntimeError) as e:
+            # set_num_interop_threads solo se puede llamar antes del primer uso del paralelismo
+            self.__logger.error(f"No se pudo limitar los hilos de torch: {e}")
+        self.__logger.info(f"Hilos de torch: {torch.get_num_threads()}")
+
     def create_environment(self):
         """Crea e instancia el entorno del usuario"""
         try:
@@ -140,15 +189,13 @@ class TrainingController:
                 raise AttributeError(f"La clase '{class_name}' no existe en el módulo '{module_name}'")
             
             EnvClass = getattr(module, class_name)
-            
-            # Instanciar el entorno
-            env = EnvClass()
-            
-            # Envolver con TimeoutWrapper para manejar tiempo del step.
-            env = TimeoutWrapper(env, timeout_seconds=self.__limit_step )
 
-            # Envolver con Monitor para logging adicional
-            env = Monitor(env, str(LOG_DIR / "monitor"))
+            self.__n_envs = max(int(self.__config.get("n_envs", 1)), 1)
+            if self.__n_envs == 1:
+                # Instanciar el entorno en este proceso
+                env = make_env(EnvClass, 0, self.__limit_step)()
+            else:
+                env = self.create_vectorized_environment(EnvClass)
             
             self.__logger.info("Entorno creado exitosamente")
             return env
@@ -159,10 +206,59 @@ class TrainingController:
             self.__state.set_state(2, str(msg))
             raise
     
+    def create_vectorized_environment(self, env_class):
+        """
+        Crea n_envs entornos, cada uno contra su propia instancia de Webots, para juntar rollouts
+        en paralelo. El primero corre en este proceso, que es el controlador que lanzó el Webots
+        principal; para los demás se lanzan instancias extra con la variante _extern del mundo y
+        cada uno corre en un subproceso conectado como controlador externo a la suya.
+        """
+        ports = self.launch_extra_webots(self.__n_envs - 1)
+        remote_factories = [make_env(env_class, rank, self.__limit_step, f"ipc://{port}")
+                            for rank, port in enumerate(ports, start=1)]
+
+        # fork: los subprocesos heredan sys.path (módulo del usuario); se crean antes que el
+        # entorno local, así que ninguno hereda la conexión con el Webots principal
+        env = LocalFirstVecEnv(make_env(env_class, 0, self.__limit_step), remote_factories, start_method="fork")
+        self.__logger.info(f"Entorno vectorizado con {self.__n_envs} instancias de Webots")
+        return env
+
+    def launch_extra_webots(self, count: int):
+        """
+        Lanza `count` instancias extra de Webots con el mundo <mundo>_extern.wbt, una por puerto.
+
+        Returns:
+            list: Puertos de las instancias lanzadas
+        """
+        if not WORLD_FILE:
+            raise RuntimeError("n_envs > 1 requiere la variable WORLD_FILE con el mundo en ejecución")
+        world = Path(WORLD_FILE)
+        extern_world = world.with_name(f"{world.stem}{EXTERN_WORLD_SUFFIX}{world.suffix}")
+        if not extern_world.exists():
+            raise FileNotFoundError(f"No se encontró la variante del mundo para entornos extra: {extern_world}")
+
+        ports = []
+        for index in range(count):
+            port = EXTRA_WEBOTS_BASE_PORT + index
+            log_file = open(LOG_DIR / f"webots_{index + 1}.log", "ab")
+            self.__webots_processes.append(subprocess.Popen(
+                ["webots", "--no-rendering", "--batch", "--mode=fast", "--stdout", "--stderr",
+                 f"--port={port}", str(extern_world)],
+                stdout=log_file, stderr=subprocess.STDOUT, start_new_session=True
+            ))
+            log_file.close()
+            ports.append(port)
+        self.__logger.info(f"Instancias extra de Webots lanzadas en los puertos {ports}")
+        return ports
+
     def validate_environment(self):
         """Valida que el entorno sea compatible con Stable-Baselines3"""
         try:
             env = self.__env
+            if isinstance(env, VecEnv):
+                # check_env no acepta entornos vectorizados; SB3 valida los espacios al crear el modelo
+                self.__logger.info("Validación omitida para el entorno vectorizado")
+                return
             check_env(env, warn=True)
             self.__logger.info("Entorno validado exitosamente")
         except Exception as e:
@@ -217,8 +313,9 @@ class TrainingController:
         callbacks = []
         if(self.__config != None):     
             # Checkpoint callback para guardar modelo periódicamente
+            # save_freq se cuenta en llamadas a step del entorno vectorizado (n_envs pasos cada una)
             checkpoint_callback = OverwriteCheckpointCallback(
-                save_freq=max(1000, int(self.__config["timesteps"]) // 10),
+                save_freq=max(max(1000, int(self.__config["timesteps"]) // 10) // self.__n_envs, 1),
                 save_path=str(MODEL_DIR / "checkpoints"),
                 name_prefix="model_checkpoint"
             )
@@ -254,7 +351,7 @@ class TrainingController:
         """Guarda el modelo entrenado"""
         try:
             model_path = MODEL_DIR / "model.zip"
-            self.__model.save(str(model_path))
+            save_model_with_metadata(self.__model, model_path, self.__model.num_timesteps)
             self.__logger.info(f"Modelo guardado en: {model_path}")
             
             # Guardar también configuración usada
@@ -267,17 +364,80 @@ class TrainingController:
             self.__logger.error(f"Error al guardar modelo: {e}")
             raise
     
+    def record_bootstrap_timings(self, marks):
+        """
+        Combina las marcas del script de arranque (TIMINGS_FILE) con las del controlador y
+        guarda la duración de cada fase en el estado. Si falla, el entrenamiento sigue igual.
+        """
+        try:
+            phases = []
+            if TIMINGS_FILE.exists():
+                for line in TIMINGS_FILE.read_text().splitlines():
+                    name, _, value = line.partition("=")
+                    if value:
+                        phases.append((name.strip(), float(value)))
+            phases.extend(marks)
+
+            durations = {
+                name: round(timestamp - previous, 3)
+                for (_, previous), (name, timestamp) in zip(phases, phases[1:])
+            }
+            total = round(phases[-1][1] - phases[0][1], 3)
+            self.__state.record_timings("bootstrap", {"phases": durations, "total_s": total})
+            self.__logger.info(f"Tiempos de arranque: {durations} (total {total}s)")
+
+        except Exception as e:
+            self.__logger.error(f"No se pudieron registrar los tiempos de arranque: {e}")
+
+    def record_step_stats(self):
+        """
+        Junta las estadísticas de steps de los TimeoutWrapper (uno por entorno) y las guarda en
+        el log y en el estado, junto a los tiempos de arranque. Si falla, la limpieza sigue igual.
+        """
+        try:
+            if isinstance(self.__env, VecEnv):
+                per_env = self.__env.get_attr("step_stats")
+            else:
+                per_env = [self.__env.step_stats]
+
+            steps = sum(env_stats["steps"] for env_stats in per_env)
+            stats = {
+                "steps": steps,
+                "timeouts": sum(env_stats["timeouts"] for env_stats in per_env),
+                "mean_ms": round(sum(env_stats["mean_ms"] * env_stats["steps"] for env_stats in per_env) / steps, 3)
+                           if steps else 0.0,
+                "max_ms": max(env_stats["max_ms"] for env_stats in per_env),
+            }
+            if len(per_env) > 1:
+                stats["envs"] = per_env
+            self.__state.record_timings("steps", stats)
+            self.__logger.info(f"Steps: {stats['steps']}, promedio {stats['mean_ms']} ms, "
+                               f"máximo {stats['max_ms']} ms, timeouts {stats['timeouts']}")
+
+        except Exception as e:
+            self.__logger.error(f"No se pudieron registrar las estadísticas de steps: {e}")
+
     def cleanup(self):
         """Limpieza de recursos"""        
+        if self.__env:
+            # Antes de matar Webots: con entornos vectorizados se leen también desde los subprocesos
+            self.record_step_stats()
         subprocess.run(["pkill", "-f", "webots"], check=False)
         try:
             if self.__env:
-                self.__env.close()
+                env, self.__env = self.__env, None
+                env.close()
                 self.__logger.info("Entorno cerrado")
         except Exception as e:
             self.__logger.error(f"Error al cerrar entorno: {e}")
         
         finally:
+            # Instancias extra de Webots (n_envs > 1) que pkill no haya alcanzado
+            for process in self.__webots_processes:
+                if process.poll() is None:
+                    process.kill()
+                process.wait()
+            self.__webots_processes = []
             self.__logger.close()
     
     def run(self):
@@ -285,16 +445,23 @@ class TrainingController:
         try:
             
             self.__state.set_state(1)  # Estado RUNNING
+            marks = [("controller", time.time())]
 
             self.setup_metrics_capture()
 
             self.__config = self.load_config()
+
+            self.configure_threads()
         
             self.__env = self.create_environment()
+            marks.append(("environment", time.time()))
             
             self.validate_environment()
             
             self.__model = self.create_model()
+            marks.append(("model", time.time()))
+
+            self.record_bootstrap_timings(marks)
             
             self.train_model()
             
@@ -0,0 +1,90 @@
+import numpy as np
+from stable_baselines3.common.vec_env import VecEnv, DummyVecEnv, SubprocVecEnv
+
+
+class LocalFirstVecEnv(VecEnv):
+    """
+    Entorno vectorizado cuyo primer entorno corre en este proceso y el resto en subprocesos.
+
+    El controlador que lanzó Webots es el único proceso conectado al Webots principal, así que
+    el entorno 0 se construye acá (DummyVecEnv) y los demás, que se conectan como controladores
+    externos a sus propias instancias, en un SubprocVecEnv. Los subprocesos se crean antes de
+    construir el entorno local para que ninguno herede la conexión del controlador.
+    """
+
+    def __init__(self, local_factory, remote_factories, start_method: str = "fork"):
+        self.remote = SubprocVecEnv(remote_factories, start_method=start_method)
+        self.local = DummyVecEnv([local_factory])
+        self.__envs = (self.local, self.remote)
+        super().__init__(1 + self.remote.num_envs, self.local.observation_space, self.local.action_space)
+
+    def _split(self, indices):
+        """Reparte índices globales en (índices locales, índices remotos)"""
+        if indices is None:
+            indices = range(self.num_envs)
+        elif isinstance(indices, int):
+            indices = [indices]
+        local = [i for i in indices if i == 0]
+        remote = [i - 1 for i in indices if i > 0]
+        return local, remote
+
+    def _concat(self, local_obs, remote_obs):
+        if isinstance(local_obs, dict):
+            return {key: np.concatenate([local_obs[key], remote_obs[key]]) for key in local_obs}
+        if isinstance(local_obs, tuple):
+            return tuple(np.concatenate(pair) for pair in zip(local_obs, remote_obs))
+        return np.concatenate([local_obs, remote_obs])
+
+    def _collect(self, method: str, indices, *args, **kwargs):
+        local, remote = self._split(indices)
+        results = []
+        for env, env_indices in zip(self.__envs, (local, remote)):
+            if env_indices:
+                results.extend(getattr(env, method)(*args, indices=env_indices, **kwargs) or [])
+        return results
+
+    def reset(self):
+        for env, seeds, options in ((self.local, self._seeds[:1], self._options[:1]),
+                                    (self.remote, self._seeds[1:], self._options[1:])):
+            env._seeds = list(seeds)
+            env._options = list(options)
+        remote_obs = self.remote.reset()
+        local_obs = self.local.reset()
+        self.reset_infos = self.local.reset_infos + self.remote.reset_infos
+        self._reset_seeds()
+        self._reset_options()
+        return self._concat(local_obs, remote_obs)
+
+    def step_async(self, actions: np.ndarray):
+        self.remote.step_async(actions[1:])
+        self.local.step_async(actions[:1])
+
+    def step_wait(self):
+        # El paso local corre mientras los subprocesos avanzan sus propios pasos
+        local_obs, local_rews, local_dones, local_infos = self.local.step_wait()
+        remote_obs, remote_rews, remote_dones, remote_infos = self.remote.step_wait()
+        return (
+            self._concat(local_obs, remote_obs),
+            np.concatenate([local_rews, remote_rews]),
+            np.concatenate([local_dones, remote_dones]),
+            list(local_infos) + list(remote_infos),
+        )
+
+    def close(self):
+        for env in (self.remote, self.local):
+            env.close()
+
+    def get_attr(self, attr_name, indices=None):
+        return self._collect("get_attr", indices, attr_name)
+
+    def set_attr(self, attr_name, value, indices=None):
+        self._collect("set_attr", indices, attr_name, value)
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        return self._collect("env_method", indices, method_name, *method_args, **method_kwargs)
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return self._collect("env_is_wrapped", indices, wrapper_class)
+
+    def get_images(self):
+        return self.local.get_images() + self.remote.get_images()
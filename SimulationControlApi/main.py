@@ -4,9 +4,9 @@ from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.interval import IntervalTrigger
-from routers.routers_api import router as api_router
-from routers.websocket_routers import router as websocket_router
-from Services.job_cleaner_service import JobCleanerService
+from routers.routers_api import router as api_router, service as simulation_service, cleaner
+from routers.websocket_routers import router as websocket_router, connection_manager
+from Services.core.config import Config
 import logging
 import atexit
 
@@ -28,6 +28,15 @@ async def lifespan(app: FastAPI):
         if job_cleaner:
             logger.info("🧹 Ejecutando limpieza inicial...")
             job_cleaner.process_all_jobs()
+
+        # Lanzar jobs que quedaron en cola antes del reinicio
+        simulation_service.dispatch_pending_jobs()
+
+        # Pre-iniciar contenedores Webots para los próximos jobs
+        simulation_service.start_warm_pool()
+
+        # Detectar al instante la salida de los contenedores (docker events)
+        simulation_service.start_container_events()
             
         logger.info("✅ Inicialización completada")
         
@@ -39,6 +48,8 @@ async def lifespan(app: FastAPI):
     # Código de limpieza
     logger.info("API apagándose: cerrando recursos...")
     shutdown_scheduler()
+    simulation_service.shutdown()
+    connection_manager.shutdown()
 
 
 def create_app() -> FastAPI:
@@ -80,13 +91,13 @@ def setup_scheduler():
             }
         )
         
-        # Crear instancia del limpiador
-        job_cleaner = JobCleanerService()
+        # El limpiador lo crea el router, que expone sus métricas
+        job_cleaner = cleaner
         
         # Configurar jobs programados
         scheduler.add_job(
             func=job_cleaner.process_all_jobs,
-            trigger=IntervalTrigger(minutes=30),
+            trigger=IntervalTrigger(minutes=Config().get_cleaner_config()["interval_minutes"]),
             id='job_cleaner_main',
             name='Job Cleaner - Main Process',
             replace_existing=True
@@ -101,6 +112,15 @@ def setup_scheduler():
             replace_existing=True
         )
         
+        # Job para lanzar jobs en cola cuando se liberan slots de simulación
+        scheduler.add_job(
+            func=simulation_service.dispatch_pending_jobs,
+            trigger=IntervalTrigger(seconds=Config().get_scheduler_config()["dispatch_interval_seconds"]),
+            id='job_dispatcher',
+            name='Job Dispatcher - Admission Queue',
+            replace_existing=True
+        )
+        
         # Job para estadísticas/monitoreo (opcional)
         scheduler.add_job(
             func=job_cleaner.log_stats,
@@ -0,0 +1,94 @@
+import os
+import re
+from typing import Dict, Optional, Tuple
+import aiofiles
+from fastapi import Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+
+# Bloque leído al servir un rango de un archivo
+RANGE_CHUNK_SIZE = 64 * 1024
+
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+def cached_file_response(request: Request, path: str, filename: str, media_type: str,
+                         etag: str, headers: Optional[Dict[str, str]] = None) -> Response:
+    """
+    Sirve un archivo de descarga con ETag, respondiendo 304 si el cliente ya tiene la misma
+    versión (If-None-Match) y 206 para pedidos de un rango de bytes (Range / If-Range), de modo
+    que las descargas repetidas o interrumpidas no vuelvan a transferir el archivo completo.
+    Un HEAD pasa por la misma validación: 304 o los encabezados del 200, sin cuerpo.
+    """
+    quoted_etag = f'"{etag}"'
+    extra_headers = {"ETag": quoted_etag, **(headers or {})}
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        if "*" in tags or quoted_etag in tags or f"W/{quoted_etag}" in tags:
+            return Response(status_code=304, headers=extra_headers)
+
+    response_headers = {
+        **extra_headers,
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f"attachment; filename={filename}",
+    }
+    size = os.path.getsize(path)
+
+    if request.method == "HEAD":
+        return Response(status_code=200, media_type=media_type,
+                        headers={**response_headers, "Content-Length": str(size)})
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header is not None and (if_range is None or if_range.strip() == quoted_etag):
+        byte_range = _parse_range(range_header, size)
+        if byte_range is None:
+            return Response(status_code=416, headers={**extra_headers, "Content-Range": f"bytes */{size}"})
+        if byte_range != (0, size - 1):
+            start, end = byte_range
+            response_headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+            response_headers["Content-Length"] = str(end - start + 1)
+            return StreamingResponse(
+                _iter_file(path, start, end),
+                status_code=206,
+                media_type=media_type,
+                headers=response_headers
+            )
+
+    return FileResponse(path=path, media_type=media_type, headers=response_headers)
+
+
+def _parse_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Interpreta un único rango "bytes=inicio-fin" (también "inicio-" y "-sufijo").
+    Devuelve (0, size - 1) para rangos múltiples o mal formados, que se sirven completos,
+    y None si el rango no se puede satisfacer.
+    """
+    match = RANGE_PATTERN.match(range_header.strip())
+    if match is None:
+        return 0, size - 1
+    first, last = match.groups()
+    if first == "" and last == "":
+        return 0, size - 1
+    if first == "":
+        suffix = int(last)
+        if suffix == 0:
+            return None
+        return max(size - suffix, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return None
+    return start, end
+
+
+async def _iter_file(path: str, start: int, end: int):
+    async with aiofiles.open(path, 'rb') as f:
+        await f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await f.read(min(RANGE_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
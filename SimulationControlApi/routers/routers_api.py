@@ -1,14 +1,19 @@
 # app/routers/api.py
-from fastapi import APIRouter, UploadFile, File, Form, BackgroundTasks, HTTPException
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi import APIRouter, UploadFile, File, Form, BackgroundTasks, HTTPException, Query, Request
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from pathlib import Path
+from typing import Optional
 from uuid import uuid4
 import json, shutil, os
 #from Services.core.config import JOBS_ROOT
 from Services.simulation_service import SimulationService   # start_job, cancel_job, get_status, etc.
+from Services.job_cleaner_service import JobCleanerService
+from routers.file_responses import cached_file_response
 
 router = APIRouter()
 service = SimulationService()
+cleaner = JobCleanerService()
 
 # --- Endpoints ---
 @router.post("/jobs", status_code=202)
@@ -17,36 +22,53 @@ async def create_job(
     hparams: str = Form(...),
 ):
     """
-    Recibe world.zip (multipart) y hparams (JSON string). Responde job_id y arranca job en background.
+    Recibe world.zip (multipart) y hparams (JSON string). Responde job_id apenas se guarda la subida;
+    la preparación corre en background y el contenedor se lanza cuando el scheduler tenga un slot libre.
     """
-    job_path,job = service.set_job_directory()
+    try:
+        config = json.loads(hparams)
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Los hiperparametros deben ser un JSON válido")
+    if not isinstance(config, dict):
+        raise HTTPException(status_code=400, detail="Los hiperparametros deben ser un objeto JSON")
+    # Se valida antes de registrar el job para no dejar jobs en WAIT que nunca se encolan
+    try:
+        priority = config.get("priority", 0)
+        if isinstance(priority, bool) or (isinstance(priority, float) and not priority.is_integer()):
+            raise ValueError
+        priority = int(priority)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="La prioridad debe ser un número entero")
+
+    try:
+        job_path,job = await run_in_threadpool(service.set_job_directory)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"No se pudo crear el job: {e}")
     world_path =os.path.join(job_path, "world")
     world_zip_path=os.path.join(world_path,f"world_{job}.zip")
     config_path=os.path.join(job_path, "config","train_config.json")
 
+    # Si algo falla antes de encolarlo, el job no queda a medias en Storage ni en el índice
     try:
-        with open(world_zip_path,"wb") as f:
-            shutil.copyfileobj(world_zip.file, f)
-        
+        sha256, size = await service.save_world_archive(world_zip, world_zip_path)
     except Exception as e:
+        await run_in_threadpool(service.discard_job, job)
         raise HTTPException(status_code=500, detail=f"Error al guardar el archivo world.zip: {str(e)}")
     
     try:
-        config = json.loads(hparams)
-    except json.JSONDecodeError:
-        raise HTTPException(status_code=400, detail="Los hiperparametros deben ser un JSON válido")
-    
-    try:
-        with open(config_path,"w",encoding='utf-8') as f:
-            json.dump(config, f, indent=4)
+        await service.save_config(config, config_path)
     except Exception as e:
+        await run_in_threadpool(service.discard_job, job)
         raise HTTPException(status_code=500, detail=f"Error al guardar el archivo de configuración: {str(e)}")
     
-    service.start_job(job, world_zip_path)
     try:
-        return {"job_id": job, "status": "Entrenamiento iniciado", "message": "La simulacion se está ejecutando en segundo plano."}
+        await run_in_threadpool(service.register_job, job, sha256, size)
     except Exception as e:
+        await run_in_threadpool(service.discard_job, job)
         raise HTTPException(status_code=500, detail=f"Falló el inicio del job: {e}")
+
+    service.submit_job(job, world_zip_path, priority, sha256)
+    return {"job_id": job, "status": "Entrenamiento iniciado", "message": "La simulacion se está preparando y se lanzará cuando haya un slot libre.", "sha256": sha256}
     
 
 @router.delete("/jobs/{job_id}", status_code=204)
@@ -63,6 +85,43 @@ async def delete_job(job_id: str):
         raise HTTPException(status_code=500, detail=f"Error cancelando job: {e}")
     
 
+@router.get("/jobs", status_code=200)
+async def list_jobs(
+    state: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    updated_before: Optional[str] = None,
+    container: Optional[str] = None,
+):
+    """
+    Lista paginada de jobs servida desde el índice de jobs (filtros por estado, antigüedad y contenedor).
+    """
+    try:
+        return await run_in_threadpool(service.list_jobs, state, limit, offset, updated_before, container)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error listando jobs: {e}")
+
+
+@router.get("/queue", status_code=200)
+async def get_queue():
+    """
+    Devuelve la cola de jobs en espera (WAIT) y la ocupación de slots de simulación.
+    """
+    try:
+        return await run_in_threadpool(service.get_queue)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error obteniendo la cola de jobs: {e}")
+
+
+@router.get("/cleaner/stats", status_code=200)
+async def get_cleaner_stats():
+    """
+    Métricas del JobCleaner: duración, jobs revisados y borrados de la última pasada, y totales
+    acumulados desde que arrancó la API.
+    """
+    return cleaner.get_pass_stats()
+
+
 @router.get("/state/{job_id}", status_code=202)
 async def get_job_state(job_id: str):
     try:
@@ -73,33 +132,76 @@ async def get_job_state(job_id: str):
 
 
 @router.get("/jobs/{job_id}/metrics", status_code=200)
-async def get_metrics(job_id: str):
+async def get_metrics(
+    request: Request,
+    job_id: str,
+    timestep_from: Optional[int] = Query(None, ge=0),
+    timestep_to: Optional[int] = Query(None, ge=0),
+    episode_from: Optional[int] = Query(None, ge=0),
+    episode_to: Optional[int] = Query(None, ge=0),
+    cursor: Optional[int] = Query(None, ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=10000),
+    fields: Optional[str] = Query(None, description="Campos separados por coma, p. ej. ep_rew_mean"),
+    downsample: Optional[str] = Query(None, pattern="^(lttb|minmax)$"),
+    points: int = Query(500, ge=3, le=10000),
+):
     """
     Devuelve el historial de métricas en formato JSON.
+
+    Sin parámetros devuelve la lista completa (formato original). Con cualquier filtro devuelve
+    {"items", "next_cursor", "total"}: rangos por timestep/episodio, páginas de `limit` registros
+    a partir de `cursor` (seq), solo los `fields` pedidos y, con `downsample`, la serie reducida a
+    `points` puntos. Todo se lee desde el índice de offsets, sin recorrer el archivo.
+
+    Con `Accept: application/x-ndjson` (y sin downsample) los registros se transmiten de a
+    uno por línea a medida que se leen del archivo, aplicando los mismos filtros.
     """
+    filters = [timestep_from, timestep_to, episode_from, episode_to, cursor, limit, fields, downsample]
+    field_list = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+    ndjson = "application/x-ndjson" in request.headers.get("accept", "")
     try:
-        return service.get_logs(job_id)
+        # La lista completa y el modo NDJSON se transmiten por bloques, sin armar la lista en memoria
+        if (ndjson and downsample is None) or all(value is None for value in filters):
+            start, end = await run_in_threadpool(
+                service.resolve_metrics_range, job_id,
+                timestep_from=timestep_from, timestep_to=timestep_to,
+                episode_from=episode_from, episode_to=episode_to
+            )
+            # end ya está acotado a los registros indexados; el cursor puede pasarse del final
+            start = min(max(start, cursor or 0), end)
+            if limit is not None:
+                end = min(start + limit, end)
+            return StreamingResponse(
+                service.stream_metrics(job_id, start, end, field_list, json_array=not ndjson),
+                media_type="application/x-ndjson" if ndjson else "application/json"
+            )
+        return await run_in_threadpool(
+            service.query_metrics, job_id,
+            timestep_from=timestep_from, timestep_to=timestep_to,
+            episode_from=episode_from, episode_to=episode_to,
+            cursor=cursor or 0, limit=limit or 1000,
+            fields=field_list, downsample=downsample, points=points
+        )
+    except FileNotFoundError as e:
+        if all(value is None for value in filters) and not ndjson:
+            # Respuesta original cuando el job todavía no escribió métricas
+            return {"message": "No logs found."}
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/jobs/{job_id}/download/tensorboard", status_code=200)
-async def download_tensorboard(job_id: str):
+async def download_tensorboard(request: Request, job_id: str):
     try:
-        zip_path = service.get_tensorboard_path(job_id)
+        # El ZIP se arma en un hilo aparte (y solo si cambiaron los archivos de eventos)
+        zip_path, etag = await run_in_threadpool(service.get_tensorboard_path, job_id)
         
         # Extrae el nombre del archivo ZIP de la ruta para el navegador
         zip_filename = os.path.basename(zip_path) 
         
-        # Devuelve el archivo ZIP
-        response = FileResponse(
-            path=zip_path,
-            filename=zip_filename,
-            media_type='application/zip'
-        )
-        response.headers["Content-Disposition"] = f"attachment; filename={zip_filename}"
-
-        return response
+        # Devuelve el archivo ZIP (304 si el cliente ya lo tiene, 206 para rangos)
+        return cached_file_response(request, zip_path, zip_filename, 'application/zip', etag)
         
     except FileNotFoundError as e:
         # Se lanza si el directorio de logs no se encuentra
@@ -109,23 +211,69 @@ async def download_tensorboard(job_id: str):
         raise HTTPException(status_code=500, detail=f"Error descargando los logs de TensorBoard: {e}")
 
 
+@router.get("/jobs/{job_id}/download/bundle", status_code=200)
+async def download_bundle(job_id: str):
+    """
+    Descarga un ZIP con los artefactos del job (eventos de TensorBoard, train.log, CSVs del
+    Monitor y modelo). El ZIP se genera mientras se transmite: no ocupa disco y la descarga
+    empieza enseguida aunque los logs pesen varios GB.
+    """
+    try:
+        files = await run_in_threadpool(service.get_bundle_files, job_id)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error preparando el paquete del job: {e}")
+
+    if not files:
+        raise HTTPException(status_code=404, detail=f"El job {job_id} todavía no tiene artefactos")
+
+    return StreamingResponse(
+        service.iter_bundle(files),
+        media_type='application/zip',
+        headers={"Content-Disposition": f"attachment; filename=bundle_{job_id}.zip"}
+    )
+
+
 @router.get("/jobs/{job_id}/download/model", status_code=200)
-async def download_model(job_id: str):
+async def download_model(request: Request, job_id: str):
+    """
+    Descarga el archivo model.zip con el modelo entrenado (o el último checkpoint si el job
+    sigue corriendo). Usa como ETag el sha256 calculado al guardar el modelo: responde 304 si
+    el cliente ya tiene esa versión y admite Range para retomar descargas interrumpidas.
+    """
+    return await _model_response(request, job_id)
+
+
+@router.head("/jobs/{job_id}/download/model", status_code=200)
+async def head_model(request: Request, job_id: str):
     """
-    Descarga el archivo model.zip con el modelo entrenado.
+    Igual que la descarga pero sin cuerpo: devuelve tamaño, ETag y, en X-Checkpoint-Timesteps,
+    los timesteps del modelo, para que los clientes sepan si hay un checkpoint nuevo.
     """
+    return await _model_response(request, job_id)
+
+
+async def _model_response(request: Request, job_id: str):
     try:
-        model_path, message = service.get_model_path(job_id)
+        model_path, message = await run_in_threadpool(service.get_model_path, job_id)
         if(model_path ==None):
             raise HTTPException(status_code=404, detail=message)
+
+        metadata = await run_in_threadpool(service.get_model_metadata, model_path)
+        if(message=="checkpoint"):
+            filename = "model_checkpoint_latest.zip"
         else:
-            if(message=="checkpoint"):
-                response=FileResponse(model_path, filename=f"model_checkpoint_latest.zip", media_type='application/zip')    
-            else:
-                response=FileResponse(model_path, filename=f"model_{job_id}.zip", media_type='application/zip')
-                
-            response.headers["X-Download-Message"] = message
-            return response
+            filename = f"model_{job_id}.zip"
+
+        headers = {"X-Download-Message": message}
+        if metadata["timesteps"] is not None:
+            headers["X-Checkpoint-Timesteps"] = str(metadata["timesteps"])
+
+        # GET y HEAD comparten la validación de ETag (HEAD responde sin cuerpo)
+        return cached_file_response(request, model_path, filename, 'application/zip', metadata["etag"], headers)
+    except HTTPException:
+        raise
     except FileNotFoundError:
         raise HTTPException(status_code=404, detail="Modelo no encontrado")
     except Exception as e:
@@ -1,7 +1,8 @@
 import json
 import logging
 from pathlib import Path
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from typing import Optional
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query
 from Services.ws_conection_service import ConnectionManagerService
 
 # Configurar logging
@@ -14,16 +15,30 @@ router = APIRouter()
 connection_manager = ConnectionManagerService()
 
 @router.websocket("/jobs/{job_id}/metrics/stream")
-async def stream_training_metrics(websocket: WebSocket, job_id: str):
+async def stream_training_metrics(
+    websocket: WebSocket,
+    job_id: str,
+    max_rate: Optional[float] = Query(None, gt=0, le=60),
+    batch_size: Optional[int] = Query(None, ge=1, le=1000),
+    delta: bool = Query(False),
+    since: Optional[int] = Query(None, ge=-1)
+):
     """
     WebSocket endpoint para streaming de métricas de entrenamiento en tiempo real
     
     Args:
         websocket: Conexión WebSocket
         job_id: ID del job del cual obtener las métricas
+        max_rate: Máximo de frames por segundo. Activa el envío en lotes
+        batch_size: Máximo de métricas por frame. Activa el envío en lotes
+        delta: Cada métrica del lote lleva solo los campos que cambiaron respecto de la anterior
+        since: Último seq recibido por el cliente. Se reenvían los registros posteriores desde
+               el índice en disco y luego se sigue en vivo (-1 reenvía todo el historial)
     
     Returns:
-        Stream continuo de métricas en formato JSON
+        Stream continuo de métricas en formato JSON, cada una con su "seq". Sin
+        max_rate/batch_size/delta se envía un frame por métrica; con ellos, frames
+        {"type": "metrics", "data": [...]}
     """
     
     # Verificar que el job existe
@@ -32,7 +47,7 @@ async def stream_training_metrics(websocket: WebSocket, job_id: str):
         await websocket.close(code=4004, reason="Job not found")
         return
     
-    await connection_manager.connect(websocket, job_id)
+    await connection_manager.connect(websocket, job_id, max_rate=max_rate, batch_size=batch_size, delta=delta, since=since)
     
     try:
         while True:
@@ -0,0 +1,7 @@
+import sys
+from pathlib import Path
+
+# Los módulos de la API se importan como "Services.*", relativos a SimulationControlApi/
+API_ROOT = Path(__file__).resolve().parent.parent
+if str(API_ROOT) not in sys.path:
+    sys.path.insert(0, str(API_ROOT))
@@ -0,0 +1,48 @@
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from routers.file_responses import cached_file_response
+
+
+def make_client(path):
+    app = FastAPI()
+
+    @app.api_route("/file", methods=["GET", "HEAD"])
+    async def serve(request: Request):
+        return cached_file_response(request, str(path), "model.zip", "application/zip", "abc")
+
+    return TestClient(app)
+
+
+def test_head_honours_if_none_match(tmp_path):
+    path = tmp_path / "model.zip"
+    path.write_bytes(b"x" * 100)
+    client = make_client(path)
+
+    response = client.head("/file", headers={"If-None-Match": '"abc"'})
+    assert response.status_code == 304
+    assert response.headers["etag"] == '"abc"'
+
+
+def test_head_returns_get_headers_without_body(tmp_path):
+    path = tmp_path / "model.zip"
+    path.write_bytes(b"x" * 100)
+    client = make_client(path)
+
+    head = client.head("/file")
+    get = client.get("/file")
+    assert head.status_code == 200
+    assert head.content == b""
+    assert head.headers["content-length"] == "100"
+    for name in ("etag", "accept-ranges", "content-type", "content-disposition"):
+        assert head.headers[name] == get.headers[name]
+
+
+def test_range_request_returns_partial_content(tmp_path):
+    path = tmp_path / "model.zip"
+    path.write_bytes(bytes(range(100)))
+    client = make_client(path)
+
+    response = client.get("/file", headers={"Range": "bytes=10-19"})
+    assert response.status_code == 206
+    assert response.content == bytes(range(10, 20))
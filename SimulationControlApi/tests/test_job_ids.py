@@ -0,0 +1,30 @@
+import threading
+
+from Services.core import job_ids
+from Services.core.job_ids import JobIdAllocator
+
+
+def allocate_concurrently(count):
+    allocator = JobIdAllocator()
+    ids = []
+    threads = [threading.Thread(target=lambda: ids.append(allocator.allocate())) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return ids
+
+
+def test_allocate_returns_unique_ids(tmp_path, monkeypatch):
+    monkeypatch.setenv("STORAGE_PATH", str(tmp_path / "Jobs"))
+    monkeypatch.setenv("JOB_COUNTER_PATH", str(tmp_path / "job_counter"))
+    assert sorted(allocate_concurrently(20)) == list(range(1, 21))
+
+
+def test_allocate_without_fcntl(tmp_path, monkeypatch):
+    # Windows no tiene fcntl: el contador sigue funcionando dentro del proceso
+    monkeypatch.setattr(job_ids, "fcntl", None)
+    monkeypatch.setenv("STORAGE_PATH", str(tmp_path / "Jobs"))
+    monkeypatch.setenv("JOB_COUNTER_PATH", str(tmp_path / "job_counter"))
+    (tmp_path / "Jobs" / "job_7").mkdir(parents=True)
+    assert sorted(allocate_concurrently(5)) == [8, 9, 10, 11, 12]
@@ -0,0 +1,84 @@
+import json
+import asyncio
+import threading
+from types import SimpleNamespace
+
+from Services.metrics_service import MetricsIndex
+from Services.simulation_service import SimulationService
+
+
+def write_metrics(path, count):
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(count):
+            f.write(json.dumps({"total_timesteps": i * 10, "episodes": i}) + "\n")
+
+
+def collect(generator):
+    async def run():
+        return "".join([chunk async for chunk in generator])
+    return asyncio.run(run())
+
+
+def test_byte_range_past_last_record_is_empty(tmp_path):
+    metrics = tmp_path / "training_metrics.jsonl"
+    write_metrics(metrics, 3)
+    index = MetricsIndex.for_path(metrics)
+    assert index.update() == 3
+
+    size = metrics.stat().st_size
+    assert index.byte_range(10, 20) == (size, size)
+    assert index.byte_range(2, 20) == (index.byte_range(0, 2)[1], size)
+    assert index.read_records(10, 20) == []
+
+
+def test_stream_with_cursor_past_end_yields_empty_body(tmp_path):
+    metrics = tmp_path / "training_metrics.jsonl"
+    write_metrics(metrics, 3)
+    MetricsIndex.for_path(metrics).update()
+    fake_service = SimpleNamespace(get_metrics_path=lambda job_id: str(metrics))
+
+    body = collect(SimulationService.stream_metrics(fake_service, "job_1", 10, 10, json_array=True))
+    assert body == "[]"
+    body = collect(SimulationService.stream_metrics(fake_service, "job_1", 10, 10))
+    assert body == ""
+    body = collect(SimulationService.stream_metrics(fake_service, "job_1", 1, 50))
+    assert [json.loads(line)["seq"] for line in body.splitlines()] == [1, 2]
+
+
+def test_instances_are_bounded_and_dropped(tmp_path, monkeypatch):
+    monkeypatch.setattr("Services.metrics_service.MAX_CACHED_INDEXES", 2)
+    paths = [tmp_path / f"job_{i}" / "training_metrics.jsonl" for i in range(3)]
+    first = MetricsIndex.for_path(paths[0])
+    MetricsIndex.for_path(paths[1])
+    assert MetricsIndex.for_path(paths[0]) is first
+    MetricsIndex.for_path(paths[2])
+    # job_1 era el menos usado: se descartó y job_0 sigue compartido
+    assert MetricsIndex.for_path(paths[0]) is first
+
+    MetricsIndex.drop(paths[0])
+    assert MetricsIndex.for_path(paths[0]) is not first
+
+
+def test_reads_during_rebuild_do_not_fail(tmp_path):
+    metrics = tmp_path / "training_metrics.jsonl"
+    index = MetricsIndex.for_path(metrics)
+    errors = []
+    stop = threading.Event()
+
+    def read():
+        while not stop.is_set():
+            try:
+                index.byte_range(0, 1000)
+                index.read_records(0)
+            except (IndexError, ValueError) as e:
+                errors.append(e)
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    # Cada vuelta reemplaza el archivo por uno de otro largo: el índice se reconstruye
+    for i in range(200):
+        write_metrics(metrics, 50 if i % 2 else 5)
+        index.update()
+    stop.set()
+    reader.join()
+    assert errors == []
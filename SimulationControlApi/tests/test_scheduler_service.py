@@ -0,0 +1,54 @@
+from Services.job_index_service import JobIndexService, QUEUE_QUEUED
+from Services.scheduler_service import SchedulerService
+
+
+def make_scheduler(tmp_path, monkeypatch, profiles, running):
+    monkeypatch.setenv("JOB_INDEX_PATH", str(tmp_path / "jobs.db"))
+    monkeypatch.setenv("MAX_CONCURRENT_JOBS", "0")
+    monkeypatch.setattr(SchedulerService, "_compute_capacity", lambda self: {"cpus": 8, "memory_gb": 32})
+    launched = []
+
+    def launcher(job_id, wbt_path):
+        launched.append(job_id)
+        running.append(f"webots_job_{job_id}")
+
+    index = JobIndexService()
+    scheduler = SchedulerService(launcher, lambda: list(running), job_index=index, profile=lambda job_id: profiles[job_id])
+    return scheduler, index, launched
+
+
+def test_admission_uses_each_job_profile(tmp_path, monkeypatch):
+    profiles = {"big": {"cpus": 6, "memory_gb": 8}, "small": {"cpus": 2, "memory_gb": 4},
+                "next": {"cpus": 2, "memory_gb": 4}}
+    scheduler, index, launched = make_scheduler(tmp_path, monkeypatch, profiles, [])
+    for priority, job_id in enumerate(["next", "small", "big"]):
+        index.queue_add(job_id, None, priority, QUEUE_QUEUED, f"/w/{job_id}.wbt")
+
+    scheduler.dispatch()
+    # 6 + 2 núcleos llenan el host: "next" espera aunque por cantidad de jobs entraría
+    assert launched == ["big", "small"]
+    assert [entry["job_id"] for entry in scheduler.get_queue()["queued"]] == ["next"]
+    scheduler.shutdown()
+
+
+def test_oversized_job_runs_alone_on_an_idle_host(tmp_path, monkeypatch):
+    profiles = {"huge": {"cpus": 8, "memory_gb": 64}, "small": {"cpus": 1, "memory_gb": 1}}
+    scheduler, index, launched = make_scheduler(tmp_path, monkeypatch, profiles, [])
+    index.queue_add("huge", None, 1, QUEUE_QUEUED, "/w/huge.wbt")
+    index.queue_add("small", None, 0, QUEUE_QUEUED, "/w/small.wbt")
+
+    scheduler.dispatch()
+    assert launched == ["huge"]
+    scheduler.shutdown()
+
+
+def test_only_one_process_holds_the_events_lease(tmp_path, monkeypatch):
+    first, index, _ = make_scheduler(tmp_path, monkeypatch, {}, [])
+    second = SchedulerService(lambda job_id, wbt_path: None, lambda: [], job_index=JobIndexService())
+
+    assert first.holds_events_lease()
+    assert not second.holds_events_lease()
+    # Al apagarse el dueño, el lease queda libre para el otro proceso
+    first.shutdown()
+    assert second.holds_events_lease()
+    second.shutdown()
@@ -0,0 +1,44 @@
+import json
+import os
+
+from Services.world_cache_service import WorldCacheService
+
+
+def make_entry(root, key):
+    world = root / key / "world" / "proj"
+    (world / "worlds").mkdir(parents=True)
+    (world / "protos").mkdir()
+    (world / "controllers" / "foo").mkdir(parents=True)
+    (world / "worlds" / "w.wbt").write_text("#VRML_SIM R2023b utf8\n")
+    (world / "protos" / "Robot.proto").write_text("PROTO Robot [] { }")
+    (world / "controllers" / "foo" / "foo.py").write_text("print('foo')")
+    WorldCacheService._make_read_only(root / key / "world")
+    (root / key / "manifest.json").write_text(json.dumps({"wbt": "proj/worlds/w.wbt", "bytes": 10}))
+
+
+def make_cache(tmp_path, monkeypatch):
+    monkeypatch.setenv("WORLD_CACHE_PATH", str(tmp_path / "cache"))
+    cache = WorldCacheService()
+    make_entry(tmp_path / "cache", "k")
+    return cache
+
+
+def test_hit_links_static_files_and_copies_edited_ones(tmp_path, monkeypatch):
+    cache = make_cache(tmp_path, monkeypatch)
+    job_world = tmp_path / "job" / "world"
+
+    wbt = cache.materialize("k", job_world)
+    assert wbt == job_world / "proj" / "worlds" / "w.wbt"
+    assert os.stat(job_world / "proj" / "protos" / "Robot.proto").st_nlink == 2
+    for edited in (wbt, job_world / "proj" / "controllers" / "foo" / "foo.py"):
+        assert os.stat(edited).st_nlink == 1
+        assert os.access(edited, os.W_OK)
+
+
+def test_hit_with_writable_cache_file_is_discarded(tmp_path, monkeypatch):
+    cache = make_cache(tmp_path, monkeypatch)
+    proto = tmp_path / "cache" / "k" / "world" / "proj" / "protos" / "Robot.proto"
+    os.chmod(proto, 0o644)
+
+    assert cache.materialize("k", tmp_path / "job" / "world") is None
+    assert not (tmp_path / "cache" / "k").exists()